@@ -0,0 +1,108 @@
+from __future__ import annotations
+import os
+import json
+import time
+import hashlib
+import threading
+
+from db import connection
+
+# =========================
+# AIアドバイスの応答キャッシュ（ディスク保存・LRU）
+# =========================
+# キーはプロンプトの入力（スケジュール・天気・モデル・温度）を正規化した JSON の SHA-256。
+# 同じ入力なら別のユーザ・別のセッションからでも API を呼ばずに返す。
+
+DB_FILE = "advice_cache.db"
+MAX_ENTRIES = int(os.getenv("ADVICE_CACHE_MAX_ENTRIES", "1000"))
+TTL_SECONDS = float(os.getenv("ADVICE_CACHE_TTL", str(6 * 3600)))
+
+_stats_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "evictions": 0}
+_ready = False
+
+
+def _init():
+    global _ready
+    if _ready:
+        return
+    with connection(DB_FILE) as conn, conn:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS advice_cache (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        ''')
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_advice_cache_last_access ON advice_cache(last_access)")
+    _ready = True
+
+
+def _count(name: str, n: int = 1) -> None:
+    with _stats_lock:
+        _stats[name] += n
+
+
+def make_key(**inputs) -> str:
+    """入力を正規化（キー順固定・空白なし）した JSON のハッシュを返す"""
+    canonical = json.dumps(inputs, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def get(key: str, ttl: float | None = None) -> str | None:
+    """キャッシュ済みの応答を返す（無い・期限切れなら None）"""
+    ttl = TTL_SECONDS if ttl is None else ttl
+    _init()
+    with connection(DB_FILE) as conn:
+        row = conn.execute("SELECT response, created_at FROM advice_cache WHERE key = ?", (key,)).fetchone()
+        now = time.time()
+        if row is None or now - row[1] >= ttl:
+            if row is not None:
+                with conn:
+                    conn.execute("DELETE FROM advice_cache WHERE key = ?", (key,))
+                _count("evictions")
+            _count("misses")
+            return None
+        with conn:
+            conn.execute("UPDATE advice_cache SET last_access = ? WHERE key = ?", (now, key))
+    _count("hits")
+    return row[0]
+
+
+def put(key: str, response: str, max_entries: int | None = None, ttl: float | None = None) -> None:
+    """応答を保存し、期限切れと上限超過分（最終参照が古い順）を削除する"""
+    max_entries = MAX_ENTRIES if max_entries is None else max_entries
+    ttl = TTL_SECONDS if ttl is None else ttl
+    _init()
+    now = time.time()
+    with connection(DB_FILE) as conn, conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO advice_cache (key, response, created_at, last_access) VALUES (?, ?, ?, ?)",
+            (key, response, now, now)
+        )
+        evicted = conn.execute("DELETE FROM advice_cache WHERE created_at <= ?", (now - ttl,)).rowcount
+        evicted += conn.execute('''
+            DELETE FROM advice_cache WHERE key IN (
+                SELECT key FROM advice_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?
+            )
+        ''', (max_entries,)).rowcount
+    if evicted:
+        _count("evictions", evicted)
+
+
+def clear() -> None:
+    """キャッシュを全件削除する"""
+    _init()
+    with connection(DB_FILE) as conn, conn:
+        conn.execute("DELETE FROM advice_cache")
+
+
+def stats() -> dict:
+    """ヒット数・ミス数・削除数と現在の件数を返す"""
+    _init()
+    with _stats_lock:
+        result = dict(_stats)
+    with connection(DB_FILE) as conn:
+        result["entries"] = conn.execute("SELECT COUNT(*) FROM advice_cache").fetchone()[0]
+    return result
@@ -0,0 +1,210 @@
+from __future__ import annotations
+import os
+import sys
+import time
+import sqlite3
+import argparse
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import date, timedelta
+
+from db import connection
+import migrations
+
+# =========================
+# 翌日分の AIアドバイスの事前作成（夜間のバッチ）
+# =========================
+#   python advice_job.py                  # 明日・明後日の予定が対象（OPENAI_API_KEY が必要）
+#   python advice_job.py --workers 8
+# cron の例: 0 19 * * * cd /path/to/app && python advice_job.py
+# - user_info のユーザーを地域（region_id = 天気APIの都市コード）ごとにまとめ、予報は地域ごとに1回だけ取得する
+# - 雨と重なる屋外の予定があるユーザーだけ、上限付きのスレッドプールでアドバイスを作る
+# - 結果はユーザー × 対象日ごとに advice テーブルへ1件ずつ保存する。
+#   同じ対象日で再実行すると、予定・予報が前回と同じ（入力キーが一致する）作成済みのユーザーは飛ばし、
+#   失敗したユーザーと予定が変わったユーザーだけ作り直す
+# - 天気予報は明日・明後日の分しか無いため、対象日は明日だけ指定できる
+# tenki.py の AIアドバイス タブは、保存済みのアドバイスの入力キーが今の予定・予報と一致すればそのまま表示する。
+
+DB_FILE = "advice.db"
+USER_DB_FILE = "user_info.db"
+MAX_WORKERS = int(os.getenv("ADVICE_JOB_WORKERS", "4"))
+
+DONE = "done"
+NO_CONFLICTS = "no_conflicts"
+FAILED = "error"
+
+
+# スキーマのマイグレーション（migrations.py で版管理）
+def _create_advice(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS advice (
+            user_id TEXT NOT NULL,
+            target_date TEXT NOT NULL,
+            city_code TEXT NOT NULL,
+            status TEXT NOT NULL,
+            input_key TEXT,
+            advice TEXT,
+            error TEXT,
+            created_at REAL NOT NULL,
+            PRIMARY KEY (user_id, target_date)
+        )
+    ''')
+
+
+MIGRATIONS = [_create_advice]
+
+
+def init_store():
+    migrations.migrate(DB_FILE, MIGRATIONS)
+
+
+def get_advice(user_id: str, target_date: str) -> dict | None:
+    """作成済みのアドバイス（status が done のもの）を返す"""
+    init_store()
+    with connection(DB_FILE) as conn:
+        row = conn.execute(
+            "SELECT city_code, input_key, advice, created_at FROM advice "
+            "WHERE user_id = ? AND target_date = ? AND status = ?",
+            (user_id, target_date, DONE)
+        ).fetchone()
+    if row is None:
+        return None
+    return {"city_code": row[0], "input_key": row[1], "advice": row[2], "created_at": row[3]}
+
+
+def _save(user_id: str, target_date: str, city_code: str, status: str,
+          input_key: str | None = None, advice: str | None = None, error: str | None = None) -> None:
+    with connection(DB_FILE) as conn, conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO advice "
+            "(user_id, target_date, city_code, status, input_key, advice, error, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (user_id, target_date, city_code, status, input_key, advice, error, time.time())
+        )
+
+
+def _done_keys(target_date: str) -> dict:
+    """対象日で作成済みのユーザー -> 作成時の入力キー"""
+    with connection(DB_FILE) as conn:
+        rows = conn.execute(
+            "SELECT user_id, input_key FROM advice WHERE target_date = ? AND status = ?",
+            (target_date, DONE)
+        ).fetchall()
+    return dict(rows)
+
+
+def users_by_region(db_file: str = USER_DB_FILE) -> dict:
+    """地域（都市コード）-> その地域のユーザー（メールアドレス = 予定の user_id）のリスト
+
+    同じメールアドレスが複数の地域で登録されている場合は、最後に登録した行の地域だけに入れる。
+    """
+    try:
+        with connection(db_file) as conn:
+            rows = conn.execute(
+                "SELECT region_id, email FROM user_info WHERE id IN ("
+                "  SELECT MAX(id) FROM user_info WHERE email <> '' AND region_id <> '' GROUP BY email"
+                ") ORDER BY region_id, email"
+            ).fetchall()
+    except sqlite3.OperationalError:  # user_info の表がまだ無い
+        return {}
+    regions = {}
+    for region_id, email in rows:
+        regions.setdefault(region_id, []).append(email)
+    return regions
+
+
+def run(target_date: date | None = None, api_key: str | None = None, max_workers: int = MAX_WORKERS,
+        regions: dict | None = None) -> dict:
+    """target_date（省略時は明日）と翌日の予定についてアドバイスを作り、件数を返す
+
+    regions は {都市コード: [user_id, ...]}（省略時は users_by_region()）。同じ user_id は最初の地域だけで扱う。
+    target_date と翌日が天気予報の範囲（明日・明後日）に入らなければ ValueError。
+    """
+    # tenki.py はページのモジュールなので、ジョブの実行時にだけ読み込む
+    import tenki
+    import rain_conflicts
+
+    tomorrow = date.today() + timedelta(days=1)
+    target_date = target_date or tomorrow
+    if target_date != tomorrow:
+        raise ValueError(f"対象日は天気予報のある明日（{tomorrow.isoformat()}）だけ指定できます: {target_date.isoformat()}")
+    tenki.init_database()
+    init_store()
+    start, end = target_date.isoformat(), (target_date + timedelta(days=1)).isoformat()
+    regions = users_by_region() if regions is None else regions
+    done_keys = _done_keys(start)
+    counts = {"regions": 0, "skipped": 0, DONE: 0, NO_CONFLICTS: 0, FAILED: 0}
+    seen = set()
+
+    pending = {}
+
+    def collect(block: bool) -> None:
+        """終わったアドバイスを保存する（1件ごとに保存するので、途中で落ちてもそこまでは残る）"""
+        if block:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        else:
+            done = [future for future in pending if future.done()]
+        for future in done:
+            user_id, city_code, input_key = pending.pop(future)
+            try:
+                _save(user_id, start, city_code, DONE, input_key, advice=future.result())
+                counts[DONE] += 1
+            except Exception as e:
+                _save(user_id, start, city_code, FAILED, input_key, error=str(e))
+                counts[FAILED] += 1
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="advice") as pool:
+        for city_code, user_ids in regions.items():
+            todo = [user_id for user_id in dict.fromkeys(user_ids) if user_id not in seen]
+            seen.update(todo)
+            if not todo:
+                continue
+            counts["regions"] += 1
+            weather = tenki.get_weather_forecast(city_code)
+            for user_id in todo:
+                if not weather:
+                    _save(user_id, start, city_code, FAILED, error="天気予報を取得できませんでした")
+                    counts[FAILED] += 1
+                    continue
+                schedules = tenki.get_schedules_between(user_id, start, end)
+                conflicts = rain_conflicts.find_conflicts(schedules, weather)
+                if conflicts.empty:
+                    _save(user_id, start, city_code, NO_CONFLICTS)
+                    counts[NO_CONFLICTS] += 1
+                    continue
+                input_key = tenki.schedule_advice_key(conflicts, weather)
+                if done_keys.get(user_id) == input_key:
+                    counts["skipped"] += 1  # 前回と同じ入力で作成済み
+                    continue
+                # 送信待ちを溜めすぎない（ワーカー数の2倍まで）
+                while len(pending) >= max_workers * 2:
+                    collect(block=True)
+                future = pool.submit(tenki.request_schedule_advice, conflicts, weather, api_key)
+                pending[future] = (user_id, city_code, input_key)
+                collect(block=False)
+        while pending:
+            collect(block=True)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="翌日分の AIアドバイスを事前に作成する")
+    parser.add_argument("--date", type=date.fromisoformat, help="対象日（YYYY-MM-DD、明日だけ指定できる。省略時は明日）")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS, help=f"同時に作成する件数（既定 {MAX_WORKERS}）")
+    args = parser.parse_args()
+
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        sys.exit("OPENAI_API_KEY を設定してください")
+    started = time.perf_counter()
+    try:
+        counts = run(args.date, api_key, args.workers)
+    except ValueError as e:
+        parser.error(str(e))
+    print(
+        f"地域 {counts['regions']} / 作成 {counts[DONE]} / 該当なし {counts[NO_CONFLICTS]} / "
+        f"失敗 {counts[FAILED]} / 作成済みで省略 {counts['skipped']}（{time.perf_counter() - started:.1f} 秒）"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,15 @@
 from __future__ import annotations
 import streamlit as st
 import sqlite3
+import json
+import numpy as np
+import pandas as pd
 import plotly.graph_objects as go
 from datetime import datetime, timedelta
 
+import profiler
+import task_store
+
 # ===== 色分け関数 =====
 def pressure_color(score_ratio: float) -> str:
     if score_ratio >= 0.85:
@@ -55,18 +61,17 @@ def get_daily_score(conn, user_id):
     sleep_dt = datetime.strptime(sleep, "%H:%M:%S")
     disposable_hours = (sleep_dt - wake_dt).seconds / 3600
 
-    # タスク（progress_time を差し引いた残り時間で計算）
+    # タスク（締切日ごとに集計済みの残り時間で計算）
     today = datetime.now().date()
     cur.execute("""
-        SELECT deadline, estimated_time, progress_time 
-        FROM tasks
-        WHERE user_id=? AND completed=0
+        SELECT deadline, remaining_minutes
+        FROM task_pressure_buckets
+        WHERE user_id=?
     """, (user_id,))
-    tasks = cur.fetchall()
+    buckets = cur.fetchall()
 
     weighted_time = 0
-    for d, est, prog in tasks:
-        remaining = max(0, (est or 0) - (prog or 0))
+    for d, remaining in buckets:
         if datetime.strptime(d, "%Y-%m-%d").date() == today:
             weighted_time += remaining
         elif datetime.strptime(d, "%Y-%m-%d").date() > today:
@@ -94,17 +99,16 @@ def get_weekly_score(conn, user_id):
     daily_hours = (sleep_dt - wake_dt).seconds / 3600
     weekly_disposable = daily_hours * (days_left + 1)
 
-    # タスク（progress_time を差し引いた残り時間で計算）
+    # タスク（締切日ごとに集計済みの残り時間で計算）
     cur.execute("""
-        SELECT deadline, estimated_time, progress_time 
-        FROM tasks
-        WHERE user_id=? AND completed=0
+        SELECT deadline, remaining_minutes
+        FROM task_pressure_buckets
+        WHERE user_id=?
     """, (user_id,))
-    tasks = cur.fetchall()
+    buckets = cur.fetchall()
 
     weighted_time = 0
-    for d, est, prog in tasks:
-        remaining = max(0, (est or 0) - (prog or 0))
+    for d, remaining in buckets:
         dl = datetime.strptime(d, "%Y-%m-%d").date()
         if dl <= end_date:
             weighted_time += remaining
@@ -114,13 +118,69 @@ def get_weekly_score(conn, user_id):
     score = weighted_time / (weekly_disposable * 60) if weekly_disposable > 0 else 0.0
     return score
 
+# ===== 複数ユーザの日次・週次スコア一括計算 =====
+def get_scores_batch(conn, user_ids=None, today=None) -> pd.DataFrame:
+    """ユーザ設定と締切日別の集計をそれぞれ1クエリで読み込み、全ユーザ分のスコアをまとめて計算する
 
+    user_ids 省略時は user_settings に登録された全ユーザが対象。
+    戻り値は user_id, daily_score, weekly_score 列の DataFrame（get_daily_score / get_weekly_score と同じ値）。
+    """
+    today = today or datetime.now().date()
+    if user_ids is None:
+        user_filter, params = "", ()
+    else:
+        user_filter = "user_id IN (SELECT value FROM json_each(?))"
+        params = (json.dumps([int(u) for u in user_ids]),)
 
-
+    settings = pd.read_sql_query(
+        "SELECT user_id, weekday_wake_time, weekday_sleep_time FROM user_settings"
+        + (f" WHERE {user_filter}" if user_filter else ""),
+        conn, params=params
+    )
+    buckets = pd.read_sql_query(
+        "SELECT user_id, deadline, remaining_minutes FROM task_pressure_buckets"
+        + (f" WHERE {user_filter}" if user_filter else ""),
+        conn, params=params
+    )
+    return compute_scores(settings, buckets, today, user_ids)
+
+def compute_scores(settings: pd.DataFrame, buckets: pd.DataFrame, today, user_ids=None) -> pd.DataFrame:
+    """設定（起床・就寝時間）と締切日別の残り時間の DataFrame からスコアを計算する"""
+    settings = settings.drop_duplicates("user_id", keep="first").set_index("user_id")
+    # timedelta.seconds と同様、就寝が起床より前なら日をまたぐとみなす
+    span = pd.to_timedelta(settings["weekday_sleep_time"]) - pd.to_timedelta(settings["weekday_wake_time"])
+    daily_hours = (span.dt.total_seconds() % 86400) / 3600
+
+    today_ts = pd.Timestamp(today)
+    days_left = 6 - today_ts.weekday()
+    end_ts = today_ts + pd.Timedelta(days=days_left)
+
+    deadline = pd.to_datetime(buckets["deadline"], format="%Y-%m-%d")
+    remaining = buckets["remaining_minutes"]
+    # 日次: 今日締切は全量、以降は半分、期限切れは対象外 / 週次: 週末まで全量、以降は半分
+    daily_weight = np.where(deadline == today_ts, 1.0, np.where(deadline > today_ts, 0.5, 0.0))
+    weekly_weight = np.where(deadline <= end_ts, 1.0, 0.5)
+    weighted = pd.DataFrame({
+        "daily": remaining * daily_weight,
+        "weekly": remaining * weekly_weight,
+    }).groupby(buckets["user_id"]).sum()
+
+    index = settings.index if user_ids is None else pd.Index([int(u) for u in user_ids], name="user_id")
+    hours = daily_hours.reindex(index).fillna(0.0)
+    weighted = weighted.reindex(index).fillna(0.0)
+    daily_minutes = hours * 60
+    weekly_minutes = hours * (days_left + 1) * 60
+
+    result = pd.DataFrame({
+        "daily_score": np.where(daily_minutes > 0, weighted["daily"] / daily_minutes.where(daily_minutes > 0, 1), 0.0),
+        "weekly_score": np.where(weekly_minutes > 0, weighted["weekly"] / weekly_minutes.where(weekly_minutes > 0, 1), 0.0),
+    }, index=index)
+    return result.reset_index()
 
 # ===== テスト実行用UI =====
 def main():
-    conn = sqlite3.connect("time_household.db")
+    task_store.init_store()
+    conn = sqlite3.connect(task_store.DB_FILE)
     user_id = 1  # 仮固定
 
     st.header("圧力スコアテスト")
@@ -166,4 +226,9 @@ def main():
     conn.close()
 
 if __name__ == "__main__":
-    main()
+    profiler.start_rerun("atsuryoku2")
+    # st.rerun() は例外で再実行するため、finally で必ずトレースを閉じる
+    try:
+        main()
+    finally:
+        profiler.finish_rerun()
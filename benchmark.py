@@ -0,0 +1,477 @@
+from __future__ import annotations
+import argparse
+import datetime as dt
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+# =========================
+# ベンチマーク
+# =========================
+# 使い方:
+#   python benchmark.py suite --sizes 1000,100000 --output bench.json
+#   python benchmark.py suite --sizes 1000000 --compare bench.json
+#   python benchmark.py pressure --users 10000 --tasks 50
+#
+# suite は4つのDB（schedule.db / diary.db / user_info.db / time_household.db）に
+# 合成データを作り、主要な処理の所要時間を JSON で出力する。
+# 天気API と OpenAI はローカルのスタブサーバ（stub_servers.py）に向ける。
+
+SIZES = (1_000, 100_000, 1_000_000)
+TASKS_PER_USER = 50
+SCHEDULES_PER_USER = 1000
+
+
+# ===== 合成データ生成 =====
+def schedule_user(i: int) -> str:
+    return f"user{i:07d}@example.com"
+
+
+def generate_schedules(path: str, n: int, rnd: random.Random, n_users: int = 1) -> int:
+    """schedule.db に n 件の予定を作る（n_users 人に分散、今日の前後180日に分散）"""
+    today = datetime.now().date()
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.executemany(
+            "INSERT INTO schedules (user_id, date, time, event_name, location, outdoor, importance, changeable) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                (
+                    schedule_user(rnd.randrange(n_users)),
+                    (today + timedelta(days=rnd.randint(-180, 180))).isoformat(),
+                    f"{rnd.randint(6, 21):02d}:{rnd.choice(['00', '15', '30', '45'])}",
+                    f"予定{i}",
+                    rnd.choice(["公園", "会社", "駅前", "ジム", "カフェ"]),
+                    rnd.randint(0, 1),
+                    rnd.randint(1, 5),
+                    rnd.randint(0, 1),
+                )
+                for i in range(n)
+            )
+        )
+    conn.close()
+    return n
+
+
+def generate_diary(path: str, n: int, rnd: random.Random) -> int:
+    """diary.db に今日から遡って1日1件の日記を作る
+
+    日付は一意なので、西暦1000年以降に収まる件数までに制限する。
+    """
+    today = datetime.now().date()
+    n = min(n, (today - dt.date(1000, 1, 1)).days + 1)
+    words = ["雨で散歩できなかった", "友達とカフェでランチ", "仕事が忙しかった", "映画館で新作を観た", "公園でピクニック"]
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.executemany(
+            "INSERT INTO diary (date, iso_date, content) VALUES (?, ?, ?)",
+            (
+                (d.strftime("%Y年%m月%d日"), d.isoformat(), f"{rnd.choice(words)}（{i}）")
+                for i, d in ((i, today - timedelta(days=i)) for i in range(n))
+            )
+        )
+    conn.close()
+    return n
+
+
+def generate_users(path: str, n: int, rnd: random.Random, regions) -> int:
+    """user_info.db に n 人のユーザを作る"""
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.executemany(
+            "INSERT INTO user_info (name, email, region_id, region_name, work_hours, commute_hours, sleep_hours) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                (f"user{i:07d}", f"user{i:07d}@example.com", r["id"], r["title"],
+                 rnd.choice([6.0, 7.5, 8.0, 9.0]), rnd.choice([0.5, 1.0, 1.5]), rnd.choice([6.0, 7.0, 8.0]))
+                for i, r in ((i, rnd.choice(regions)) for i in range(n))
+            )
+        )
+    conn.close()
+    return n
+
+
+def create_pressure_db(n_users: int, tasks_per_user: int, seed: int = 0, path: str = ":memory:") -> sqlite3.Connection:
+    """圧力スコア用の合成データ（user_settings / tasks）を作る（path 省略時はメモリ上）"""
+    import migrations
+    import task_store
+
+    rnd = random.Random(seed)
+    conn = sqlite3.connect(path)
+    # 集計トリガー以外のマイグレーションを先に適用し、データ投入後に残り（集計の作成）を適用する
+    migrations.apply(conn, task_store.MIGRATIONS[:-1])
+    conn.executemany(
+        "INSERT INTO user_settings VALUES (?, ?, ?, '08:00:00', '23:30:00', '09:00:00', '18:00:00')",
+        ((u, f"{rnd.randint(5, 8):02d}:00:00", f"{rnd.randint(21, 23):02d}:30:00") for u in range(1, n_users + 1))
+    )
+    today = datetime.now().date()
+    conn.executemany(
+        "INSERT INTO tasks (user_id, title, category, content, deadline, priority, estimated_time, "
+        "progress_time, progress_sessions, completed, created_at) "
+        "VALUES (?, 'task', 'task', '', ?, 'medium', ?, ?, 0, ?, ?)",
+        (
+            (
+                u,
+                (today + timedelta(days=rnd.randint(-3, 14))).isoformat(),
+                rnd.choice([30, 60, 90, 120]),
+                rnd.choice([0, 0, 15, 30]),
+                int(rnd.random() < 0.2),
+                today.isoformat(),
+            )
+            for u in range(1, n_users + 1)
+            for _ in range(tasks_per_user)
+        )
+    )
+    conn.commit()
+    migrations.apply(conn, task_store.MIGRATIONS)
+    return conn
+
+
+# ===== 計測 =====
+def measure(fn, repeat: int) -> dict:
+    """fn を repeat 回実行し、所要時間（秒）の統計を返す"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return {
+        "repeat": repeat,
+        "min_sec": min(times),
+        "median_sec": statistics.median(times),
+        "mean_sec": statistics.fmean(times),
+    }
+
+
+def run_suite(sizes, repeat: int, workdir: str) -> list:
+    """全ベンチマークを実行し、結果（dict のリスト）を返す"""
+    from stub_servers import StubServer
+
+    # ページのモジュールは読み込み時に作業ディレクトリへ DB を作るため、先に移動しておく
+    os.chdir(workdir)
+    stub = StubServer().start()
+    os.environ["OPENAI_BASE_URL"] = stub.url + "/v1"
+    os.environ["WEATHER_API_BASE"] = stub.url
+
+    import tenki
+    import diary
+    import user_info
+    import atsuryoku2
+    import weather_cache
+    import advice_cache
+    from task_parser import parse_deadline, parse_local
+    import rain_conflicts
+    import pandas as pd
+    from db import connection
+
+    tenki.WEATHER_API_BASE = stub.url
+    results = []
+
+    def record(name: str, rows, fn, n_repeat: int = repeat):
+        result = {"name": name, "rows": rows, **measure(fn, n_repeat)}
+        results.append(result)
+        print(f"  {name:<32} rows={rows!s:<9} median={result['median_sec'] * 1000:10.3f} ms", file=sys.stderr)
+
+    for size in sizes:
+        print(f"[size={size}]", file=sys.stderr)
+        rnd = random.Random(size)
+        size_dir = os.path.join(workdir, str(size))
+        os.makedirs(size_dir, exist_ok=True)
+
+        # schedule.db（1ユーザあたり約 SCHEDULES_PER_USER 件）
+        tenki.DB_FILE = os.path.join(size_dir, "schedule.db")
+        tenki.init_database()
+        n = generate_schedules(tenki.DB_FILE, size, rnd, max(1, size // SCHEDULES_PER_USER))
+        today = datetime.now().date()
+        user = schedule_user(0)
+        day, month_end = today.isoformat(), (today + timedelta(days=30)).isoformat()
+        record("tenki.get_all_schedules", n, lambda: tenki.get_all_schedules(user))
+        record("tenki.get_schedules", n, lambda: tenki.get_schedules(user, day))
+        record("tenki.get_schedules_between", n, lambda: tenki.get_schedules_between(user, day, month_end))
+        problems = tenki.check_schedule_query_plans()
+        if problems:
+            raise RuntimeError("予定の検索が索引を使っていません: " + "; ".join(problems))
+
+        # diary.db
+        diary.DB_FILE = os.path.join(size_dir, "diary.db")
+        diary.init_database()
+        n = generate_diary(diary.DB_FILE, size, rnd)
+        record("diary.get_diary_by_month", n, lambda: diary.get_diary_by_month(today.year, today.month))
+
+        # user_info.db
+        user_info.DB_FILE = os.path.join(size_dir, "user_info.db")
+        user_info.init_database()
+        n = generate_users(user_info.DB_FILE, size, rnd, user_info.REGIONS[1:])
+        record("user_info.get_all_users", n, user_info.get_all_users)
+        last_name = f"user{size - 1:07d}"
+        record("user_info.get_user_by_name", n, lambda: user_info.get_user_by_name(last_name))
+        # 既存ユーザの一括更新（名前の一意索引で衝突→UPDATE）
+        onboarding = [(f"user{i:07d}", f"user{i:07d}@example.com", "130010", "東京", 8.0, 1.0, 7.0)
+                      for i in range(min(size, 1000))]
+        record("user_info.upsert_users", len(onboarding), lambda: user_info.upsert_users(onboarding))
+
+        # time_household.db（1ユーザあたり TASKS_PER_USER 件）
+        n_users = max(1, size // TASKS_PER_USER)
+        conn = create_pressure_db(n_users, TASKS_PER_USER, seed=size, path=os.path.join(size_dir, "time_household.db"))
+        n = n_users * TASKS_PER_USER
+        record("atsuryoku2.get_daily_score", n, lambda: atsuryoku2.get_daily_score(conn, n_users))
+        record("atsuryoku2.get_weekly_score", n, lambda: atsuryoku2.get_weekly_score(conn, n_users))
+        record("atsuryoku2.get_scores_batch", n, lambda: atsuryoku2.get_scores_batch(conn))
+        conn.close()
+
+    # データ量に依存しない処理
+    print("[fixed]", file=sys.stderr)
+    today = datetime.now().date()
+    samples = ["2025-12-24", "12-24", "12月24日", "24日まで", "", "来週"]
+    record("task_parser.parse_deadline", len(samples),
+           lambda: [parse_deadline(s, today) for s in samples], max(repeat, 1000))
+    transcripts = ["明日までにレポートを提出する", "来週金曜までに企画書、1時間半、至急", "６月２０日までにプレゼン資料 ２時間",
+                   "1時間30分で家計簿をつける、来月末まで", "大至急 上司に電話", "明日までにレポート、あと牛乳を買う", ""]
+    record("task_parser.parse_local", len(transcripts),
+           lambda: [parse_local(text, today) for text in transcripts], max(repeat, 1000))
+
+    def weather_cold():
+        weather_cache.clear()
+        tenki.get_weather_forecast("130010")
+
+    record("tenki.get_weather_forecast(cold)", None, weather_cold)
+    record("tenki.get_weather_forecast(warm)", None, lambda: tenki.get_weather_forecast("130010"))
+
+    # 天気API：keep-alive の接続の使い回しと、止まったサーバに対するブレーカーの遮断
+    import weather_client
+    weather_client.reset()
+    with StubServer() as keepalive:
+        calls = 20
+        record("weather_client.fetch_forecast", calls, lambda: [
+            weather_client.fetch_forecast("130010", keepalive.url) for _ in range(calls)
+        ])
+        print(f"    requests={keepalive.requests} connections={keepalive.connections}", file=sys.stderr)
+    # 予報の履歴：60日分・1日4回発表を保存し、30日分の範囲を取得
+    import forecast_history
+    from stub_servers import sample_forecast
+    issues = []
+    for day in range(60):
+        for hour in (5, 11, 17, 23):
+            payload = sample_forecast("130010")
+            issued = datetime.combine(today - timedelta(days=60 - day), datetime.min.time()).replace(hour=hour)
+            payload["publicTime"] = issued.isoformat() + "+09:00"
+            for i, forecast in enumerate(payload["forecasts"]):
+                forecast["date"] = (issued.date() + timedelta(days=i)).isoformat()
+            issues.append(payload)
+    record("forecast_history.record", len(issues) * 12,
+           lambda: [forecast_history.record("130010", payload) for payload in issues], 1)
+    record("forecast_history.record(dup)", len(issues) * 12,
+           lambda: [forecast_history.record("130010", payload) for payload in issues])
+    start, end = (today - timedelta(days=30)).isoformat(), today.isoformat()
+    record("forecast_history.get_history", len(issues) * 12,
+           lambda: forecast_history.get_history("130010", start, end))
+    record("forecast_history.get_history(latest)", len(issues) * 12,
+           lambda: forecast_history.get_history("130010", start, end, latest_only=True))
+
+    read_timeout = weather_client.READ_TIMEOUT
+    weather_client.READ_TIMEOUT = 0.2
+    with StubServer(delay=1.0) as stalled:
+        def weather_stalled():
+            for _ in range(calls):
+                try:
+                    weather_client.fetch_forecast("130010", stalled.url)
+                except weather_client.requests.RequestException:
+                    pass
+        record("weather_client(stalled, breaker)", calls, weather_stalled, 1)
+        breaker = weather_client.stats()[stalled.url]
+        print(f"    sent={stalled.requests} rejected={breaker['rejected']} state={breaker['state']}", file=sys.stderr)
+    weather_client.READ_TIMEOUT = read_timeout
+
+    tenki.DB_FILE = os.path.join(workdir, "advice_schedule.db")
+    tenki.init_database()
+    tomorrow = (today + timedelta(days=1)).isoformat()
+    tenki.add_schedule(tenki.DEFAULT_USER_ID, tomorrow, "10:00", "テニス", "公園", 1, 4, 1)
+    weather = tenki.get_weather_forecast("130010")
+    schedules = rain_conflicts.find_conflicts(tenki.get_schedules(tenki.DEFAULT_USER_ID, tomorrow), weather)
+
+    def advice_cold():
+        advice_cache.clear()
+        tenki.generate_schedule_advice(schedules, weather, "sk-stub")
+
+    # 1000件の予定から雨と重なるものを判定（AIを呼ぶかどうかの判定コスト）
+    many = pd.DataFrame(
+        [(w["date"], f"{h:02d}:00", "予定", "場所", h % 2, h % 5 + 1, 1) for w in weather for h in range(24)] * 21,
+        columns=["date", "time", "event_name", "location", "outdoor", "importance", "changeable"],
+    )
+    record("rain_conflicts.find_conflicts", len(many), lambda: rain_conflicts.find_conflicts(many, weather))
+
+    record("tenki.generate_schedule_advice(cold)", None, advice_cold)
+    record("tenki.generate_schedule_advice(warm)", None,
+           lambda: tenki.generate_schedule_advice(schedules, weather, "sk-stub"))
+
+    # ストリーミング（最初の断片が届くまでの時間）
+    def advice_first_token():
+        advice_cache.clear()
+        stream_result = {}
+        for _ in tenki.stream_schedule_advice(schedules, weather, "sk-stub", stream_result):
+            pass
+        return stream_result["first_token_ms"]
+
+    first_token = [advice_first_token() for _ in range(repeat)]
+    results.append({"name": "tenki.stream_schedule_advice(first_token)", "rows": None, "repeat": repeat,
+                    "min_sec": min(first_token) / 1000, "median_sec": statistics.median(first_token) / 1000,
+                    "mean_sec": statistics.mean(first_token) / 1000})
+    print(f"  {results[-1]['name']:<32} rows={'None':<9} median={statistics.median(first_token):10.3f} ms", file=sys.stderr)
+    record("tenki.stream_schedule_advice(total)", None, advice_first_token)
+
+    # 共通クライアント：3回に1回 503 を返すサーバでも再試行で全件成功するか
+    import openai_client
+    with StubServer(fail_every=3) as flaky:
+        os.environ["OPENAI_BASE_URL"] = flaky.url + "/v1"
+        flaky_client = openai_client.get_client("sk-stub")
+        openai_client.reset_stats()
+        calls = 20
+        record("openai_client.chat(fail_every=3)", calls, lambda: [
+            flaky_client.chat.completions.create(model="stub-flaky", messages=[{"role": "user", "content": "ping"}])
+            for _ in range(calls)
+        ], 1)
+        flaky_stats = openai_client.stats()["stub-flaky"]
+        print(f"    calls={flaky_stats['calls']} retries={flaky_stats['retries']} errors={flaky_stats['errors']}", file=sys.stderr)
+    os.environ["OPENAI_BASE_URL"] = stub.url + "/v1"
+
+    # 夜間バッチ：2地域・200人（3人に1人が雨と重なる予定あり）。2回目は作成済みを飛ばすだけ
+    import advice_job
+    advice_job.DB_FILE = os.path.join(workdir, "advice.db")
+    job_users = [f"job{i:04d}@example.com" for i in range(200)]
+    for i, user in enumerate(job_users[::3]):
+        tenki.add_schedule(user, tomorrow, f"{8 + i % 10:02d}:00", f"テニス{i}", "公園", 1, i % 5 + 1, 1)
+    job_regions = {"130010": job_users[::2], "270000": job_users[1::2]}
+
+    def job_cold():
+        advice_cache.clear()
+        with connection(advice_job.DB_FILE) as conn, conn:
+            conn.execute("DELETE FROM advice")
+        advice_job.run(api_key="sk-stub", regions=job_regions)
+
+    advice_job.init_store()
+    record("advice_job.run(cold)", len(job_users), job_cold, 1)
+    record("advice_job.run(resume)", len(job_users), lambda: advice_job.run(api_key="sk-stub", regions=job_regions))
+
+    stub.stop()
+    return results
+
+
+def environment() -> dict:
+    """結果に添える実行環境の情報"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+    }
+
+
+def compare(results: list, baseline_path: str) -> None:
+    """前回の結果（JSON）と中央値を比較して表示する"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {(r["name"], r["rows"]): r for r in json.load(f)["results"]}
+    print(f"compare with {baseline_path}", file=sys.stderr)
+    for r in results:
+        base = baseline.get((r["name"], r["rows"]))
+        if base:
+            ratio = r["median_sec"] / base["median_sec"] if base["median_sec"] else float("inf")
+            print(f"  {r['name']:<32} rows={r['rows']!s:<9} x{ratio:.2f}", file=sys.stderr)
+
+
+# ===== 圧力スコア: ループ vs 一括 =====
+def bench_pressure(n_users: int, tasks_per_user: int) -> dict:
+    """ユーザごとのループ計算と一括計算（get_scores_batch）の比較"""
+    import atsuryoku2
+
+    conn = create_pressure_db(n_users, tasks_per_user)
+    user_ids = list(range(1, n_users + 1))
+
+    start = time.perf_counter()
+    loop = {u: (atsuryoku2.get_daily_score(conn, u), atsuryoku2.get_weekly_score(conn, u)) for u in user_ids}
+    loop_sec = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch = atsuryoku2.get_scores_batch(conn)
+    batch_sec = time.perf_counter() - start
+
+    # 結果が一致することを確認
+    for row in batch.itertuples(index=False):
+        daily, weekly = loop[row.user_id]
+        assert abs(row.daily_score - daily) < 1e-9 and abs(row.weekly_score - weekly) < 1e-9, row
+
+    conn.close()
+    return {
+        "users": n_users,
+        "tasks_per_user": tasks_per_user,
+        "loop_sec": loop_sec,
+        "batch_sec": batch_sec,
+        "speedup": loop_sec / batch_sec if batch_sec else float("inf"),
+    }
+
+
+def main():
+    # ページのモジュール（tenki.py など）を作業ディレクトリ移動後も読み込めるようにする
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    parser = argparse.ArgumentParser(description="ベンチマーク")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("suite", help="全DB・全処理のベンチマーク（結果は JSON）")
+    p.add_argument("--sizes", default=",".join(str(s) for s in SIZES[:2]),
+                   help=f"行数（カンマ区切り、既定 {SIZES[0]},{SIZES[1]}。{SIZES[2]} も指定可）")
+    p.add_argument("--repeat", type=int, default=5)
+    p.add_argument("--output", help="結果の JSON を書き出すファイル（省略時は標準出力）")
+    p.add_argument("--compare", help="比較対象の過去の結果 JSON")
+    p.add_argument("--workdir", help="合成データを置くディレクトリ（省略時は一時ディレクトリ）")
+    p = sub.add_parser("pressure", help="圧力スコア: ループ計算 vs 一括計算")
+    p.add_argument("--users", type=int, default=10000)
+    p.add_argument("--tasks", type=int, default=50)
+    args = parser.parse_args()
+
+    if args.command == "suite":
+        sizes = [int(s) for s in args.sizes.split(",") if s]
+        output = os.path.abspath(args.output) if args.output else None
+        baseline = os.path.abspath(args.compare) if args.compare else None
+        with tempfile.TemporaryDirectory(prefix="bench_") as tmp:
+            workdir = os.path.abspath(args.workdir or tmp)
+            os.makedirs(workdir, exist_ok=True)
+            cwd = os.getcwd()
+            try:
+                results = run_suite(sizes, args.repeat, workdir)
+            finally:
+                os.chdir(cwd)
+        report = {"environment": environment(), "results": results}
+        text = json.dumps(report, ensure_ascii=False, indent=2)
+        if output:
+            with open(output, "w", encoding="utf-8") as f:
+                f.write(text + "\n")
+        else:
+            print(text)
+        if baseline:
+            compare(results, baseline)
+
+    elif args.command == "pressure":
+        result = bench_pressure(args.users, args.tasks)
+        print(f"{result['users']} users x {result['tasks_per_user']} tasks")
+        print(f"  loop : {result['loop_sec']:.3f}s")
+        print(f"  batch: {result['batch_sec']:.3f}s")
+        print(f"  speedup: x{result['speedup']:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+from __future__ import annotations
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+# =========================
+# SQLite 接続管理（プロセス共通の接続プール）
+# =========================
+# Streamlit は再実行のたびに新しいスレッドでスクリプトを実行するため、スレッドごとの接続では
+# 再実行ごとに接続と PRAGMA の設定をやり直すことになる。
+# 接続は DB ファイルごとのプール（最大 POOL_SIZE 本）に置き、呼び出しごとに借りて返す。
+#   with connection(DB_FILE) as conn:          # 読み取り
+#       rows = conn.execute(...).fetchall()
+#   with connection(DB_FILE) as conn, conn:    # 書き込み（正常終了で commit、例外で rollback）
+#       conn.execute(...)
+# 返すときに commit されていない変更が残っていれば rollback してから次の呼び出しに渡す。
+
+BUSY_TIMEOUT_MS = 5000
+CACHED_STATEMENTS = 256
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))  # DB ファイルごとの接続数の上限
+
+_pools_lock = threading.Lock()
+_pools: Dict[str, "_Pool"] = {}
+_stats_lock = threading.Lock()
+_stats = {"opens": 0, "reuses": 0}
+
+
+def _count(name: str) -> None:
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def _open(db_file: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(
+        db_file,
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        cached_statements=CACHED_STATEMENTS,
+        check_same_thread=False,  # プールを通して一度に1スレッドだけが使う
+    )
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+class _Pool:
+    """1つの DB ファイルの接続プール（使用中＋待機中で最大 POOL_SIZE 本）"""
+
+    def __init__(self, db_file: str):
+        self.db_file = db_file
+        self.idle: queue.LifoQueue = queue.LifoQueue()
+        self.slots = threading.BoundedSemaphore(POOL_SIZE)
+
+    def checkout(self) -> sqlite3.Connection:
+        self.slots.acquire()  # POOL_SIZE 本とも使用中なら返されるまで待つ
+        try:
+            conn = self.idle.get_nowait()
+        except queue.Empty:
+            try:
+                conn = _open(self.db_file)
+            except BaseException:
+                self.slots.release()
+                raise
+            _count("opens")
+            return conn
+        _count("reuses")
+        return conn
+
+    def checkin(self, conn: sqlite3.Connection) -> None:
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            self.idle.put(conn)
+        finally:
+            self.slots.release()
+
+    def close_idle(self) -> None:
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+def _pool(db_file: str) -> _Pool:
+    with _pools_lock:
+        pool = _pools.get(db_file)
+        if pool is None:
+            pool = _pools[db_file] = _Pool(db_file)
+        return pool
+
+
+@contextmanager
+def connection(db_file: str) -> Iterator[sqlite3.Connection]:
+    """プールから接続を借り、ブロックを抜けたら返す（close() しないこと）"""
+    pool = _pool(db_file)
+    conn = pool.checkout()
+    try:
+        yield conn
+    finally:
+        pool.checkin(conn)
+
+
+def close_connection(db_file: str) -> None:
+    """db_file のプールで待機中の接続を閉じる（ファイル削除前などに使用）"""
+    with _pools_lock:
+        pool = _pools.pop(db_file, None)
+    if pool is not None:
+        pool.close_idle()
+
+
+def connection_stats() -> dict:
+    """接続の新規オープン数・プールからの再利用数を返す"""
+    with _stats_lock:
+        return dict(_stats)
@@ -2,91 +2,333 @@ import streamlit as st
 import sqlite3
 import datetime
 import calendar
+import html
+import itertools
+import re
+
+import profiler
+import migrations
 
 # ページ設定
 st.set_page_config(page_title="1行日記", page_icon="📖")
+profiler.start_rerun("diary")
 
 # データベースファイルのパス
 DB_FILE = "diary.db"
 
-def init_database():
-    """データベースを初期化"""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute('''
+def to_iso_date(date_str):
+    """「YYYY年MM月DD日」形式の日付を ISO 形式（YYYY-MM-DD）に変換"""
+    return datetime.datetime.strptime(date_str, "%Y年%m月%d日").date().isoformat()
+
+# ===== スキーマのマイグレーション（migrations.py で版管理） =====
+def _create_diary(conn):
+    """日記テーブルを作成し、ISO日付カラムと一意索引を追加"""
+    conn.execute('''
         CREATE TABLE IF NOT EXISTS diary (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             date TEXT NOT NULL,
             content TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            iso_date TEXT
         )
     ''')
-    conn.commit()
-    conn.close()
+    if "iso_date" not in migrations.table_columns(conn, "diary"):
+        conn.execute("ALTER TABLE diary ADD COLUMN iso_date TEXT")
+    _backfill_iso_date(conn)
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_diary_iso_date ON diary(iso_date)")
+
+def _backfill_iso_date(conn):
+    """ISO日付が空の既存行をすべて埋める
+
+    同じ日付の行が複数ある場合は、内容を古い順に改行でつないで最新の1件にまとめ、残りは削除する
+    （一意索引を張る前に重複を無くし、どの行も検索から漏れないようにする）。
+    """
+    rows = conn.execute('''
+        SELECT date, id, content FROM diary
+        WHERE date IN (
+            SELECT date FROM diary
+            WHERE date GLOB '[0-9][0-9][0-9][0-9]年[0-9][0-9]月[0-9][0-9]日'
+            GROUP BY date HAVING COUNT(*) > 1
+        )
+        ORDER BY date, id
+    ''').fetchall()
+    for _, group in itertools.groupby(rows, key=lambda row: row[0]):
+        group = list(group)
+        keep_id = group[-1][1]
+        conn.execute("DELETE FROM diary WHERE id IN (%s)" % ", ".join("?" * (len(group) - 1)),
+                     [row[1] for row in group[:-1]])
+        conn.execute("UPDATE diary SET content = ? WHERE id = ?",
+                     ("\n".join(row[2] for row in group), keep_id))
+    conn.execute('''
+        UPDATE diary
+        SET iso_date = substr(date, 1, 4) || '-' || substr(date, 6, 2) || '-' || substr(date, 9, 2)
+        WHERE date GLOB '[0-9][0-9][0-9][0-9]年[0-9][0-9]月[0-9][0-9]日' AND iso_date IS NULL
+    ''')
+
+def _create_search_index(conn):
+    """全文検索用の FTS5 テーブル（trigram）と同期用トリガーを作成"""
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'diary_fts'").fetchone():
+        return
+    try:
+        conn.execute('''
+            CREATE VIRTUAL TABLE diary_fts USING fts5(
+                content, content='diary', content_rowid='id', tokenize='trigram'
+            )
+        ''')
+    except sqlite3.OperationalError:
+        # FTS5 / trigram が使えない SQLite の場合は LIKE 検索のみ
+        return
+    # マイグレーションはトランザクションの中で実行するため、executescript（途中で COMMIT する）は使わない
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS diary_fts_ai AFTER INSERT ON diary BEGIN
+            INSERT INTO diary_fts(rowid, content) VALUES (new.id, new.content);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS diary_fts_ad AFTER DELETE ON diary BEGIN
+            INSERT INTO diary_fts(diary_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS diary_fts_au AFTER UPDATE OF content ON diary BEGIN
+            INSERT INTO diary_fts(diary_fts, rowid, content) VALUES ('delete', old.id, old.content);
+            INSERT INTO diary_fts(rowid, content) VALUES (new.id, new.content);
+        END
+    ''')
+    # 既存の日記を索引に登録
+    conn.execute("INSERT INTO diary_fts(diary_fts) VALUES ('rebuild')")
+
+def _create_data_version(conn):
+    """日記が変わるたびに増える版番号（カレンダーのキャッシュキー用）"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS diary_meta (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        )
+    ''')
+    conn.execute("INSERT OR IGNORE INTO diary_meta (key, value) VALUES ('data_version', 0)")
+    for name, event in [("ai", "INSERT"), ("ad", "DELETE"), ("au", "UPDATE")]:
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS diary_version_{name} AFTER {event} ON diary BEGIN
+                UPDATE diary_meta SET value = value + 1 WHERE key = 'data_version';
+            END
+        ''')
+
+# _backfill_iso_date は、重複する日付を最新の1件にしか埋めていなかった版で移行済みの DB の修復用
+MIGRATIONS = [_create_diary, _create_search_index, _create_data_version, _backfill_iso_date]
 
+@profiler.traced("db.init_database")
+def init_database():
+    """データベースを最新のスキーマにする（適用済みなら版の確認だけ）"""
+    migrations.migrate(DB_FILE, MIGRATIONS)
+
+@profiler.traced("db.save_diary")
 def save_diary(date, content):
     """日記をデータベースに保存"""
     conn = sqlite3.connect(DB_FILE)
     cursor = conn.cursor()
     cursor.execute(
-        "INSERT INTO diary (date, content) VALUES (?, ?)",
-        (date, content)
+        "INSERT INTO diary (date, iso_date, content) VALUES (?, ?, ?)",
+        (date, to_iso_date(date), content)
     )
     conn.commit()
     conn.close()
 
+@profiler.traced("db.get_diary_by_date")
 def get_diary_by_date(date):
     """指定日付の日記を取得"""
     conn = sqlite3.connect(DB_FILE)
     cursor = conn.cursor()
-    cursor.execute("SELECT content FROM diary WHERE date = ?", (date,))
+    cursor.execute("SELECT content FROM diary WHERE iso_date = ?", (to_iso_date(date),))
     result = cursor.fetchone()
     conn.close()
     return result[0] if result else None
 
+@profiler.traced("db.update_diary")
 def update_diary(date, content):
     """日記を更新"""
     conn = sqlite3.connect(DB_FILE)
     cursor = conn.cursor()
     cursor.execute(
-        "UPDATE diary SET content = ?, created_at = CURRENT_TIMESTAMP WHERE date = ?",
-        (content, date)
+        "UPDATE diary SET content = ?, created_at = CURRENT_TIMESTAMP WHERE iso_date = ?",
+        (content, to_iso_date(date))
     )
     conn.commit()
     conn.close()
 
+@profiler.traced("db.delete_diary")
 def delete_diary(date):
     """日記を削除"""
     conn = sqlite3.connect(DB_FILE)
     cursor = conn.cursor()
-    cursor.execute("DELETE FROM diary WHERE date = ?", (date,))
+    cursor.execute("DELETE FROM diary WHERE iso_date = ?", (to_iso_date(date),))
     conn.commit()
     conn.close()
 
+@profiler.traced("db.get_recent_diary")
 def get_recent_diary(limit=5):
     """最近の日記を取得（日付降順）"""
     conn = sqlite3.connect(DB_FILE)
     cursor = conn.cursor()
     cursor.execute(
-        "SELECT date, content FROM diary ORDER BY date DESC LIMIT ?",
+        "SELECT date, content FROM diary WHERE iso_date IS NOT NULL ORDER BY iso_date DESC LIMIT ?",
         (limit,)
     )
     entries = cursor.fetchall()
     conn.close()
     return entries
 
-def get_diary_by_month(year, month):
-    """指定月の日記を全て取得"""
+@profiler.traced("db.get_diary_range")
+def get_diary_range(start, end):
+    """start〜end（両端含む）の日記を日付順に取得
+
+    start / end は datetime.date または ISO 形式の文字列
+    """
+    start = start.isoformat() if isinstance(start, datetime.date) else start
+    end = end.isoformat() if isinstance(end, datetime.date) else end
     conn = sqlite3.connect(DB_FILE)
     cursor = conn.cursor()
     cursor.execute(
-        "SELECT date, content FROM diary WHERE date LIKE ? ORDER BY date",
-        (f"{year}年{month:02d}月%",)
+        "SELECT date, content FROM diary WHERE iso_date BETWEEN ? AND ? ORDER BY iso_date",
+        (start, end)
     )
     entries = cursor.fetchall()
     conn.close()
+    return entries
+
+@profiler.traced("db.get_diary_by_month")
+def get_diary_by_month(year, month):
+    """指定月の日記を全て取得"""
+    last_day = calendar.monthrange(year, month)[1]
+    entries = get_diary_range(datetime.date(year, month, 1), datetime.date(year, month, last_day))
     return {date: content for date, content in entries}
 
+# 抜粋の強調の目印（Markdown に変換する前に内容をエスケープするため、制御文字で囲んでおく）
+_MARK_START, _MARK_END = "\x02", "\x03"
+_MARKDOWN_SPECIAL = re.compile(r"([\\`*_{}\[\]()#+\-.!|~<>&$])")
+
+def _escape_markdown(text):
+    """Markdown・HTML として解釈される記号をバックスラッシュでエスケープ"""
+    return _MARKDOWN_SPECIAL.sub(r"\\\1", text)
+
+def _to_markdown(marked):
+    """目印付きの抜粋をエスケープし、目印を太字（**）に置き換える"""
+    text = _escape_markdown(marked.replace("\n", " "))
+    return text.replace(_MARK_START, "**").replace(_MARK_END, "**")
+
+def _mark_words(content, words):
+    """LIKE で見つかった内容に、検索語の目印を付ける"""
+    pattern = re.compile("|".join(re.escape(w) for w in sorted(words, key=len, reverse=True)), re.IGNORECASE)
+    return pattern.sub(lambda m: f"{_MARK_START}{m.group(0)}{_MARK_END}", content)
+
+def short_search_sql(word_count):
+    """短い検索語用の LIKE 検索の SQL（iso_date の範囲で索引を使って絞ってから LIKE で照合する）"""
+    conditions = " AND ".join("content LIKE ?" for _ in range(word_count))
+    return (
+        f"SELECT date, content FROM diary WHERE iso_date BETWEEN ? AND ? AND {conditions} "
+        "ORDER BY iso_date DESC LIMIT ?"
+    )
+
+@profiler.traced("db.search_diary")
+def search_diary(query, limit=20, start=None, end=None):
+    """日記を全文検索（関連度順）し、(日付, 抜粋) のリストを返す
+
+    抜粋は Markdown 用にエスケープ済みで、一致した箇所を ** で強調する。
+    trigram は3文字未満の語を索引できないため、短い検索語は LIKE で探す。
+    LIKE は全件を読むことになるので、start〜end（datetime.date または ISO 形式、省略時は今月）の日記だけを探す。
+    """
+    words = query.split()
+    if not words:
+        return []
+    conn = sqlite3.connect(DB_FILE)
+    cursor = conn.cursor()
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'diary_fts'")
+    if cursor.fetchone() and all(len(w) >= 3 for w in words):
+        match = " AND ".join('"' + w.replace('"', '""') + '"' for w in words)
+        cursor.execute('''
+            SELECT d.date, snippet(diary_fts, 0, char(2), char(3), '…', 16)
+            FROM diary_fts JOIN diary d ON d.id = diary_fts.rowid
+            WHERE diary_fts MATCH ?
+            ORDER BY rank
+            LIMIT ?
+        ''', (match, limit))
+        results = cursor.fetchall()
+    else:
+        today = datetime.date.today()
+        start = start or today.replace(day=1)
+        end = end or today.replace(day=calendar.monthrange(today.year, today.month)[1])
+        start = start.isoformat() if isinstance(start, datetime.date) else start
+        end = end.isoformat() if isinstance(end, datetime.date) else end
+        cursor.execute(short_search_sql(len(words)), (start, end, *[f"%{w}%" for w in words], limit))
+        results = [(date, _mark_words(content, words)) for date, content in cursor.fetchall()]
+    conn.close()
+    return [(date, _to_markdown(snippet)) for date, snippet in results]
+
+@profiler.traced("db.get_data_version")
+def get_data_version():
+    """日記データの版番号（追加・更新・削除のたびにトリガーで増える）"""
+    conn = sqlite3.connect(DB_FILE)
+    cursor = conn.cursor()
+    cursor.execute("SELECT value FROM diary_meta WHERE key = 'data_version'")
+    result = cursor.fetchone()
+    conn.close()
+    return result[0] if result else 0
+
+# ===== カレンダー表示 =====
+WEEKDAYS = ["月", "火", "水", "木", "金", "土", "日"]
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def month_view(year, month, data_version):
+    """月のカレンダー（HTML）とその月の日記を返す
+
+    (年, 月, データの版) をキーにキャッシュするため、月の切り替えや日付の選択では
+    DB の読み込みもカレンダーの組み立てもやり直さない。
+    """
+    diary_data = get_diary_by_month(year, month)
+    rows = ["<tr>" + "".join(f"<th>{w}</th>" for w in WEEKDAYS) + "</tr>"]
+    for week in calendar.monthcalendar(year, month):
+        cells = []
+        for day in week:
+            if day == 0:
+                # 空のセル
+                cells.append("<td></td>")
+                continue
+            content = diary_data.get(f"{year}年{month:02d}月{day:02d}日")
+            if content is None:
+                cells.append(f'<td><b>{day}</b></td>')
+            else:
+                # 内容を短縮表示（全文はツールチップ）
+                short_content = content[:10] + "..." if len(content) > 10 else content
+                cells.append(
+                    f'<td class="has-diary" title="{html.escape(content)}">'
+                    f'<b>📖 {day}</b><br><small>{html.escape(short_content)}</small></td>'
+                )
+        rows.append("<tr>" + "".join(cells) + "</tr>")
+    calendar_html = (
+        "<style>"
+        ".diary-cal{width:100%;border-collapse:collapse;table-layout:fixed}"
+        ".diary-cal th,.diary-cal td{border:1px solid rgba(128,128,128,.3);padding:4px;vertical-align:top;height:3.5em}"
+        ".diary-cal td.has-diary{background:rgba(255,200,0,.15)}"
+        "</style>"
+        f'<table class="diary-cal">{"".join(rows)}</table>'
+    )
+    return calendar_html, diary_data
+
+# ===== カレンダーのコールバック =====
+def close_day(day_key):
+    st.session_state[day_key] = None
+    st.session_state["confirm_delete_date"] = None
+
+def edit_day(day_key, date_str):
+    # サイドバーの日付を設定して編集モードに
+    st.session_state["edit_date"] = datetime.datetime.strptime(date_str, "%Y年%m月%d日").date()
+    close_day(day_key)
+
+def delete_day(day_key, date_str):
+    delete_diary(date_str)
+    st.session_state["diary_deleted"] = date_str
+    close_day(day_key)
+
 # データベース初期化
 init_database()
 
@@ -94,6 +336,7 @@ init_database()
 st.title("📖 1行日記")
 
 # サイドバーで日記入力
+profiler.section("render.日記入力")
 st.sidebar.header("📝 日記を書く")
 
 # 日付選択
@@ -129,7 +372,7 @@ if st.sidebar.button("保存"):
                     st.session_state.confirm_update = False
                 else:
                     st.session_state.confirm_update = True
-                    st.rerun()
+                    profiler.rerun()
             else:
                 st.sidebar.info("📝 内容に変更がありません")
         else:
@@ -148,102 +391,85 @@ if st.session_state.get('confirm_update', False):
             update_diary(date_str, diary_text)
             st.sidebar.success("✅ 日記が更新されました！")
             st.session_state.confirm_update = False
-            st.rerun()
+            profiler.rerun()
     with col2:
         if st.button("❌ やめる"):
             st.session_state.confirm_update = False
-            st.rerun()
+            profiler.rerun()
+
+# 日記検索
+profiler.section("render.検索")
+st.subheader("🔍 日記を検索")
+search_query = st.text_input("キーワード", placeholder="スペース区切りで複数指定できます")
+if search_query:
+    # 3文字未満の語は索引で探せないため、カレンダーで選んでいる月に絞る
+    search_year = st.session_state.get("diary_year", datetime.date.today().year)
+    search_month = st.session_state.get("diary_month", datetime.date.today().month)
+    if any(len(w) < 3 for w in search_query.split()):
+        st.caption(f"3文字未満の語を含むため、{search_year}年{search_month}月の日記だけを探します（カレンダーの年月で切り替え）")
+    results = search_diary(
+        search_query,
+        start=datetime.date(search_year, search_month, 1),
+        end=datetime.date(search_year, search_month, calendar.monthrange(search_year, search_month)[1]),
+    )
+    if results:
+        for result_date, snippet_text in results:
+            st.markdown(f"**{result_date}**　{snippet_text}")
+    else:
+        st.info("該当する日記はありません")
 
 # 過去の日記を表示（メインエリア）
+profiler.section("render.カレンダー")
 st.subheader("📚 過去の日記 - カレンダー表示")
 
 # 年月選択
 col1, col2 = st.columns(2)
 with col1:
-    selected_year = st.selectbox("年", range(2020, 2030), index=datetime.date.today().year - 2020)
+    selected_year = st.selectbox("年", range(2020, 2030), index=datetime.date.today().year - 2020, key="diary_year")
 with col2:
-    selected_month = st.selectbox("月", range(1, 13), index=datetime.date.today().month - 1)
-
-# その月の日記データを取得
-diary_data = get_diary_by_month(selected_year, selected_month)
-
-# カレンダー表示
-cal = calendar.monthcalendar(selected_year, selected_month)
-weekdays = ["月", "火", "水", "木", "金", "土", "日"]
-
-# ヘッダー（曜日）
-cols = st.columns(7)
-for i, weekday in enumerate(weekdays):
-    cols[i].markdown(f"**{weekday}**")
-
-# カレンダーの各週
-for week in cal:
-    cols = st.columns(7)
-    for i, day in enumerate(week):
-        if day == 0:
-            # 空のセル
-            cols[i].markdown("　")
-        else:
-            date_str = f"{selected_year}年{selected_month:02d}月{day:02d}日"
-            
-            if date_str in diary_data:
-                # 日記がある日
-                content = diary_data[date_str]
-                # 内容を短縮表示
-                short_content = content[:10] + "..." if len(content) > 10 else content
-                
-                # クリック可能なボタンとして表示
-                if cols[i].button(f"📖 {day}\n{short_content}", key=f"day_{day}", help=f"{date_str}: {content}"):
-                    # 削除確認
-                    st.session_state[f'show_diary_{day}'] = True
-                    st.rerun()
-                
-                # 詳細表示・削除ダイアログ
-                if st.session_state.get(f'show_diary_{day}', False):
-                    with st.expander(f"{date_str}の日記", expanded=True):
-                        st.write(f"**内容**: {content}")
-                        
-                        col_edit, col_delete, col_close = st.columns(3)
-                        with col_edit:
-                            if st.button("✏️ 編集", key=f"edit_{day}"):
-                                # サイドバーの日付を設定して編集モードに
-                                st.session_state['edit_date'] = datetime.datetime.strptime(date_str, "%Y年%m月%d日").date()
-                                st.session_state[f'show_diary_{day}'] = False
-                                st.rerun()
-                        
-                        with col_delete:
-                            if st.button("🗑️ 削除", key=f"delete_{day}"):
-                                st.session_state[f'confirm_delete_{day}'] = True
-                                st.rerun()
-                        
-                        with col_close:
-                            if st.button("❌ 閉じる", key=f"close_{day}"):
-                                st.session_state[f'show_diary_{day}'] = False
-                                st.rerun()
-                        
-                        # 削除確認
-                        if st.session_state.get(f'confirm_delete_{day}', False):
-                            st.warning("⚠️ この日記を削除しますか？")
-                            col_yes, col_no = st.columns(2)
-                            
-                            with col_yes:
-                                if st.button("✅ 削除する", key=f"confirm_yes_{day}"):
-                                    delete_diary(date_str)
-                                    st.success("✅ 日記が削除されました！")
-                                    st.session_state[f'confirm_delete_{day}'] = False
-                                    st.session_state[f'show_diary_{day}'] = False
-                                    st.rerun()
-                            
-                            with col_no:
-                                if st.button("❌ やめる", key=f"confirm_no_{day}"):
-                                    st.session_state[f'confirm_delete_{day}'] = False
-                                    st.rerun()
-            else:
-                # 日記がない日
-                cols[i].markdown(f"**{day}**\n　")
+    selected_month = st.selectbox("月", range(1, 13), index=datetime.date.today().month - 1, key="diary_month")
+
+# その月のカレンダーと日記（キャッシュ済みなら DB もカレンダーも組み立て直さない）
+calendar_html, diary_data = month_view(selected_year, selected_month, get_data_version())
+st.markdown(calendar_html, unsafe_allow_html=True)
+
+if st.session_state.pop("diary_deleted", None):
+    st.success("✅ 日記が削除されました！")
+
+# 日記のある日を選んで詳細を表示（日付ごとのウィジェットは作らない）
+day_key = f"diary_day_{selected_year}_{selected_month}"
+selected_day = st.pills(
+    "日記のある日",
+    sorted(int(date_str[8:10]) for date_str in diary_data),
+    format_func=lambda day: f"📖 {day}日",
+    key=day_key,
+)
+date_str = f"{selected_year}年{selected_month:02d}月{selected_day:02d}日" if selected_day else None
+
+# 詳細表示・削除ダイアログ
+if date_str in diary_data:
+    with st.expander(f"{date_str}の日記", expanded=True):
+        st.write(f"**内容**: {diary_data[date_str]}")
+
+        col_edit, col_delete, col_close = st.columns(3)
+        col_edit.button("✏️ 編集", on_click=edit_day, args=(day_key, date_str))
+        if col_delete.button("🗑️ 削除"):
+            st.session_state["confirm_delete_date"] = date_str
+        col_close.button("❌ 閉じる", on_click=close_day, args=(day_key,))
+
+        # 削除確認
+        if st.session_state.get("confirm_delete_date") == date_str:
+            st.warning("⚠️ この日記を削除しますか？")
+            col_yes, col_no = st.columns(2)
+            col_yes.button("✅ 削除する", on_click=delete_day, args=(day_key, date_str))
+            if col_no.button("❌ やめる", key="confirm_no"):
+                st.session_state["confirm_delete_date"] = None
+                profiler.rerun()
 
 # サイドバーの日付入力を編集モードで更新
 if 'edit_date' in st.session_state:
     # JavaScriptを使って日付入力を更新（実際にはst.rerunで画面更新）
     st.sidebar.info("👆 選択した日付の日記を編集できます")
-    del st.session_state['edit_date']
\ No newline at end of file
+    del st.session_state['edit_date']
+
+profiler.finish_rerun()
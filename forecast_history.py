@@ -0,0 +1,176 @@
+from __future__ import annotations
+import threading
+from datetime import date
+
+import pandas as pd
+
+from db import connection
+import migrations
+import rain_conflicts
+
+# =========================
+# 天気予報の履歴（都市コード × 発表時刻 × 対象日 × 時間帯）
+# =========================
+# 天気APIから取得した予報を、時間帯ごとの降水確率・天気・最高/最低気温として1行ずつ保存する。
+#   forecast_history.record(city_code, payload)             # 取得のたびに呼ぶ（同じ発表の再取得は無視）
+#   forecast_history.get_history(city_code, start, end)     # 対象日の範囲で取得（グラフ・的中率の確認用）
+#   forecast_history.get_revisions(city_code, target_date)  # ある日の予報が発表ごとにどう変わったか
+#   forecast_history.latest_payload(city_code)              # 取得に失敗したときの代わり（API と同じ形）
+# 主キーは (city_code, issued_at, target_date, period) の WITHOUT ROWID テーブル。
+# 対象日での範囲検索は (city_code, target_date, period, issued_at) の索引を使う。
+
+DB_FILE = "forecast_history.db"
+DATE_LABELS = ["今日", "明日", "明後日"]
+
+_COLUMNS = ["issued_at", "target_date", "period", "rain_prob", "telop", "temp_max", "temp_min"]
+
+
+# スキーマのマイグレーション（migrations.py で版管理）
+def _create_history(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS forecast_history (
+            city_code TEXT NOT NULL,
+            issued_at TEXT NOT NULL,
+            target_date TEXT NOT NULL,
+            period TEXT NOT NULL,
+            rain_prob INTEGER,
+            telop TEXT,
+            temp_max INTEGER,
+            temp_min INTEGER,
+            PRIMARY KEY (city_code, issued_at, target_date, period)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_forecast_history_target
+        ON forecast_history (city_code, target_date, period, issued_at)
+    ''')
+
+
+MIGRATIONS = [_create_history]
+
+_recorded_lock = threading.Lock()
+_recorded: set = set()  # 保存済みの (city_code, issued_at)。同じ発表の再取得では DB に触れない
+
+
+def init_store():
+    migrations.migrate(DB_FILE, MIGRATIONS)
+
+
+def _celsius(temperature) -> int | None:
+    """{"celsius": "21", ...} を 21 に変換（無ければ None）"""
+    try:
+        return int(float((temperature or {}).get("celsius")))
+    except (TypeError, ValueError):
+        return None
+
+
+def _rows(city_code: str, payload: dict) -> list:
+    issued_at = payload.get("publicTime")
+    if not issued_at:
+        return []
+    rows = []
+    for forecast in payload.get("forecasts") or []:
+        target_date = forecast.get("date")
+        if not target_date:
+            continue
+        temperature = forecast.get("temperature") or {}
+        chance_of_rain = forecast.get("chanceOfRain") or {}
+        for period, _, _ in rain_conflicts.PERIODS:
+            rows.append((
+                city_code, issued_at, target_date, period,
+                rain_conflicts.parse_rain(chance_of_rain.get(period)),
+                forecast.get("telop"),
+                _celsius(temperature.get("max")),
+                _celsius(temperature.get("min")),
+            ))
+    return rows
+
+
+def record(city_code: str, payload: dict) -> int:
+    """API のレスポンスを保存し、追加した行数を返す（保存済みの発表なら 0）"""
+    key = (city_code, payload.get("publicTime"))
+    with _recorded_lock:
+        if key in _recorded:
+            return 0
+    rows = _rows(city_code, payload)
+    if not rows:
+        return 0
+    init_store()
+    with connection(DB_FILE) as conn, conn:
+        before = conn.total_changes
+        conn.executemany(
+            "INSERT OR IGNORE INTO forecast_history "
+            "(city_code, issued_at, target_date, period, rain_prob, telop, temp_max, temp_min) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            rows
+        )
+        inserted = conn.total_changes - before
+    with _recorded_lock:
+        _recorded.add(key)
+    return inserted
+
+
+def get_history(city_code: str, start_date: str, end_date: str, latest_only: bool = False) -> pd.DataFrame:
+    """対象日が start_date〜end_date の予報（latest_only なら対象日・時間帯ごとに最後の発表だけ）"""
+    init_store()
+    sql = (
+        f"SELECT {', '.join(_COLUMNS)} FROM forecast_history AS h "
+        "WHERE city_code = ? AND target_date BETWEEN ? AND ?"
+    )
+    if latest_only:
+        sql += (
+            " AND issued_at = (SELECT MAX(issued_at) FROM forecast_history"
+            " WHERE city_code = h.city_code AND target_date = h.target_date AND period = h.period)"
+        )
+    sql += " ORDER BY target_date, period, issued_at"
+    with connection(DB_FILE) as conn:
+        rows = conn.execute(sql, (city_code, start_date, end_date)).fetchall()
+    return pd.DataFrame(rows, columns=_COLUMNS)
+
+
+def get_revisions(city_code: str, target_date: str) -> pd.DataFrame:
+    """ある日の時間帯別降水確率を発表時刻ごとに並べた表（行: issued_at、列: 時間帯）"""
+    history = get_history(city_code, target_date, target_date)
+    if history.empty:
+        return pd.DataFrame(columns=[period for period, _, _ in rain_conflicts.PERIODS])
+    return history.pivot(index="issued_at", columns="period", values="rain_prob")
+
+
+def latest_payload(city_code: str, today: date | None = None) -> dict | None:
+    """最後に保存した発表を API と同じ形で返す（今日より前の日は除く。無ければ None）"""
+    init_store()
+    today = today or date.today()
+    with connection(DB_FILE) as conn:
+        row = conn.execute(
+            "SELECT MAX(issued_at) FROM forecast_history WHERE city_code = ?", (city_code,)
+        ).fetchone()
+        if row[0] is None:
+            return None
+        issued_at = row[0]
+        rows = conn.execute(
+            f"SELECT {', '.join(_COLUMNS)} FROM forecast_history "
+            "WHERE city_code = ? AND issued_at = ? AND target_date >= ? ORDER BY target_date, period",
+            (city_code, issued_at, today.isoformat())
+        ).fetchall()
+
+    forecasts = {}
+    for issued, target_date, period, rain_prob, telop, temp_max, temp_min in rows:
+        forecast = forecasts.get(target_date)
+        if forecast is None:
+            offset = (date.fromisoformat(target_date) - today).days
+            forecast = forecasts[target_date] = {
+                "date": target_date,
+                "dateLabel": DATE_LABELS[offset] if offset < len(DATE_LABELS) else target_date,
+                "telop": telop,
+                "detail": {"weather": None},
+                "temperature": {
+                    "max": {"celsius": str(temp_max)} if temp_max is not None else None,
+                    "min": {"celsius": str(temp_min)} if temp_min is not None else None,
+                },
+                "chanceOfRain": {},
+                "image": {"url": None},
+            }
+        forecast["chanceOfRain"][period] = "--%" if rain_prob is None else f"{rain_prob}%"
+    if not forecasts:
+        return None
+    return {"publicTime": issued_at, "forecasts": list(forecasts.values())}
@@ -0,0 +1,51 @@
+from __future__ import annotations
+import time
+from typing import Iterator
+
+import profiler
+
+# =========================
+# chat completions のストリーミング
+# =========================
+# 応答を断片ごとに返すジェネレータ。st.write_stream() にそのまま渡せる。
+#   result = {}
+#   text = st.write_stream(llm_stream.stream_chat(client, result, model=..., messages=[...]))
+#   result["first_token_ms"], result["total_ms"], result["completed"]
+# 画面遷移や再実行でジェネレータが途中で閉じられた場合も、finally で HTTP 接続を閉じて生成を打ち切る。
+# 打ち切られた場合は result["completed"] が False のままなので、呼び出し側はキャッシュしないこと。
+
+
+def stream_chat(client, result: dict | None = None, **request) -> Iterator[str]:
+    """stream=True で chat.completions を呼び、本文の断片を順に返す
+
+    result には text（受信済みの本文）、first_token_ms、total_ms、tokens、completed を書き込む。
+    """
+    result = {} if result is None else result
+    result.update(text="", first_token_ms=None, total_ms=None, tokens=None, completed=False)
+    parts = []
+    started = time.perf_counter()
+    stream = client.chat.completions.create(stream=True, stream_options={"include_usage": True}, **request)
+    try:
+        for chunk in stream:
+            if chunk.usage:
+                result["tokens"] = chunk.usage.total_tokens
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if not delta:
+                continue
+            if result["first_token_ms"] is None:
+                result["first_token_ms"] = (time.perf_counter() - started) * 1000
+            parts.append(delta)
+            yield delta
+        result["completed"] = True
+    finally:
+        stream.close()
+        result["text"] = "".join(parts)
+        result["total_ms"] = (time.perf_counter() - started) * 1000
+        profiler.annotate(
+            first_token_ms=result["first_token_ms"],
+            total_ms=result["total_ms"],
+            tokens=result["tokens"],
+            completed=result["completed"],
+        )
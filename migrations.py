@@ -0,0 +1,74 @@
+from __future__ import annotations
+import sqlite3
+import threading
+from typing import Callable, Sequence
+
+from db import connection
+
+# =========================
+# スキーマのマイグレーション（PRAGMA user_version で版管理）
+# =========================
+# 各DBのマイグレーションは conn を受け取る関数の順序付きリスト。
+# i 番目（0始まり）まで適用済みなら user_version = i + 1。
+#   MIGRATIONS = [_create_tables, _add_indexes]
+#   migrations.migrate(DB_FILE, MIGRATIONS)    # 再実行のたびに呼んでよい
+# 適用済みの版はプロセス内で DB ファイルごとに覚えておき、2回目以降は整数の比較だけで戻る。
+# 版管理を始める前に作られた DB（user_version = 0 のまま表がある）にも適用できるよう、
+# 各マイグレーションは IF NOT EXISTS やカラムの有無の確認を使って何度実行しても同じ結果になるように書く。
+# マイグレーションは版の更新と同じトランザクションで実行するため、中で commit・executescript・with conn を使わない。
+
+Migration = Callable[[sqlite3.Connection], None]
+
+_lock = threading.Lock()
+_versions: dict = {}  # DB ファイル -> 適用済みの版
+
+
+def apply(conn: sqlite3.Connection, migrations: Sequence[Migration]) -> int:
+    """conn に未適用のマイグレーションを順に適用し、適用後の版を返す
+
+    1つのマイグレーションと版の更新を BEGIN IMMEDIATE〜COMMIT の1トランザクションで実行し、
+    途中で失敗したら ROLLBACK して版もスキーマも元のままにする。
+    """
+    isolation_level = conn.isolation_level
+    conn.isolation_level = None  # DDL も暗黙の COMMIT なしでトランザクションに入れる
+    try:
+        while True:
+            # 版は書き込みロックを取ってから読む（他のプロセスが同時に適用していても二重に適用しない）
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                current = conn.execute("PRAGMA user_version").fetchone()[0]
+                if current > len(migrations):
+                    raise RuntimeError(f"DB のスキーマ（版 {current}）がこのアプリ（版 {len(migrations)}）より新しいです")
+                if current == len(migrations):
+                    conn.execute("COMMIT")
+                    return current
+                migration = migrations[current]
+                migration(conn)
+                if not conn.in_transaction:
+                    raise RuntimeError(
+                        f"マイグレーション {migration.__name__} の途中でトランザクションが終了しました"
+                        "（executescript・commit・with conn は使わない）"
+                    )
+                conn.execute(f"PRAGMA user_version = {current + 1}")
+                conn.execute("COMMIT")
+            except BaseException:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
+    finally:
+        conn.isolation_level = isolation_level
+
+
+def migrate(db_file: str, migrations: Sequence[Migration]) -> None:
+    """db_file のスキーマを最新にする（プロセスごとに1回だけ DB を確認する）"""
+    if _versions.get(db_file) == len(migrations):
+        return
+    with _lock:
+        if _versions.get(db_file) != len(migrations):
+            with connection(db_file) as conn:
+                _versions[db_file] = apply(conn, migrations)
+
+
+def table_columns(conn: sqlite3.Connection, table: str) -> set:
+    """テーブルのカラム名（古い DB へのカラム追加の判定用）"""
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
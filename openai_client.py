@@ -0,0 +1,265 @@
+from __future__ import annotations
+import os
+import time
+import random
+import threading
+from types import SimpleNamespace
+
+import openai
+
+# =========================
+# 全ページ共通の OpenAI クライアント（流量制限・再試行・同時実行数の上限・統計）
+# =========================
+#   client = openai_client.get_client(api_key)
+#   client.chat.completions.create(...)        # OpenAI クライアントと同じ呼び方
+#   client.audio.transcriptions.create(...)
+#   openai_client.stats()                      # モデルごとの呼び出し数・トークン数・所要時間
+# - 送信前に RPM / TPM のトークンバケットで待つ（TPM は入力の文字数＋出力上限で見積もり、応答の usage で補正）
+# - 429 / 5xx / 接続エラーは指数バックオフ（ジッター付き、Retry-After があればそれ以上待つ）で再試行
+#   （利用枠切れの 429（insufficient_quota）は再試行しない。失敗した送信の TPM の見積もりは返す）
+# - 同時に送信中のリクエストを MAX_CONCURRENCY 件までに抑える（ストリームは閉じるまで1件と数える）
+# 制限と統計はプロセス全体（全セッション・全ページ）で共有する。
+
+RPM_LIMIT = int(os.getenv("OPENAI_RPM_LIMIT", "500"))
+TPM_LIMIT = int(os.getenv("OPENAI_TPM_LIMIT", "200000"))
+MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "8"))
+MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "4"))
+BACKOFF_BASE = 0.5   # 秒
+BACKOFF_MAX = 20.0   # 秒
+DEFAULT_COMPLETION_TOKENS = 500  # max_tokens が無い場合の出力トークンの見積もり
+
+
+class TokenBucket:
+    """1分あたり per_minute 個のトークンが補充されるバケット（容量も per_minute）"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount: float = 1.0) -> float:
+        """amount 個取れるまで待ち、待った秒数を返す"""
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return waited
+                wait = (amount - self.tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+    def adjust(self, amount: float) -> None:
+        """見積もりとの差を戻す（正なら返却、負なら追加で消費）"""
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+
+_rpm = TokenBucket(RPM_LIMIT)
+_tpm = TokenBucket(TPM_LIMIT)
+_in_flight = threading.BoundedSemaphore(MAX_CONCURRENCY)
+
+_clients_lock = threading.Lock()
+_clients: dict = {}
+
+_stats_lock = threading.Lock()
+_stats: dict = {}
+
+
+def _record(model: str, *, latency: float | None = None, usage=None, retries: int = 0, error: bool = False,
+            waited: float = 0.0) -> None:
+    with _stats_lock:
+        s = _stats.setdefault(model, {
+            "calls": 0, "errors": 0, "retries": 0, "prompt_tokens": 0, "completion_tokens": 0,
+            "total_tokens": 0, "latency_sum": 0.0, "latency_max": 0.0, "throttle_wait": 0.0,
+        })
+        s["calls"] += 1
+        s["errors"] += int(error)
+        s["retries"] += retries
+        s["throttle_wait"] += waited
+        if latency is not None:
+            s["latency_sum"] += latency
+            s["latency_max"] = max(s["latency_max"], latency)
+        if usage is not None:
+            s["prompt_tokens"] += getattr(usage, "prompt_tokens", 0) or 0
+            s["completion_tokens"] += getattr(usage, "completion_tokens", 0) or 0
+            s["total_tokens"] += getattr(usage, "total_tokens", 0) or 0
+
+
+def stats() -> dict:
+    """モデルごとの呼び出し数・エラー数・再試行数・トークン数・平均/最大所要時間（秒）"""
+    with _stats_lock:
+        result = {model: dict(s) for model, s in _stats.items()}
+    for s in result.values():
+        succeeded = s["calls"] - s["errors"]
+        s["latency_avg"] = s["latency_sum"] / succeeded if succeeded else None
+    return result
+
+
+def reset_stats() -> None:
+    with _stats_lock:
+        _stats.clear()
+
+
+def _estimate_tokens(request: dict) -> int:
+    """TPM 用の見積もり（日本語は1文字≒1トークンとして入力の文字数＋出力上限）"""
+    messages = request.get("messages")
+    if not messages:
+        return 0
+    prompt = sum(len(str(m.get("content") or "")) for m in messages)
+    completion = request.get("max_tokens") or request.get("max_completion_tokens") or DEFAULT_COMPLETION_TOKENS
+    return prompt + completion
+
+
+def _quota_exceeded(error: Exception) -> bool:
+    """利用枠（クレジット）を使い切った 429。待っても回復しないので再試行しない"""
+    return isinstance(error, openai.RateLimitError) and getattr(error, "code", None) == "insufficient_quota"
+
+
+def _retryable(error: Exception) -> bool:
+    if isinstance(error, openai.APIConnectionError):  # タイムアウトを含む
+        return True
+    if _quota_exceeded(error):
+        return False
+    return isinstance(error, openai.APIStatusError) and (error.status_code == 429 or error.status_code >= 500)
+
+
+def _backoff(attempt: int, error: Exception) -> float:
+    """ジッター付き指数バックオフ（Retry-After があればそれ以上）"""
+    delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    try:
+        delay = max(delay, min(float(retry_after), BACKOFF_MAX))
+    except (TypeError, ValueError):
+        pass
+    return delay
+
+
+def describe_error(error: Exception) -> str:
+    """画面に出すエラーメッセージ"""
+    if _quota_exceeded(error):
+        return "OpenAI APIの利用枠を使い切っています。プランと請求の設定を確認してください。"
+    if isinstance(error, openai.RateLimitError):
+        return "AIの利用が混み合っています。しばらく待ってからもう一度お試しください。"
+    if isinstance(error, openai.AuthenticationError):
+        return "OpenAI APIキーが正しくありません。設定を確認してください。"
+    if isinstance(error, openai.APIStatusError) and error.status_code >= 500:
+        return "AIのサービスが一時的に利用できません。しばらく待ってからもう一度お試しください。"
+    if isinstance(error, openai.APIConnectionError):
+        return "AIのサービスに接続できませんでした。ネットワークを確認してください。"
+    return f"AIの呼び出しでエラーが発生しました: {error}"
+
+
+class _GuardedStream:
+    """ストリームを閉じるまで同時実行枠を持ち、閉じたときに統計を記録する"""
+
+    def __init__(self, stream, model: str, estimate: int, started: float, retries: int, waited: float):
+        self._stream = stream
+        self._model = model
+        self._estimate = estimate
+        self._started = started
+        self._retries = retries
+        self._waited = waited
+        self._usage = None
+        self._closed = False
+
+    def __iter__(self):
+        for chunk in self._stream:
+            if getattr(chunk, "usage", None):
+                self._usage = chunk.usage
+            yield chunk
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self._stream.close()
+        finally:
+            _in_flight.release()
+            if self._usage is not None and self._estimate:
+                _tpm.adjust(self._estimate - self._usage.total_tokens)
+            _record(self._model, latency=time.perf_counter() - self._started, usage=self._usage,
+                    retries=self._retries, waited=self._waited)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __del__(self):
+        self.close()
+
+
+def _call(create, request: dict):
+    model = request.get("model", "unknown")
+    estimate = _estimate_tokens(request)
+    retries = 0
+    waited = 0.0
+    while True:
+        waited += _rpm.acquire()
+        if estimate:
+            waited += _tpm.acquire(estimate)
+        _in_flight.acquire()
+        started = time.perf_counter()
+        try:
+            response = create(**request)
+        except Exception as e:
+            _in_flight.release()
+            if estimate:
+                _tpm.adjust(estimate)  # 失敗した送信はトークンを消費していないので見積もりを返す
+            if not _retryable(e) or retries >= MAX_RETRIES:
+                _record(model, retries=retries, error=True, waited=waited)
+                raise
+            time.sleep(_backoff(retries, e))
+            retries += 1
+            continue
+
+        if request.get("stream"):
+            return _GuardedStream(response, model, estimate, started, retries, waited)
+        _in_flight.release()
+        usage = getattr(response, "usage", None)
+        if usage is not None and estimate:
+            _tpm.adjust(estimate - usage.total_tokens)
+        _record(model, latency=time.perf_counter() - started, usage=usage, retries=retries, waited=waited)
+        return response
+
+
+class _Endpoint:
+    def __init__(self, create):
+        self._create = create
+
+    def create(self, **request):
+        return _call(self._create, request)
+
+
+class LimitedClient:
+    """OpenAI クライアントと同じ呼び方で、共通の流量制限・再試行・統計を挟むラッパー"""
+
+    def __init__(self, client: openai.OpenAI):
+        self.raw = client
+        self.chat = SimpleNamespace(completions=_Endpoint(client.chat.completions.create))
+        self.audio = SimpleNamespace(transcriptions=_Endpoint(client.audio.transcriptions.create))
+
+
+def get_client(api_key: str | None = None) -> LimitedClient:
+    """API キーごとに1つのクライアントを使い回す（再試行はこのモジュールで行うため SDK の再試行は無効）"""
+    api_key = api_key or os.getenv("OPENAI_API_KEY")
+    key = (api_key, os.getenv("OPENAI_BASE_URL"))
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = LimitedClient(openai.OpenAI(api_key=api_key, max_retries=0))
+        return client
@@ -0,0 +1,208 @@
+from __future__ import annotations
+import os
+import json
+import time
+import logging
+import functools
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+
+import streamlit as st
+
+# =========================
+# 再実行ごとの処理時間計測（オプトイン）
+# =========================
+# 環境変数 APP_PROFILE=1、または URL に ?profile=1 を付けたときだけ有効。
+#   profiler.start_rerun("tenki")           # スクリプトの先頭
+#   @profiler.traced("db.get_schedules")    # 関数単位
+#   with profiler.span("render.天気予報"):   # 任意の区間
+#   profiler.section("render.一覧")          # 次の section / finish まで（スクリプト形式のページ向け）
+#   profiler.finish_rerun()                  # 末尾（サイドバーに結果を表示し JSONL に追記）
+#   profiler.rerun() / profiler.stop()       # st.rerun() / st.stop() の代わり（例外で抜ける前にトレースを閉じる）
+# 無効時は各呼び出しがフラグの確認だけで終わる。
+
+LOG_FILE = os.getenv("APP_PROFILE_LOG", "profile_traces.jsonl")
+LOG_MAX_BYTES = 5 * 1024 * 1024
+LOG_BACKUP_COUNT = 3
+SESSION_KEY = "_profile_traces"
+KEEP_TRACES = 20
+
+_local = threading.local()
+_logger: logging.Logger | None = None
+_logger_lock = threading.Lock()
+
+
+def _env_enabled() -> bool:
+    return os.getenv("APP_PROFILE", "").lower() in ("1", "true", "yes")
+
+
+def _trace() -> dict | None:
+    return getattr(_local, "trace", None)
+
+
+def start_rerun(page: str) -> None:
+    """この再実行のトレースを開始する（無効なら何もしない）"""
+    enabled = _env_enabled()
+    if not enabled:
+        try:
+            enabled = st.query_params.get("profile") == "1"
+        except Exception:
+            enabled = False
+    _local.trace = {
+        "page": page,
+        "started_at": datetime.now().isoformat(timespec="milliseconds"),
+        "_t0": time.perf_counter(),
+        "_stack": [],
+        "_section": None,
+        "spans": [],
+    } if enabled else None
+
+
+def _open_span(trace: dict, name: str, attrs: dict) -> dict:
+    span_ = {"name": name, "depth": len(trace["_stack"]),
+             "start_ms": (time.perf_counter() - trace["_t0"]) * 1000, **attrs}
+    trace["spans"].append(span_)
+    trace["_stack"].append(span_)
+    span_["_t"] = time.perf_counter()
+    return span_
+
+
+def _close_span(trace: dict, span_: dict) -> None:
+    span_["ms"] = (time.perf_counter() - span_.pop("_t")) * 1000
+    if trace["_stack"] and trace["_stack"][-1] is span_:
+        trace["_stack"].pop()
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """区間の所要時間を記録する。yield される dict に rows / bytes などを追記できる"""
+    trace = _trace()
+    if trace is None:
+        yield {}
+        return
+    span_ = _open_span(trace, name, attrs)
+    try:
+        yield span_
+    finally:
+        _close_span(trace, span_)
+
+
+def annotate(**attrs) -> None:
+    """現在の区間に属性（rows / bytes / tokens など）を追加する"""
+    trace = _trace()
+    if trace is not None and trace["_stack"]:
+        trace["_stack"][-1].update(attrs)
+
+
+def section(name: str) -> None:
+    """前の section を閉じて新しい区間を始める"""
+    trace = _trace()
+    if trace is None:
+        return
+    if trace["_section"] is not None:
+        _close_span(trace, trace["_section"])
+    trace["_section"] = _open_span(trace, name, {})
+
+
+def _count_rows(result):
+    if hasattr(result, "shape"):  # DataFrame
+        return int(result.shape[0])
+    if isinstance(result, list):
+        return len(result)
+    return None
+
+
+def traced(name: str):
+    """関数呼び出しを区間として記録するデコレータ（戻り値の件数を rows に記録）"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _trace() is None:
+                return fn(*args, **kwargs)
+            with span(name) as span_:
+                result = fn(*args, **kwargs)
+                rows = _count_rows(result)
+                if rows is not None:
+                    span_.setdefault("rows", rows)
+                return result
+        return wrapper
+    return decorator
+
+
+def _get_logger() -> logging.Logger:
+    global _logger
+    with _logger_lock:
+        if _logger is None:
+            logger = logging.getLogger("app.profiler")
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+            handler = RotatingFileHandler(LOG_FILE, maxBytes=LOG_MAX_BYTES,
+                                          backupCount=LOG_BACKUP_COUNT, encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            logger.addHandler(handler)
+            _logger = logger
+        return _logger
+
+
+def finish_rerun() -> dict | None:
+    """トレースを閉じて JSONL に書き出し、サイドバーに表示する"""
+    trace = _trace()
+    if trace is None:
+        return None
+    _local.trace = None
+    if trace["_section"] is not None:
+        _close_span(trace, trace["_section"])
+    for open_span in reversed(trace["_stack"]):
+        _close_span(trace, open_span)
+
+    record = {
+        "page": trace["page"],
+        "started_at": trace["started_at"],
+        "total_ms": (time.perf_counter() - trace["_t0"]) * 1000,
+        "spans": trace["spans"],
+    }
+    _get_logger().info(json.dumps(record, ensure_ascii=False, default=str))
+
+    traces = st.session_state.setdefault(SESSION_KEY, [])
+    traces.append(record)
+    del traces[:-KEEP_TRACES]
+    render_debug_panel()
+    return record
+
+
+def rerun() -> None:
+    """トレースを閉じてから st.rerun() する（st.rerun() は例外で抜けるため末尾の finish_rerun() に届かない）"""
+    finish_rerun()
+    st.rerun()
+
+
+def stop() -> None:
+    """トレースを閉じてから st.stop() する"""
+    finish_rerun()
+    st.stop()
+
+
+def render_debug_panel() -> None:
+    """サイドバーに直近のトレースを表示する"""
+    traces = st.session_state.get(SESSION_KEY) or []
+    if not traces:
+        return
+    latest = traces[-1]
+    with st.sidebar.expander(f"🐞 プロファイル（{latest['total_ms']:.0f} ms）"):
+        st.dataframe(
+            [
+                {
+                    "区間": "　" * s["depth"] + s["name"],
+                    "ms": round(s.get("ms", 0.0), 2),
+                    "行数": s.get("rows"),
+                    "バイト": s.get("bytes"),
+                }
+                for s in latest["spans"]
+            ],
+            use_container_width=True,
+            hide_index=True,
+        )
+        st.caption(f"直近{len(traces)}回の合計時間(ms): " + ", ".join(f"{t['total_ms']:.0f}" for t in traces))
+        st.caption(f"ログ: {LOG_FILE}")
@@ -0,0 +1,71 @@
+from __future__ import annotations
+from typing import List
+
+import pandas as pd
+
+# =========================
+# 雨と重なる屋外の予定の検出（ローカル判定）
+# =========================
+# 予定の時刻を天気予報の時間帯別降水確率（chanceOfRain の T00_06〜T18_24）に当てはめ、
+# 「屋外」かつ「変更可能」で降水確率がしきい値以上の予定を重要度順に返す。
+# 該当が無ければ AI アドバイスを呼ぶ必要はない。
+
+RAIN_THRESHOLD = 50  # 降水確率（%）のしきい値
+
+# (キー, 開始時, 終了時)
+PERIODS = [
+    ("T00_06", 0, 6),
+    ("T06_12", 6, 12),
+    ("T12_18", 12, 18),
+    ("T18_24", 18, 24),
+]
+PERIOD_LABELS = {"T00_06": "00-06時", "T06_12": "06-12時", "T12_18": "12-18時", "T18_24": "18-24時"}
+
+
+def period_of(time_str: str) -> str | None:
+    """「HH:MM」を時間帯のキー（T06_12 など）に変換（読めなければ None）"""
+    try:
+        hour = int(str(time_str).split(":")[0])
+    except ValueError:
+        return None
+    for key, start, end in PERIODS:
+        if start <= hour < end:
+            return key
+    return None
+
+
+def parse_rain(prob) -> int | None:
+    """「30%」を 30 に変換（「--%」や空は None）"""
+    value = str(prob or "").strip().rstrip("%")
+    return int(value) if value.isdigit() else None
+
+
+def find_conflicts(schedules: pd.DataFrame, weather_info: List[dict], threshold: int = RAIN_THRESHOLD) -> pd.DataFrame:
+    """雨と重なる屋外・変更可能な予定を重要度の高い順に返す
+
+    schedules は get_schedules() の DataFrame、weather_info は get_weather_forecast() の戻り値。
+    時間帯の降水確率が無い場合（発表済みの時間帯など）は、その日の雨判定（rain）で代用する。
+    戻り値には period（時間帯のキー）と rain_prob（降水確率、不明なら None）の列が付く。
+    """
+    columns = list(schedules.columns) + ["period", "rain_prob"]
+    weather_by_date = {weather["date"]: weather for weather in weather_info}
+    conflicts = []
+    for row in schedules.to_dict("records"):
+        if not row["outdoor"] or not row["changeable"]:
+            continue
+        weather = weather_by_date.get(row["date"])
+        if weather is None:
+            continue
+        period = period_of(row["time"])
+        rain_prob = parse_rain((weather.get("rain_by_time") or {}).get(period))
+        if rain_prob is None:
+            if not weather["rain"]:
+                continue
+        elif rain_prob < threshold:
+            continue
+        conflicts.append({**row, "period": period, "rain_prob": rain_prob})
+
+    result = pd.DataFrame(conflicts, columns=columns)
+    if result.empty:
+        return result
+    return result.sort_values(["importance", "date", "time"], ascending=[False, True, True], ignore_index=True)
@@ -0,0 +1,241 @@
+from __future__ import annotations
+import io
+import os
+import csv
+import math
+import datetime
+from typing import Callable, Iterable, Iterator, List
+
+from db import connection
+
+# =========================
+# スケジュールの一括インポート / エクスポート（CSV・Parquet）
+# =========================
+# インポートはチャンク単位で読み込み・検証し、チャンクごとに1トランザクションで executemany。
+# エクスポートはカーソルから fetchmany で少しずつ書き出し、テーブル全体をメモリに載せない。
+# Parquet は pyarrow がある場合のみ対応。
+# どちらも user_id で指定したユーザーの予定だけを対象にする（ファイルに user_id の列は含めない）。
+
+COLUMNS = ["date", "time", "event_name", "location", "outdoor", "importance", "changeable"]
+CHUNK_SIZE = 5000
+COUNT_BLOCK_SIZE = 1 << 20  # count_rows で一度に数えるバイト数
+MAX_ERRORS = 100
+
+_TRUE = {"1", "true", "yes", "y", "はい", "可", "屋外", "○"}
+_FALSE = {"0", "false", "no", "n", "いいえ", "不可", "屋内", "×", ""}
+
+
+class ScheduleImportError(ValueError):
+    """1行分の検証エラー"""
+
+
+class ScheduleImportAborted(RuntimeError):
+    """インポートが途中で失敗した。inserted 件はそれまでのチャンクで登録済み"""
+
+    def __init__(self, message: str, inserted: int, processed: int):
+        super().__init__(message)
+        self.inserted = inserted
+        self.processed = processed
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as e:
+        raise RuntimeError("Parquet を扱うには pyarrow をインストールしてください") from e
+    return pyarrow
+
+
+def _parse_flag(value, name: str) -> int:
+    s = str(value if value is not None else "").strip().lower()
+    if s in _TRUE:
+        return 1
+    if s in _FALSE:
+        return 0
+    raise ScheduleImportError(f"{name} は 1/0 で指定してください: {value!r}")
+
+
+def validate_row(row: dict) -> tuple:
+    """1行を検証・正規化し、INSERT 用のタプルを返す"""
+    value = row.get("date")
+    if isinstance(value, datetime.datetime):
+        value = value.date()
+    try:
+        if isinstance(value, datetime.date):
+            date = value.isoformat()
+        else:
+            date = datetime.date.fromisoformat(str(value or "").strip().replace("/", "-")).isoformat()
+    except ValueError:
+        raise ScheduleImportError(f"date は YYYY-MM-DD 形式で指定してください: {value!r}")
+
+    raw_time = str(row.get("time") or "").strip()
+    try:
+        parts = [int(p) for p in raw_time.split(":")]
+        time = datetime.time(*parts[:3]).strftime("%H:%M")
+    except (TypeError, ValueError):
+        raise ScheduleImportError(f"time は HH:MM 形式で指定してください: {row.get('time')!r}")
+
+    event_name = str(row.get("event_name") or "").strip()
+    if not event_name:
+        raise ScheduleImportError("event_name は必須です")
+    location = str(row.get("location") or "").strip()
+
+    raw_importance = row.get("importance")
+    try:
+        number = float(raw_importance) if str(raw_importance or "").strip() else 3.0
+        if not math.isfinite(number):  # inf / nan / 1e999
+            raise ValueError(raw_importance)
+        importance = int(number)
+        if number != importance:  # 4.9 を 4 に切り捨てない
+            raise ValueError(raw_importance)
+    except (ValueError, OverflowError):
+        raise ScheduleImportError(f"importance は 1〜5 の数値で指定してください: {raw_importance!r}")
+    if not 1 <= importance <= 5:
+        raise ScheduleImportError(f"importance は 1〜5 で指定してください: {raw_importance!r}")
+
+    changeable = row.get("changeable")
+    return (
+        date, time, event_name, location,
+        _parse_flag(row.get("outdoor"), "outdoor"),
+        importance,
+        _parse_flag(1 if changeable is None else changeable, "changeable"),
+    )
+
+
+def _chunks(rows: Iterable[dict], size: int) -> Iterator[List[dict]]:
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _read_csv(source) -> Iterator[dict]:
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, newline="", encoding="utf-8-sig") as f:
+            yield from csv.DictReader(f)
+        return
+    text = io.TextIOWrapper(source, encoding="utf-8-sig", newline="")
+    try:
+        yield from csv.DictReader(text)
+    finally:
+        text.detach()
+
+
+def _read_parquet(source, batch_size: int) -> Iterator[dict]:
+    pyarrow = _require_pyarrow()
+    parquet_file = pyarrow.parquet.ParquetFile(source)
+    for batch in parquet_file.iter_batches(batch_size=batch_size):
+        yield from batch.to_pylist()
+
+
+def count_rows(source, fmt: str) -> int | None:
+    """進捗表示用の総行数（CSV はバイト列の改行数から概算）"""
+    if fmt == "parquet":
+        return _require_pyarrow().parquet.ParquetFile(source).metadata.num_rows
+    if hasattr(source, "getbuffer"):
+        # アップロード全体を複製しないよう、バッファを区切りながら数える
+        lines = 0
+        with source.getbuffer() as view:
+            for start in range(0, len(view), COUNT_BLOCK_SIZE):
+                lines += view[start:start + COUNT_BLOCK_SIZE].tobytes().count(b"\n")
+        return max(lines - 1, 0)
+    return None
+
+
+def import_schedules(source, db_file: str, user_id: str, fmt: str = "csv", chunk_size: int = CHUNK_SIZE,
+                     on_progress: Callable[[int, int | None], None] | None = None,
+                     total: int | None = None) -> dict:
+    """CSV / Parquet から user_id のスケジュールとして一括登録する
+
+    source はパスまたはバイナリのファイルオブジェクト。不正な行は飛ばして errors に記録する
+    （行番号はヘッダを除いた 1 始まり）。戻り値は {"inserted", "rejected", "errors"}。
+    読み込みや書き込みが途中で失敗したときは ScheduleImportAborted を送出する
+    （inserted にそれまでに登録済みの件数を持つ）。
+    """
+    if fmt == "csv":
+        rows = _read_csv(source)
+    elif fmt == "parquet":
+        rows = _read_parquet(source, chunk_size)
+    else:
+        raise ValueError(f"未対応の形式です: {fmt}")
+
+    inserted = rejected = processed = 0
+    errors = []
+    try:
+        with connection(db_file) as conn:
+            for chunk in _chunks(rows, chunk_size):
+                values = []
+                for offset, row in enumerate(chunk, start=processed + 1):
+                    try:
+                        values.append((user_id,) + validate_row(row))
+                    except ScheduleImportError as e:
+                        rejected += 1
+                        if len(errors) < MAX_ERRORS:
+                            errors.append((offset, str(e)))
+                with conn:
+                    conn.executemany(
+                        "INSERT INTO schedules (user_id, date, time, event_name, location, outdoor, importance, changeable) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        values
+                    )
+                inserted += len(values)
+                processed += len(chunk)
+                if on_progress:
+                    on_progress(processed, total)
+    except Exception as e:
+        # チャンクごとに commit しているので、失敗したチャンクより前の行は登録済み
+        raise ScheduleImportAborted(str(e), inserted, processed) from e
+    return {"inserted": inserted, "rejected": rejected, "errors": errors}
+
+
+def _iter_rows(db_file: str, user_id: str, chunk_size: int) -> Iterator[list]:
+    with connection(db_file) as conn:
+        cursor = conn.execute(
+            f"SELECT {', '.join(COLUMNS)} FROM schedules WHERE user_id = ? ORDER BY date, time", (user_id,)
+        )
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+
+
+def export_schedules(dest, db_file: str, user_id: str, fmt: str = "csv", chunk_size: int = CHUNK_SIZE) -> int:
+    """user_id のスケジュールを dest（パスまたはバイナリのファイルオブジェクト）に書き出し、件数を返す"""
+    count = 0
+    if fmt == "csv":
+        close = not hasattr(dest, "write")
+        f = open(dest, "wb") if close else dest
+        text = io.TextIOWrapper(f, encoding="utf-8", newline="")
+        try:
+            writer = csv.writer(text)
+            writer.writerow(COLUMNS)
+            for rows in _iter_rows(db_file, user_id, chunk_size):
+                writer.writerows(rows)
+                count += len(rows)
+            text.flush()
+        finally:
+            text.detach()
+            if close:
+                f.close()
+    elif fmt == "parquet":
+        pyarrow = _require_pyarrow()
+        schema = pyarrow.schema([
+            ("date", pyarrow.string()), ("time", pyarrow.string()),
+            ("event_name", pyarrow.string()), ("location", pyarrow.string()),
+            ("outdoor", pyarrow.int64()), ("importance", pyarrow.int64()), ("changeable", pyarrow.int64()),
+        ])
+        with pyarrow.parquet.ParquetWriter(dest, schema) as writer:
+            for rows in _iter_rows(db_file, user_id, chunk_size):
+                writer.write_batch(pyarrow.RecordBatch.from_pylist(
+                    [dict(zip(COLUMNS, row)) for row in rows], schema=schema
+                ))
+                count += len(rows)
+    else:
+        raise ValueError(f"未対応の形式です: {fmt}")
+    return count
@@ -0,0 +1,185 @@
+from __future__ import annotations
+import sys
+import json
+import time
+import threading
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# =========================
+# ローカルのスタブサーバ（天気API / OpenAI API）
+# =========================
+# ベンチマークや動作確認で外部APIの代わりに使う。
+#   with StubServer() as server:
+#       os.environ["OPENAI_BASE_URL"] = server.url + "/v1"
+#       weather_url = server.url  # /api/forecast/city/<code>
+# delay（秒）で遅延、fail_every=n で n 回に1回 HTTP 503 を返す。
+# requests / connections で受けたリクエスト数と TCP 接続数を確認できる。
+# chat completions は stream=true なら SSE で1文字ずつ返し、response_format 指定時はタスク一覧の JSON を返す。
+
+
+def sample_forecast(city_code: str) -> dict:
+    """天気API（weather.tsukumijima.net）と同じ形の予報データ"""
+    today = datetime.now().date()
+    forecasts = []
+    for i, (label, telop) in enumerate([("今日", "晴れ"), ("明日", "雨"), ("明後日", "曇時々晴")]):
+        forecasts.append({
+            "date": (today + timedelta(days=i)).isoformat(),
+            "dateLabel": label,
+            "telop": telop,
+            "detail": {"weather": telop},
+            "temperature": {
+                "min": {"celsius": "12", "fahrenheit": "53.6"} if i else None,
+                "max": {"celsius": "21", "fahrenheit": "69.8"},
+            },
+            "chanceOfRain": {"T00_06": "10%", "T06_12": "60%" if telop == "雨" else "0%", "T12_18": "70%" if telop == "雨" else "10%", "T18_24": "--%"},
+            "image": {"url": "https://www.jma.go.jp/bosai/forecast/img/100.svg", "title": telop, "width": 80, "height": 60},
+        })
+    return {
+        "publicTime": datetime.now().replace(minute=0, second=0, microsecond=0).isoformat() + "+09:00",
+        "location": {"city": city_code},
+        "forecasts": forecasts,
+    }
+
+
+def sample_chat_completion(model: str, content: str = "スタブのアドバイスです。") -> dict:
+    return {
+        "id": "chatcmpl-stub",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 100, "completion_tokens": 20, "total_tokens": 120},
+    }
+
+
+def sample_chat_chunks(model: str, content: str = "スタブのアドバイスです。") -> list:
+    """stream=True のときの chunk（1文字ずつ＋最後に usage だけの chunk）"""
+    base = {"id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": int(time.time()), "model": model}
+    chunks = [{**base, "choices": [{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}]}]
+    chunks += [{**base, "choices": [{"index": 0, "delta": {"content": c}, "finish_reason": None}]} for c in content]
+    chunks.append({**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+    chunks.append({**base, "choices": [], "usage": {"prompt_tokens": 100, "completion_tokens": len(content), "total_tokens": 100 + len(content)}})
+    return chunks
+
+
+def sample_task_list() -> str:
+    """構造化出力（response_format）を指定されたときに返すタスク一覧の JSON"""
+    tomorrow = (datetime.now().date() + timedelta(days=1)).isoformat()
+    return json.dumps({"tasks": [
+        {"title": "レポート作成", "memo": "MBAの課題", "priority": 4, "duration_minutes": 120, "deadline": tomorrow},
+        {"title": "牛乳を買う", "memo": "", "priority": 2, "duration_minutes": 15, "deadline": None},
+    ]}, ensure_ascii=False)
+
+
+class _QuietServer(ThreadingHTTPServer):
+    def handle_error(self, request, client_address):
+        # タイムアウトしたクライアントが先に切断した場合は出力しない
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class StubServer:
+    """天気APIと OpenAI chat completions を返すスレッド実行の HTTP サーバ"""
+
+    def __init__(self, delay: float = 0.0, fail_every: int = 0):
+        self.delay = delay
+        self.fail_every = fail_every
+        self.requests = 0
+        self.connections = 0  # 受け付けた TCP 接続の数（keep-alive の確認用）
+        self._lock = threading.Lock()
+        self._server = _QuietServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "StubServer":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _next_request(self) -> int:
+        with self._lock:
+            self.requests += 1
+            return self.requests
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive（本文は Content-Length 付き、ストリームは送信後に切断）
+            disable_nagle_algorithm = True  # ヘッダと本文を別々に書くため、遅延 ACK 待ちを避ける
+
+            def setup(self):
+                super().setup()
+                with stub._lock:
+                    stub.connections += 1
+
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, status: int, body: dict):
+                data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _reply_stream(self, chunks: list):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                for chunk in chunks:
+                    self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                self.wfile.write(b"data: [DONE]\n\n")
+
+            def _prepare(self) -> bool:
+                n = stub._next_request()
+                if stub.delay:
+                    time.sleep(stub.delay)
+                if stub.fail_every and n % stub.fail_every == 0:
+                    self._reply(503, {"error": {"message": "stub failure", "type": "server_error"}})
+                    return False
+                return True
+
+            def do_GET(self):
+                if not self._prepare():
+                    return
+                prefix = "/api/forecast/city/"
+                if self.path.startswith(prefix):
+                    self._reply(200, sample_forecast(self.path[len(prefix):]))
+                else:
+                    self._reply(404, {"error": "not found"})
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}")
+                if not self._prepare():
+                    return
+                if self.path.endswith("/chat/completions"):
+                    model = body.get("model", "stub")
+                    content = sample_task_list() if body.get("response_format") else "スタブのアドバイスです。"
+                    if body.get("stream"):
+                        self._reply_stream(sample_chat_chunks(model, content))
+                    else:
+                        self._reply(200, sample_chat_completion(model, content))
+                else:
+                    self._reply(404, {"error": {"message": "not found"}})
+
+        return Handler
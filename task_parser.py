@@ -0,0 +1,334 @@
+from __future__ import annotations
+import calendar
+import datetime
+import json
+import re
+import unicodedata
+
+import profiler
+
+# =========================
+# 音声入力から得たタスク情報の解析
+# =========================
+# extract_tasks() は書き起こし1件から複数のタスクを JSON スキーマ指定の構造化出力で1回の API 呼び出しで取り出す。
+# モデルの出力は parse_tasks_json() で検証・正規化する（締切日は parse_deadline() で補正）。
+# 短い口述（「明日までにレポート、1時間半、至急」など）は parse_local() がルールで読み取り、
+# 確信度が LOCAL_CONFIDENCE 以上なら API を呼ばない。
+
+EXTRACT_MODEL = "gpt-4o-mini"
+DEFAULT_PRIORITY = 3
+DEFAULT_DURATION = 60
+MAX_DURATION = 300  # 入力フォームのスライダーの上限（分）
+LOCAL_CONFIDENCE = 0.8  # これ以上ならローカルの解析結果をそのまま使う
+
+TASK_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "tasks": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "title": {"type": "string", "description": "タスク名（短く）"},
+                    "memo": {"type": "string", "description": "メモ・内容（無ければ空文字）"},
+                    "priority": {"type": "integer", "description": "優先度 1〜5（5 が最も高い）"},
+                    "duration_minutes": {"type": "integer", "description": "目安時間（分）"},
+                    "deadline": {"type": ["string", "null"], "description": "しめきり（YYYY-MM-DD、無ければ null）"},
+                },
+                "required": ["title", "memo", "priority", "duration_minutes", "deadline"],
+                "additionalProperties": False,
+            },
+        },
+    },
+    "required": ["tasks"],
+    "additionalProperties": False,
+}
+
+RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {"name": "task_list", "strict": True, "schema": TASK_SCHEMA},
+}
+
+
+def parse_deadline(raw: str, today: datetime.date) -> datetime.date | None:
+    """LLM が出力した締切日（YYYY-MM-DD / MM-DD / MM月DD日 / DD）を日付に変換
+
+    読めない形式や、13月・2月30日・0日のようにありえない日付は None。
+    """
+    try:
+        return _parse_deadline(raw, today)
+    except (ValueError, OverflowError):  # calendar.IllegalMonthError も ValueError
+        return None
+
+
+def _parse_deadline(raw: str, today: datetime.date) -> datetime.date | None:
+    s = (raw or "").strip()
+    if not s:
+        return None
+
+    # 日本語の「まで」などを除去
+    s = s.replace("までに", "").replace("まで", "").strip()
+    if s.endswith("日"):
+        s = s[:-1].strip()
+
+    # パターン1: YYYY-MM-DD
+    try:
+        return datetime.date.fromisoformat(s)
+    except ValueError:
+        if re.fullmatch(r'\d{4}-\d{1,2}-\d{1,2}', s):
+            raise  # 2025-02-30 など（MM-DD として読み直さない）
+
+    # パターン2: MM-DD
+    m = re.fullmatch(r'(\d{1,2})-(\d{1,2})', s)
+    if m:
+        month, day = map(int, m.groups())
+        last_day = calendar.monthrange(today.year, month)[1]
+        return datetime.date(today.year, month, min(day, last_day))
+
+    # パターン3: MM月DD日
+    m = re.fullmatch(r'(\d{1,2})月(\d{1,2})', s)
+    if m:
+        month, day = map(int, m.groups())
+        last_day = calendar.monthrange(today.year, month)[1]
+        return datetime.date(today.year, month, min(day, last_day))
+
+    # パターン4: DD（日にちだけ）
+    if s.isdigit():
+        day = int(s)
+        if day < 1:
+            return None
+        year, month = today.year, today.month
+        if day >= today.day:  # 今月
+            last_day = calendar.monthrange(year, month)[1]
+            return datetime.date(year, month, min(day, last_day))
+        # 来月
+        month += 1
+        if month == 13:
+            month = 1
+            year += 1
+        last_day = calendar.monthrange(year, month)[1]
+        return datetime.date(year, month, min(day, last_day))
+
+    return None
+
+
+def build_extract_messages(transcript: str, today: datetime.date) -> list:
+    """タスク抽出のプロンプト（chat completions の messages）"""
+    weekday = "月火水木金土日"[today.weekday()]
+    return [
+        {
+            "role": "system",
+            "content": (
+                "音声の書き起こしから、やるべきタスクをすべて抜き出してください。"
+                f"今日は{today.isoformat()}（{weekday}）です。"
+                "しめきりは YYYY-MM-DD 形式にしてください。"
+                f"「25日まで」のように日にちだけの場合は{today.year}-{today.month:02d}-25 とし、過ぎていれば翌月の日付にします。"
+                "しめきりが無いタスクは null にしてください。"
+                "優先度は 1〜5（5 が最も高い）、目安時間は分で答えてください。"
+            ),
+        },
+        {"role": "user", "content": transcript},
+    ]
+
+
+def _to_int(value, default: int, low: int, high: int) -> int:
+    try:
+        number = int(round(float(value)))
+    except (TypeError, ValueError):
+        return default
+    return min(max(number, low), high)
+
+
+def _to_deadline(value, today: datetime.date) -> datetime.date | None:
+    if value is None or value != value:  # None / NaN / NaT
+        return None
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    return parse_deadline(str(value), today)
+
+
+def normalize_task(item: dict, today: datetime.date) -> dict | None:
+    """タスク1件を検証・正規化する（タスク名が空なら None）
+
+    priority は 1〜5、duration は 0〜MAX_DURATION 分に丸め、読めなければ既定値にする。
+    deadline は date / ISO 形式 / parse_deadline() が読める形式を受け付け、読めなければ None。
+    """
+    title = item.get("title")
+    title = "" if title is None or title != title else str(title).strip()
+    if not title:
+        return None
+    memo = item.get("memo")
+    return {
+        "title": title,
+        "memo": "" if memo is None or memo != memo else str(memo).strip(),
+        "priority": _to_int(item.get("priority"), DEFAULT_PRIORITY, 1, 5),
+        "duration": _to_int(item.get("duration"), DEFAULT_DURATION, 0, MAX_DURATION),
+        "deadline": _to_deadline(item.get("deadline"), today),
+    }
+
+
+def parse_tasks_json(raw: str, today: datetime.date) -> list:
+    """構造化出力の JSON を検証し、normalize_task() 済みのタスクのリストを返す
+
+    タスク名が空の要素は捨てる。JSON として読めなければ ValueError。
+    """
+    data = json.loads(raw)
+    items = data.get("tasks", []) if isinstance(data, dict) else data
+    if not isinstance(items, list):
+        raise ValueError("tasks は配列で指定してください")
+
+    tasks = []
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        task = normalize_task({**item, "duration": item.get("duration_minutes")}, today)
+        if task is not None:
+            tasks.append(task)
+    return tasks
+
+
+# ===== ルールベースの解析（API を呼ばない高速経路） =====
+_WEEKDAYS = "月火水木金土日"
+_DEADLINE_SUFFIX = r"(?:中に|中|まで(?:に)?|が?締め?切り?|に|の)?"
+_DURATION_SUFFIX = r"(?:くらい|ぐらい|程度|ほど)?(?:で|かかる)?"
+
+
+def _add_months(day: datetime.date, months: int) -> datetime.date:
+    month_index = day.year * 12 + day.month - 1 + months
+    return datetime.date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def _month_end(day: datetime.date) -> datetime.date:
+    return day.replace(day=calendar.monthrange(day.year, day.month)[1])
+
+
+def _weekday_in_week(today: datetime.date, weeks: int, weekday: str) -> datetime.date:
+    """today の週（月曜始まり）から weeks 週後の weekday 曜日"""
+    monday = today - datetime.timedelta(days=today.weekday())
+    return monday + datetime.timedelta(weeks=weeks, days=_WEEKDAYS.index(weekday))
+
+
+def _next_weekday(today: datetime.date, weekday: str) -> datetime.date:
+    """今日以降で最初の weekday 曜日"""
+    return today + datetime.timedelta(days=(_WEEKDAYS.index(weekday) - today.weekday()) % 7)
+
+
+# (正規表現, 締切日を返す関数)。上から順に試し、最初に一致したものを使う
+_DEADLINE_RULES = [
+    (r"(\d{4})[-/年](\d{1,2})[-/月](\d{1,2})日?",
+     lambda m, today: datetime.date(*map(int, m.groups()))),
+    (r"来月末", lambda m, today: _month_end(_add_months(today, 1))),
+    (r"(?:今月)?月末", lambda m, today: _month_end(today)),
+    (r"(再来週|来週|今週)の?([月火水木金土日])曜日?",
+     lambda m, today: _weekday_in_week(today, {"今週": 0, "来週": 1, "再来週": 2}[m[1]], m[2])),
+    (r"([月火水木金土日])曜日?", lambda m, today: _next_weekday(today, m[1])),
+    (r"(\d{1,2})月(\d{1,2})日", lambda m, today: parse_deadline(f"{m[1]}月{m[2]}日", today)),
+    (r"(\d{1,2})/(\d{1,2})", lambda m, today: parse_deadline(f"{m[1]}-{m[2]}", today)),
+    (r"(\d+)週間後", lambda m, today: today + datetime.timedelta(weeks=int(m[1]))),
+    (r"(\d+)日後", lambda m, today: today + datetime.timedelta(days=int(m[1]))),
+    (r"しあさって|明々後日", lambda m, today: today + datetime.timedelta(days=3)),
+    (r"明後日|あさって", lambda m, today: today + datetime.timedelta(days=2)),
+    (r"明日|あした", lambda m, today: today + datetime.timedelta(days=1)),
+    (r"今日|きょう|本日", lambda m, today: today),
+    (r"(\d{1,2})日(?=まで)", lambda m, today: parse_deadline(m[1], today)),
+]
+
+# (正規表現, 分を返す関数)
+_DURATION_RULES = [
+    (r"(\d+)時間半", lambda m: int(m[1]) * 60 + 30),
+    (r"(\d+)時間(\d+)分", lambda m: int(m[1]) * 60 + int(m[2])),
+    (r"(\d+(?:\.\d+)?)時間", lambda m: round(float(m[1]) * 60)),
+    (r"(\d+)分", lambda m: int(m[1])),
+]
+
+# (語, 優先度)。長い語から順に並べる
+_PRIORITY_WORDS = [
+    ("大至急", 5), ("最優先", 5), ("至急", 5),
+    ("急いで", 4), ("急ぎ", 4), ("早めに", 4), ("重要", 4),
+    ("急がない", 2), ("時間があるとき", 1), ("暇なとき", 1), ("いつでも", 1),
+]
+
+# 複数のタスクを言っていそうな接続語（この場合はローカルで扱わない）
+_MULTI_TASK = re.compile(r"それと|それから|あと|次に|ついでに|および|及び")
+# タイトルに残っていたら読み取れていない日時表現
+_UNRESOLVED = re.compile(r"\d|再来週|来週|今週|来月|今月|週末|曜|まで")
+_TITLE_TAIL = re.compile(r"(?:を)?(?:やります|します|やる|する|しなきゃ|しないと|やらなきゃ|やらないと|こと)$")
+
+
+def _take(text: str, rules, suffix: str = ""):
+    """最初に一致した規則の値、その部分を取り除いた文字列、一致したかを返す
+
+    一致したが値にできない場合（13月5日・2月30日・0日など）は値を None にする。
+    """
+    for pattern, convert in rules:
+        m = re.search(f"(?:{pattern}){suffix}", text)
+        if m:
+            try:
+                value = convert(m)
+            except (ValueError, OverflowError):  # calendar.IllegalMonthError も ValueError
+                value = None
+            return value, text[:m.start()] + "、" + text[m.end():], True
+    return None, text, False
+
+
+def parse_local(text: str, today: datetime.date) -> tuple:
+    """書き起こしをルールで読み取り、(タスクのリスト, 確信度 0〜1) を返す
+
+    1件のタスクだけを対象にし、複数のタスクを含みそうな文や読み取れない日時表現が残る場合は確信度を下げる。
+    """
+    text = unicodedata.normalize("NFKC", text or "").strip()
+    if not text or _MULTI_TASK.search(text):
+        return [], 0.0
+
+    deadline, rest, deadline_said = _take(
+        text, [(p, lambda m, f=f: f(m, today)) for p, f in _DEADLINE_RULES], _DEADLINE_SUFFIX
+    )
+    duration, rest, duration_said = _take(rest, _DURATION_RULES, _DURATION_SUFFIX)
+    priority = DEFAULT_PRIORITY
+    for word, value in _PRIORITY_WORDS:
+        if word in rest:
+            priority = value
+            rest = re.sub(re.escape(word) + r"(?:で|の)?", "、", rest, count=1)
+            break
+
+    title = re.sub(r"[、,。.!！?？\s]+", " ", rest).strip(" をはにで")
+    title = _TITLE_TAIL.sub("", title).strip()
+    if not title:
+        return [], 0.0
+
+    confidence = 1.0
+    if deadline is None:
+        confidence -= 0.3
+    if duration is None:
+        confidence -= 0.1
+    if len(title) > 20:
+        confidence -= 0.3
+    if _UNRESOLVED.search(title) or (deadline_said and deadline is None) or (duration_said and duration is None):
+        confidence -= 0.4  # 読み取れない日時表現がある
+    task = normalize_task({"title": title, "memo": "", "priority": priority, "duration": duration, "deadline": deadline}, today)
+    return [task], round(max(confidence, 0.0), 2)
+
+
+def extract_tasks(client, transcript: str, today: datetime.date, model: str = EXTRACT_MODEL,
+                  min_confidence: float = LOCAL_CONFIDENCE) -> list:
+    """書き起こしからタスクをまとめて取り出す
+
+    parse_local() の確信度が min_confidence 以上ならその結果を返し、API は呼ばない。
+    それ以外は構造化出力で1回だけ API を呼ぶ。
+    """
+    tasks, confidence = parse_local(transcript, today)
+    if confidence >= min_confidence:
+        return tasks
+    with profiler.span("openai.extract_tasks", model=model):
+        response = client.chat.completions.create(
+            model=model,
+            messages=build_extract_messages(transcript, today),
+            response_format=RESPONSE_FORMAT,
+        )
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            profiler.annotate(tokens=usage.total_tokens)
+    return parse_tasks_json(response.choices[0].message.content, today)
+
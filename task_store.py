@@ -0,0 +1,223 @@
+from __future__ import annotations
+import datetime
+import pandas as pd
+
+from db import connection
+import migrations
+
+# =========================
+# タスク保存（time_household.db の tasks テーブル）
+# =========================
+# atsuryoku2.py が読む tasks テーブルと同じスキーマ。
+# 登録は1行 INSERT のみなので、件数が増えても登録コストは変わらない。
+
+DB_FILE = "time_household.db"
+DEFAULT_USER_ID = 1  # ログイン連携までの仮固定
+PAGE_SIZE = 50
+
+# 表示用の列名
+DISPLAY_COLUMNS = {
+    "title": "タスク",
+    "content": "メモ",
+    "priority": "優先度",
+    "estimated_time": "所要時間",
+    "deadline": "締切日",
+}
+
+
+# ----- スキーマのマイグレーション（migrations.py で版管理） -----
+def _create_tables(conn):
+    """生活設定（user_settings）とタスク（tasks）のテーブル"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS user_settings (
+            user_id INTEGER PRIMARY KEY,
+            weekday_wake_time TEXT,
+            weekday_sleep_time TEXT,
+            weekend_wake_time TEXT,
+            weekend_sleep_time TEXT,
+            weekday_work_start TEXT,
+            weekday_work_end TEXT
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS tasks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            title TEXT,
+            category TEXT,
+            content TEXT,
+            deadline TEXT,
+            priority INTEGER,
+            estimated_time INTEGER,
+            progress_time INTEGER DEFAULT 0,
+            progress_sessions INTEGER DEFAULT 0,
+            completed INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+def _add_task_indexes(conn):
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_tasks_user_deadline ON tasks(user_id, completed, deadline, priority DESC)"
+    )
+
+
+# ----- 締切日別の残り時間集計（tasks のトリガーで差分更新。atsuryoku2.py の圧力スコア用） -----
+_BUCKET_REMAINING = "MAX(0, IFNULL({t}.estimated_time, 0) - IFNULL({t}.progress_time, 0))"
+
+
+def init_pressure_buckets(conn):
+    """集計テーブルと同期トリガーを作成（初回のみ tasks から全件集計）"""
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='task_pressure_buckets'"
+    ).fetchone()
+    add_new = f"""
+            INSERT INTO task_pressure_buckets (user_id, deadline, remaining_minutes, task_count)
+            SELECT new.user_id, new.deadline, {_BUCKET_REMAINING.format(t="new")}, 1
+            WHERE new.completed = 0 AND new.deadline IS NOT NULL
+            ON CONFLICT (user_id, deadline) DO UPDATE SET
+                remaining_minutes = remaining_minutes + excluded.remaining_minutes,
+                task_count = task_count + 1;"""
+    remove_old = f"""
+            UPDATE task_pressure_buckets SET
+                remaining_minutes = remaining_minutes - {_BUCKET_REMAINING.format(t="old")},
+                task_count = task_count - 1
+            WHERE old.completed = 0 AND user_id = old.user_id AND deadline = old.deadline;
+            DELETE FROM task_pressure_buckets
+            WHERE user_id = old.user_id AND deadline = old.deadline AND task_count <= 0;"""
+    # マイグレーションのトランザクションの中で呼ばれるため、executescript（途中で COMMIT する）は使わない
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS task_pressure_buckets (
+            user_id INTEGER NOT NULL,
+            deadline TEXT NOT NULL,
+            remaining_minutes REAL NOT NULL DEFAULT 0,
+            task_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, deadline)
+        ) WITHOUT ROWID
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS task_pressure_ai AFTER INSERT ON tasks BEGIN{add_new}
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS task_pressure_ad AFTER DELETE ON tasks BEGIN{remove_old}
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS task_pressure_au
+        AFTER UPDATE OF user_id, deadline, estimated_time, progress_time, completed ON tasks BEGIN{remove_old}{add_new}
+        END
+    """)
+    if not exists:
+        _fill_pressure_buckets(conn)
+
+
+def _fill_pressure_buckets(conn):
+    conn.execute("DELETE FROM task_pressure_buckets")
+    conn.execute(f"""
+        INSERT INTO task_pressure_buckets (user_id, deadline, remaining_minutes, task_count)
+        SELECT user_id, deadline, SUM({_BUCKET_REMAINING.format(t="tasks")}), COUNT(*)
+        FROM tasks
+        WHERE completed = 0 AND deadline IS NOT NULL
+        GROUP BY user_id, deadline
+    """)
+
+
+def rebuild_pressure_buckets(conn):
+    """集計テーブルを tasks から作り直す"""
+    with conn:
+        _fill_pressure_buckets(conn)
+
+
+def check_pressure_buckets(conn, repair=False):
+    """集計テーブルと tasks からの再計算結果を比較し、食い違う (user_id, deadline) を返す
+
+    repair=True の場合、食い違いがあれば集計テーブルを作り直す。
+    """
+    mismatches = conn.execute(f"""
+        WITH expected AS (
+            SELECT user_id, deadline, SUM({_BUCKET_REMAINING.format(t="tasks")}) AS remaining_minutes, COUNT(*) AS task_count
+            FROM tasks
+            WHERE completed = 0 AND deadline IS NOT NULL
+            GROUP BY user_id, deadline
+        )
+        SELECT e.user_id, e.deadline FROM expected e
+        LEFT JOIN task_pressure_buckets b ON b.user_id = e.user_id AND b.deadline = e.deadline
+        WHERE b.user_id IS NULL OR b.remaining_minutes != e.remaining_minutes OR b.task_count != e.task_count
+        UNION
+        SELECT b.user_id, b.deadline FROM task_pressure_buckets b
+        LEFT JOIN expected e ON e.user_id = b.user_id AND e.deadline = b.deadline
+        WHERE e.user_id IS NULL
+    """).fetchall()
+    if mismatches and repair:
+        rebuild_pressure_buckets(conn)
+    return mismatches
+
+
+MIGRATIONS = [_create_tables, _add_task_indexes, init_pressure_buckets]
+
+
+def init_store():
+    """time_household.db を最新のスキーマにする（適用済みなら版の確認だけ）"""
+    migrations.migrate(DB_FILE, MIGRATIONS)
+
+
+def add_task(title: str, content: str, priority: int, estimated_time: int,
+             deadline: datetime.date | str | None, user_id: int = DEFAULT_USER_ID,
+             category: str = "task") -> int:
+    """タスクを1件登録し、ID を返す"""
+    init_store()
+    if isinstance(deadline, datetime.date):
+        deadline = deadline.isoformat()
+    with connection(DB_FILE) as conn, conn:
+        cur = conn.execute('''
+            INSERT INTO tasks (user_id, title, category, content, deadline, priority, estimated_time)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (user_id, title, category, content, deadline, int(priority), int(estimated_time)))
+    return cur.lastrowid
+
+
+def add_tasks(tasks, user_id: int = DEFAULT_USER_ID, category: str = "task") -> int:
+    """task_parser のタスク dict（title / memo / priority / duration / deadline）を
+    1トランザクションでまとめて登録し、件数を返す"""
+    init_store()
+    rows = [
+        (
+            user_id, t["title"], category, t.get("memo", ""),
+            t["deadline"].isoformat() if isinstance(t.get("deadline"), datetime.date) else t.get("deadline"),
+            int(t["priority"]), int(t["duration"]),
+        )
+        for t in tasks
+    ]
+    with connection(DB_FILE) as conn, conn:
+        conn.executemany('''
+            INSERT INTO tasks (user_id, title, category, content, deadline, priority, estimated_time)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', rows)
+    return len(rows)
+
+
+def count_tasks(user_id: int = DEFAULT_USER_ID) -> int:
+    """未完了タスクの件数"""
+    init_store()
+    with connection(DB_FILE) as conn:
+        return conn.execute(
+            "SELECT COUNT(*) FROM tasks WHERE user_id = ? AND completed = 0", (user_id,)
+        ).fetchone()[0]
+
+
+def get_tasks_page(page: int = 1, page_size: int = PAGE_SIZE, user_id: int = DEFAULT_USER_ID) -> pd.DataFrame:
+    """未完了タスクを締切日・優先度順に1ページ分取得（表示用の列名で返す）"""
+    init_store()
+    with connection(DB_FILE) as conn:
+        df = pd.read_sql_query(
+            f'''
+            SELECT {", ".join(DISPLAY_COLUMNS)} FROM tasks
+            WHERE user_id = ? AND completed = 0
+            ORDER BY deadline, priority DESC
+            LIMIT ? OFFSET ?
+            ''',
+            conn, params=(user_id, page_size, (max(page, 1) - 1) * page_size)
+        )
+    return df.rename(columns=DISPLAY_COLUMNS)
@@ -1,10 +1,24 @@
+import os
 import streamlit as st
-import sqlite3
 import requests
 import openai
 from datetime import datetime, timedelta
 import pandas as pd
 import json
+import tempfile
+
+from db import connection
+import weather_cache
+import weather_client
+import forecast_history
+import advice_cache
+import profiler
+import schedule_io
+import migrations
+import rain_conflicts
+import llm_stream
+import openai_client
+import advice_job
 
 # ページ設定
 st.set_page_config(
@@ -13,11 +27,12 @@ st.set_page_config(
     layout="wide"
 )
 
-# データベース初期化
-def init_database():
-    conn = sqlite3.connect('schedule.db')
-    c = conn.cursor()
-    c.execute('''
+# データベースファイルのパス
+DB_FILE = "schedule.db"
+
+# スキーマのマイグレーション（migrations.py で版管理）
+def _create_schedules(conn):
+    conn.execute('''
         CREATE TABLE IF NOT EXISTS schedules (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             date TEXT,
@@ -30,64 +45,147 @@ def init_database():
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
     ''')
-    conn.commit()
-    conn.close()
+
+DEFAULT_USER_ID = "local"  # ログインしていない（認証を設定していない）場合のユーザー
+
+# 予定の持ち主（ログインしたユーザーのメールアドレス。user_info の email と同じ値）
+# 既存の予定はすべて DEFAULT_USER_ID の持ち物になる
+def _add_user_id(conn):
+    if 'user_id' not in migrations.table_columns(conn, 'schedules'):
+        conn.execute(f"ALTER TABLE schedules ADD COLUMN user_id TEXT NOT NULL DEFAULT '{DEFAULT_USER_ID}'")
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_schedules_user_date_time
+        ON schedules (user_id, date, time)
+    ''')
+
+MIGRATIONS = [_create_schedules, _add_user_id]
+
+# データベース初期化（適用済みなら版の確認だけ）
+@profiler.traced("db.init_database")
+def init_database():
+    migrations.migrate(DB_FILE, MIGRATIONS)
+
+# 現在のユーザー（Google ログイン済みならメールアドレス、それ以外は DEFAULT_USER_ID）
+def current_user_id():
+    try:
+        if st.user.is_logged_in and st.user.email:
+            return st.user.email
+    except (AttributeError, KeyError):
+        pass
+    return DEFAULT_USER_ID
+
+# 予定の検索（すべて user_id で絞り、(user_id, date, time) の索引だけで並び順まで決まる形にする）
+SCHEDULE_QUERIES = {
+    "day": 'SELECT * FROM schedules WHERE user_id = ? AND date = ? ORDER BY time',
+    "range": 'SELECT * FROM schedules WHERE user_id = ? AND date BETWEEN ? AND ? ORDER BY date, time',
+    "all": 'SELECT * FROM schedules WHERE user_id = ? ORDER BY date, time',
+}
 
 # スケジュール追加
-def add_schedule(date, time, event_name, location, outdoor, importance, changeable):
-    conn = sqlite3.connect('schedule.db')
-    c = conn.cursor()
-    c.execute('''
-        INSERT INTO schedules (date, time, event_name, location, outdoor, importance, changeable)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    ''', (date, time, event_name, location, outdoor, importance, changeable))
-    conn.commit()
-    conn.close()
-
-# スケジュール取得
-def get_schedules(date):
-    conn = sqlite3.connect('schedule.db')
-    df = pd.read_sql_query(
-        'SELECT * FROM schedules WHERE date = ? ORDER BY time',
-        conn, params=(date,)
-    )
-    conn.close()
-    return df
+@profiler.traced("db.add_schedule")
+def add_schedule(user_id, date, time, event_name, location, outdoor, importance, changeable):
+    with connection(DB_FILE) as conn, conn:
+        conn.execute('''
+            INSERT INTO schedules (user_id, date, time, event_name, location, outdoor, importance, changeable)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (user_id, date, time, event_name, location, outdoor, importance, changeable))
+
+# スケジュール取得（1日分）
+@profiler.traced("db.get_schedules")
+def get_schedules(user_id, date):
+    with connection(DB_FILE) as conn:
+        return pd.read_sql_query(SCHEDULE_QUERIES["day"], conn, params=(user_id, date))
+
+# スケジュール取得（期間）
+@profiler.traced("db.get_schedules_between")
+def get_schedules_between(user_id, start_date, end_date):
+    with connection(DB_FILE) as conn:
+        return pd.read_sql_query(SCHEDULE_QUERIES["range"], conn, params=(user_id, start_date, end_date))
 
 # 全スケジュール取得
-def get_all_schedules():
-    conn = sqlite3.connect('schedule.db')
-    df = pd.read_sql_query(
-        'SELECT * FROM schedules ORDER BY date, time',
-        conn
-    )
-    conn.close()
-    return df
-
-# スケジュール削除
-def delete_schedule(schedule_id):
-    conn = sqlite3.connect('schedule.db')
-    c = conn.cursor()
-    c.execute('DELETE FROM schedules WHERE id = ?', (schedule_id,))
-    conn.commit()
-    conn.close()
-
-# 天気情報取得（天気.tsukumijima API使用）
+@profiler.traced("db.get_all_schedules")
+def get_all_schedules(user_id):
+    with connection(DB_FILE) as conn:
+        return pd.read_sql_query(SCHEDULE_QUERIES["all"], conn, params=(user_id,))
+
+# スケジュール削除（他のユーザーの予定は消さない）
+@profiler.traced("db.delete_schedule")
+def delete_schedule(user_id, schedule_id):
+    with connection(DB_FILE) as conn, conn:
+        conn.execute('DELETE FROM schedules WHERE id = ? AND user_id = ?', (int(schedule_id), user_id))
+
+# 予定の検索が索引を使っているかの確認（EXPLAIN QUERY PLAN に全件走査・一時ソートが無いこと）
+# 戻り値は問題のあった検索の説明のリスト（空なら全件 OK）
+def check_schedule_query_plans(db_file=None):
+    params = {"day": ("u", "2025-01-01"), "range": ("u", "2025-01-01", "2025-01-31"), "all": ("u",)}
+    problems = []
+    for name, sql in SCHEDULE_QUERIES.items():
+        with connection(db_file or DB_FILE) as conn:
+            details = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params[name])]
+        if not any("idx_schedules_user_date_time" in d for d in details) \
+                or any(d.startswith("SCAN") or "TEMP B-TREE" in d for d in details):
+            problems.append(f"{name}: {' / '.join(details)}")
+    return problems
+
+# スケジュールをファイルに書き出す（ダウンロードボタン押下時に実行）
+def export_schedules_file(user_id, fmt):
+    with tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024) as f:
+        schedule_io.export_schedules(f, DB_FILE, user_id, fmt)
+        f.seek(0)
+        return f.read()
+
+# 天気APIのベースURL（ローカルのスタブサーバに向ける場合は環境変数で指定）
+WEATHER_API_BASE = os.getenv("WEATHER_API_BASE", "https://weather.tsukumijima.net")
+
+# 天気APIからJSONを取得（タイムアウト・接続の使い回し・サーキットブレーカーは weather_client.py）
+# 取得した予報は forecast_history に履歴として残す
+@profiler.traced("http.weather")
+def fetch_weather_json(city_code):
+    data = weather_client.fetch_forecast(city_code, WEATHER_API_BASE)
+    forecast_history.record(city_code, data)
+    return data
+
+# 表示する日（今日から何日後か）とその見出し
+FORECAST_DATE_LABELS = {1: "明日", 2: "明後日"}
+# これより前の発表は「最新の予報を取得できなかった」ものとして注意を出す（発表は1日3回）
+FORECAST_STALE_HOURS = 12
+
+# 発表時刻（publicTime）が FORECAST_STALE_HOURS より古いか
+def is_stale_forecast(data):
+    try:
+        issued = datetime.fromisoformat(data['publicTime'])
+    except (KeyError, TypeError, ValueError):
+        return False
+    now = datetime.now(issued.tzinfo) if issued.tzinfo else datetime.now()
+    return now - issued > timedelta(hours=FORECAST_STALE_HOURS)
+
+# 天気情報取得（天気.tsukumijima API使用、都市ごとにキャッシュ）
+@profiler.traced("weather.get_weather_forecast")
 def get_weather_forecast(city_code="130010"):  # 130010は東京のコード
     try:
-        url = f"https://weather.tsukumijima.net/api/forecast/city/{city_code}"
-        response = requests.get(url)
-        data = response.json()
+        try:
+            data = weather_cache.get_forecast_payload(city_code, fetch_weather_json)
+        except requests.RequestException:
+            # キャッシュにも無い場合は、履歴に残っている最後の発表を使う
+            data = forecast_history.latest_payload(city_code)
+            if data is None:
+                raise
+            stale = True
+        else:
+            # 取得に失敗してキャッシュの古い予報が返ってきた場合
+            stale = is_stale_forecast(data)
+        if stale:
+            st.warning(f"最新の天気予報を取得できなかったため、{data['publicTime']} 発表の予報を表示しています。")
         
         forecasts = []
         today = datetime.now().date()
         
-        # 今日、明日、明後日の予報を取得
+        # 明日、明後日の予報を取得（発表日が古くても日付は予報自身の date で決める）
         for i, forecast in enumerate(data['forecasts']):
-            if i == 0:  # 今日はスキップ
-                continue
-            elif i <= 2:  # 明日と明後日
-                forecast_date = today + timedelta(days=i)
+            forecast_date = datetime.strptime(forecast['date'], '%Y-%m-%d').date() if forecast.get('date') \
+                else today + timedelta(days=i)
+            days_ahead = (forecast_date - today).days
+            if days_ahead in FORECAST_DATE_LABELS:
                 
                 # 降水確率を取得（時間帯別の平均）
                 rain_probs = []
@@ -110,7 +208,7 @@ def get_weather_forecast(city_code="130010"):  # 130010は東京のコード
                 
                 forecasts.append({
                     'date': forecast_date.strftime('%Y-%m-%d'),
-                    'date_label': forecast['dateLabel'],
+                    'date_label': FORECAST_DATE_LABELS[days_ahead],
                     'weather': forecast['telop'],
                     'detail': forecast['detail']['weather'] if forecast['detail'] and forecast['detail']['weather'] else forecast['telop'],
                     'temp_info': temp_info,
@@ -125,39 +223,50 @@ def get_weather_forecast(city_code="130010"):  # 130010は東京のコード
         st.error(f"天気情報の取得に失敗しました: {e}")
         return []
 
-# ChatGPT APIでアドバイス生成
-def generate_schedule_advice(schedules, weather_info, api_key):
-    try:
-        client = openai.OpenAI(api_key=api_key)
-        
-        # プロンプト作成
-        schedule_text = ""
-        for _, schedule in schedules.iterrows():
-            outdoor_text = "屋外" if schedule['outdoor'] else "屋内"
-            importance_text = f"重要度{schedule['importance']}/5"
-            changeable_text = "変更可能" if schedule['changeable'] else "変更不可"
-            schedule_text += f"- {schedule['time']} {schedule['event_name']} ({schedule['location']}, {outdoor_text}, {importance_text}, {changeable_text})\n"
-        
-        weather_text = ""
-        for weather in weather_info:
-            rain_status = "雨予報" if weather['rain'] else "晴れ予報"
-            weather_text += f"{weather['date']} ({weather['date_label']}): {weather['weather']} - {rain_status}\n"
-            if weather['rain_by_time']:
-                weather_text += "  時間帯別降水確率: "
-                time_probs = []
-                for time_period, prob in weather['rain_by_time'].items():
-                    if prob and prob != '--%':
-                        period_name = {
-                            'T00_06': '00-06時',
-                            'T06_12': '06-12時', 
-                            'T12_18': '12-18時',
-                            'T18_24': '18-24時'
-                        }.get(time_period, time_period)
-                        time_probs.append(f"{period_name}:{prob}")
-                weather_text += ", ".join(time_probs) + "\n"
-        
-        prompt = f"""
-以下のスケジュールと天気予報を確認して、雨予報の日の屋外活動について具体的なアドバイスをお願いします。
+# アドバイス生成に使うモデル設定
+ADVICE_MODEL = "gpt-3.5-turbo"
+ADVICE_TEMPERATURE = 0.7
+ADVICE_MAX_TOKENS = 500
+
+# アドバイスのキャッシュキー（プロンプトに使う項目だけで作る）
+def advice_cache_key(schedules, weather_info):
+    schedule_rows = schedules[['date', 'time', 'event_name', 'location', 'outdoor', 'importance', 'changeable']]
+    return advice_cache.make_key(
+        schedules=sorted(schedule_rows.astype(str).values.tolist()),
+        weather=[
+            {k: weather[k] for k in ('date', 'date_label', 'weather', 'rain', 'rain_by_time')}
+            for weather in weather_info
+        ],
+        model=ADVICE_MODEL,
+        temperature=ADVICE_TEMPERATURE,
+        max_tokens=ADVICE_MAX_TOKENS,
+    )
+
+# アドバイスのプロンプト
+def build_advice_prompt(schedules, weather_info):
+    # プロンプト作成
+    schedule_text = ""
+    for _, schedule in schedules.iterrows():
+        outdoor_text = "屋外" if schedule['outdoor'] else "屋内"
+        importance_text = f"重要度{schedule['importance']}/5"
+        changeable_text = "変更可能" if schedule['changeable'] else "変更不可"
+        schedule_text += f"- {schedule['date']} {schedule['time']} {schedule['event_name']} ({schedule['location']}, {outdoor_text}, {importance_text}, {changeable_text})\n"
+
+    weather_text = ""
+    for weather in weather_info:
+        rain_status = "雨予報" if weather['rain'] else "晴れ予報"
+        weather_text += f"{weather['date']} ({weather['date_label']}): {weather['weather']} - {rain_status}\n"
+        if weather['rain_by_time']:
+            weather_text += "  時間帯別降水確率: "
+            time_probs = []
+            for time_period, prob in weather['rain_by_time'].items():
+                if prob and prob != '--%':
+                    period_name = rain_conflicts.PERIOD_LABELS.get(time_period, time_period)
+                    time_probs.append(f"{period_name}:{prob}")
+            weather_text += ", ".join(time_probs) + "\n"
+
+    prompt = f"""
+以下は雨の時間帯と重なる屋外の予定（重要度の高い順）です。天気予報を確認して、具体的なアドバイスをお願いします。
 
 【天気予報】
 {weather_text}
@@ -173,28 +282,119 @@ def generate_schedule_advice(schedules, weather_info, api_key):
 
 アドバイスを簡潔にまとめてください。
 """
+    return prompt
 
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=500,
-            temperature=0.7
-        )
-        
-        return response.choices[0].message.content
-    
+# 該当する予定がある日の天気だけをプロンプトに入れる
+def _conflict_weather(schedules, weather_info):
+    return [weather for weather in weather_info if weather['date'] in set(schedules['date'])]
+
+# 雨と重なる予定と天気に対するアドバイスのキー（advice_job で事前に作ったアドバイスが今の予定と同じ入力かの確認にも使う）
+def schedule_advice_key(schedules, weather_info):
+    return advice_cache_key(schedules, _conflict_weather(schedules, weather_info))
+
+# ChatGPT APIでアドバイス生成（同じ入力ならキャッシュから返す。エラーはそのまま投げる）
+def request_schedule_advice(schedules, weather_info, api_key):
+    weather_info = _conflict_weather(schedules, weather_info)
+    cache_key = advice_cache_key(schedules, weather_info)
+    cached = advice_cache.get(cache_key)
+    profiler.annotate(cache_hit=cached is not None)
+    if cached is not None:
+        return cached
+
+    client = openai_client.get_client(api_key)
+    response = client.chat.completions.create(
+        model=ADVICE_MODEL,
+        messages=[{"role": "user", "content": build_advice_prompt(schedules, weather_info)}],
+        max_tokens=ADVICE_MAX_TOKENS,
+        temperature=ADVICE_TEMPERATURE
+    )
+
+    advice = response.choices[0].message.content
+    if response.usage:
+        profiler.annotate(tokens=response.usage.total_tokens)
+    advice_cache.put(cache_key, advice)
+    return advice
+
+# 画面用（エラーはメッセージにして返す）
+# schedules には rain_conflicts.find_conflicts() で絞り込んだ予定だけを渡す
+@profiler.traced("openai.generate_schedule_advice")
+def generate_schedule_advice(schedules, weather_info, api_key):
+    try:
+        return request_schedule_advice(schedules, weather_info, api_key)
+    except openai.OpenAIError as e:
+        return openai_client.describe_error(e)
     except Exception as e:
         return f"アドバイス生成でエラーが発生しました: {e}"
 
+# アドバイスをストリーミングで生成（st.write_stream に渡す）
+# result に first_token_ms / total_ms / cache_hit を書き込む。最後まで受信できた場合だけキャッシュする
+def stream_schedule_advice(schedules, weather_info, api_key, result):
+    result.update(cache_hit=False, first_token_ms=None, total_ms=None)
+    try:
+        weather_info = _conflict_weather(schedules, weather_info)
+        cache_key = advice_cache_key(schedules, weather_info)
+        cached = advice_cache.get(cache_key)
+        profiler.annotate(cache_hit=cached is not None)
+        if cached is not None:
+            result["cache_hit"] = True
+            yield cached
+            return
+
+        client = openai_client.get_client(api_key)
+        yield from llm_stream.stream_chat(
+            client, result,
+            model=ADVICE_MODEL,
+            messages=[{"role": "user", "content": build_advice_prompt(schedules, weather_info)}],
+            max_tokens=ADVICE_MAX_TOKENS,
+            temperature=ADVICE_TEMPERATURE
+        )
+        if result["completed"]:
+            advice_cache.put(cache_key, result["text"])
+
+    except openai.OpenAIError as e:
+        yield openai_client.describe_error(e)
+    except Exception as e:
+        yield f"アドバイス生成でエラーが発生しました: {e}"
+
+# 夜間バッチ（advice_job.py）で作成済みのアドバイス
+# 作成後に予定や予報が変わっていれば（入力キーが違えば）使わない。戻り値は (雨と重なる予定, 保存内容) か None
+def load_precomputed_advice(user_id, city_code, start_date, end_date):
+    saved = advice_job.get_advice(user_id, start_date)
+    if saved is None or saved['city_code'] != city_code:
+        return None
+    weather_info = get_weather_forecast(city_code)
+    if not weather_info:
+        return None
+    conflicts = rain_conflicts.find_conflicts(get_schedules_between(user_id, start_date, end_date), weather_info)
+    if conflicts.empty or schedule_advice_key(conflicts, weather_info) != saved['input_key']:
+        return None
+    return conflicts, saved
+
+# 雨と重なる屋外の予定の表
+def show_conflicts(conflicts):
+    st.subheader("☔ 雨と重なる屋外の予定")
+    st.dataframe(
+        conflicts.assign(
+            period=conflicts['period'].map(rain_conflicts.PERIOD_LABELS),
+            rain_prob=conflicts['rain_prob'].map(lambda p: "雨予報" if pd.isna(p) else f"{p:.0f}%"),
+        )[['date', 'time', 'event_name', 'location', 'importance', 'period', 'rain_prob']].rename(columns={
+            'date': '日付', 'time': '時間', 'event_name': 'イベント', 'location': '場所',
+            'importance': '重要度', 'period': '時間帯', 'rain_prob': '降水確率',
+        }),
+        hide_index=True,
+    )
+
 # メイン アプリケーション
 def main():
     st.title("🌤️ 天気連動スケジュール管理アプリ")
     
     # データベース初期化
     init_database()
+    user_id = current_user_id()
     
     # サイドバーで都市設定
     st.sidebar.header("⚙️ 設定")
+    st.sidebar.caption(f"ユーザー: {user_id}")
     
     # 都市選択
     city_options = {
@@ -217,7 +417,7 @@ def main():
     # タブ作成
     tab1, tab2, tab3, tab4 = st.tabs(["📅 スケジュール追加", "📋 スケジュール一覧", "🌦️ 天気予報", "🤖 AIアドバイス"])
     
-    with tab1:
+    with tab1, profiler.span("render.スケジュール追加"):
         st.header("スケジュール追加")
         
         col1, col2 = st.columns(2)
@@ -236,6 +436,7 @@ def main():
         if st.button("スケジュール追加"):
             if event_name and location:
                 add_schedule(
+                    user_id,
                     date.strftime('%Y-%m-%d'),
                     time.strftime('%H:%M'),
                     event_name,
@@ -249,10 +450,61 @@ def main():
             else:
                 st.error("イベント名と場所を入力してください。")
     
-    with tab2:
+    with tab2, profiler.span("render.スケジュール一覧"):
         st.header("スケジュール一覧")
         
-        schedules_df = get_all_schedules()
+        # 一括インポート / エクスポート
+        with st.expander("📦 一括インポート / エクスポート（CSV・Parquet）"):
+            st.caption(
+                "列: " + ", ".join(schedule_io.COLUMNS)
+                + "（date は YYYY-MM-DD、time は HH:MM、outdoor / changeable は 1/0、importance は 1〜5）"
+            )
+            uploaded = st.file_uploader("インポートするファイル", type=["csv", "parquet"])
+            if uploaded is not None and st.button("インポート実行"):
+                fmt = "parquet" if uploaded.name.lower().endswith(".parquet") else "csv"
+                progress = st.progress(0.0, text="インポート中...")
+
+                def on_progress(done, total):
+                    ratio = min(done / total, 1.0) if total else 0.0
+                    progress.progress(ratio, text=f"{done:,}行 処理済み")
+
+                try:
+                    uploaded.seek(0)
+                    total = schedule_io.count_rows(uploaded, fmt)
+                    uploaded.seek(0)
+                    result = schedule_io.import_schedules(
+                        uploaded, DB_FILE, user_id, fmt, on_progress=on_progress, total=total
+                    )
+                except schedule_io.ScheduleImportAborted as e:
+                    st.error(
+                        f"インポートが途中で失敗しました: {e}\n\n"
+                        f"{e.processed:,}行目までの {e.inserted:,}件は登録済みです。"
+                        f"再インポートする場合は {e.processed + 1:,}行目以降だけにしてください。"
+                    )
+                except Exception as e:
+                    st.error(f"インポートに失敗しました: {e}")
+                else:
+                    progress.progress(1.0, text="完了")
+                    st.success(f"{result['inserted']:,}件を登録しました（スキップした行: {result['rejected']:,}件）")
+                    if result['errors']:
+                        st.dataframe(
+                            pd.DataFrame(result['errors'], columns=['行', 'エラー']),
+                            hide_index=True, use_container_width=True
+                        )
+
+            col_csv, col_parquet = st.columns(2)
+            with col_csv:
+                st.download_button(
+                    "CSVでエクスポート", data=lambda: export_schedules_file(user_id, "csv"),
+                    file_name="schedules.csv", mime="text/csv"
+                )
+            with col_parquet:
+                st.download_button(
+                    "Parquetでエクスポート", data=lambda: export_schedules_file(user_id, "parquet"),
+                    file_name="schedules.parquet", mime="application/octet-stream"
+                )
+        
+        schedules_df = get_all_schedules(user_id)
         
         if not schedules_df.empty:
             # 表示用にデータを整形
@@ -282,13 +534,13 @@ def main():
             if selected_delete != "選択してください":
                 selected_id = schedules_df.iloc[delete_options.index(selected_delete)]['id']
                 if st.button("削除実行"):
-                    delete_schedule(selected_id)
+                    delete_schedule(user_id, selected_id)
                     st.success("スケジュールを削除しました！")
                     st.rerun()
         else:
             st.info("スケジュールが登録されていません。")
     
-    with tab3:
+    with tab3, profiler.span("render.天気予報"):
         st.header("天気予報")
         
         weather_forecasts = get_weather_forecast(city_code)
@@ -333,38 +585,71 @@ def main():
                             st.success("☀️ 良い天気の予報です")
                     
                     st.write("---")
+
+            # 発表ごとの降水確率の推移（forecast_history に保存した予報から）
+            with st.expander("📈 降水確率の推移（発表ごと）"):
+                target_date = st.selectbox(
+                    "対象日", [forecast['date'] for forecast in weather_forecasts], key="history_target_date"
+                )
+                revisions = forecast_history.get_revisions(city_code, target_date)
+                if len(revisions) > 1:
+                    st.line_chart(revisions.rename(columns=rain_conflicts.PERIOD_LABELS))
+                else:
+                    st.caption("発表が2回以上記録されると推移を表示します。")
         else:
             st.error("天気情報を取得できませんでした。しばらく時間をおいてからお試しください。")
     
-    with tab4:
+    with tab4, profiler.span("render.AIアドバイス"):
         st.header("AIスケジュールアドバイス")
+        tomorrow = (datetime.now() + timedelta(days=1)).date()
+        day_after_tomorrow = (datetime.now() + timedelta(days=2)).date()
+
+        # 夜間バッチで作成済みのアドバイスがあればすぐに表示する
+        precomputed = load_precomputed_advice(
+            user_id, city_code, tomorrow.strftime('%Y-%m-%d'), day_after_tomorrow.strftime('%Y-%m-%d')
+        )
+        if precomputed is not None:
+            saved_conflicts, saved = precomputed
+            show_conflicts(saved_conflicts)
+            st.subheader("🤖 AIからのアドバイス")
+            st.markdown(saved['advice'])
+            st.caption(f"{datetime.fromtimestamp(saved['created_at']):%m/%d %H:%M} に作成したアドバイスです")
         
         if openai_api_key:
             if st.button("AIアドバイスを取得"):
+                conflicts = None
                 with st.spinner("分析中..."):
                     # 明日・明後日のスケジュール取得
-                    tomorrow = (datetime.now() + timedelta(days=1)).date()
-                    day_after_tomorrow = (datetime.now() + timedelta(days=2)).date()
-                    
-                    tomorrow_schedules = get_schedules(tomorrow.strftime('%Y-%m-%d'))
-                    day_after_schedules = get_schedules(day_after_tomorrow.strftime('%Y-%m-%d'))
-                    
-                    all_schedules = pd.concat([tomorrow_schedules, day_after_schedules], ignore_index=True)
+                    all_schedules = get_schedules_between(
+                        user_id, tomorrow.strftime('%Y-%m-%d'), day_after_tomorrow.strftime('%Y-%m-%d')
+                    )
                     
                     if not all_schedules.empty:
                         # 天気情報取得
                         weather_info = get_weather_forecast(city_code)
                         
                         if weather_info:
-                            # AIアドバイス生成
-                            advice = generate_schedule_advice(all_schedules, weather_info, openai_api_key)
-                            
-                            st.subheader("🤖 AIからのアドバイス")
-                            st.write(advice)
+                            # 雨と重なる屋外の予定をローカルで判定し、該当がある場合だけAIに聞く
+                            conflicts = rain_conflicts.find_conflicts(all_schedules, weather_info)
+                            if conflicts.empty:
+                                st.success("☀️ 雨と重なる屋外の予定（変更可能なもの）はありません。")
+                            else:
+                                show_conflicts(conflicts)
                         else:
                             st.error("天気情報の取得に失敗しました。")
                     else:
                         st.info("明日・明後日のスケジュールが登録されていません。")
+
+                # AIアドバイス生成（該当する予定だけを渡し、届いた順に表示する）
+                if conflicts is not None and not conflicts.empty:
+                    st.subheader("🤖 AIからのアドバイス")
+                    stream_result = {}
+                    with profiler.span("openai.stream_schedule_advice"):
+                        st.write_stream(stream_schedule_advice(conflicts, weather_info, openai_api_key, stream_result))
+                    if stream_result["cache_hit"]:
+                        st.caption("保存済みのアドバイスを表示しています")
+                    elif stream_result["first_token_ms"] is not None:
+                        st.caption(f"最初の応答まで {stream_result['first_token_ms']:.0f} ms / 全体 {stream_result['total_ms']:.0f} ms")
         else:
             st.info("AIアドバイスを利用するには、OpenAI API Keyを入力してください。")
             
@@ -390,4 +675,9 @@ def main():
                 st.write(f"{rain_icon} {weather['date_label']}: {weather['weather']} (平均降水確率: {weather['rain_prob']:.0f}%)")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    profiler.start_rerun("tenki")
+    # st.rerun() は例外で再実行するため、finally で必ずトレースを閉じる
+    try:
+        main()
+    finally:
+        profiler.finish_rerun()
\ No newline at end of file
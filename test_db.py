@@ -0,0 +1,78 @@
+import threading
+
+import pytest
+
+import db
+
+# =========================
+# db の接続プールの確認（python -m pytest test_db.py）
+# =========================
+
+
+@pytest.fixture
+def db_file(tmp_path):
+    path = str(tmp_path / "pool.db")
+    yield path
+    db.close_connection(path)
+
+
+def _in_thread(target):
+    result = []
+    thread = threading.Thread(target=lambda: result.append(target()))
+    thread.start()
+    thread.join()
+    return result[0]
+
+
+def test_threads_in_a_row_reuse_one_connection(db_file):
+    def borrow():
+        with db.connection(db_file) as conn:
+            conn.execute("SELECT 1").fetchone()
+            return conn
+
+    before = db.connection_stats()
+    first = _in_thread(borrow)
+    second = _in_thread(borrow)
+    after = db.connection_stats()
+    assert first is second
+    assert after["opens"] - before["opens"] == 1
+    assert after["reuses"] - before["reuses"] == 1
+
+
+def test_uncommitted_changes_are_rolled_back_on_return(db_file):
+    with db.connection(db_file) as conn, conn:
+        conn.execute("CREATE TABLE t (x INTEGER)")
+    with db.connection(db_file) as conn:
+        conn.execute("INSERT INTO t VALUES (1)")
+    with db.connection(db_file) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 0
+
+
+def test_pool_is_bounded(db_file, monkeypatch):
+    monkeypatch.setattr(db, "POOL_SIZE", 2)
+    db.close_connection(db_file)
+    held = threading.Event()
+    release = threading.Event()
+
+    def hold():
+        with db.connection(db_file), db.connection(db_file):
+            held.set()
+            release.wait(5)
+
+    holder = threading.Thread(target=hold)
+    holder.start()
+    held.wait(5)
+    borrowed = []
+
+    def borrow():
+        with db.connection(db_file) as conn:
+            borrowed.append(conn)
+
+    waiter = threading.Thread(target=borrow)
+    waiter.start()
+    waiter.join(0.2)
+    assert not borrowed  # 2本とも使用中なので返されるまで待つ
+    release.set()
+    holder.join()
+    waiter.join(5)
+    assert borrowed
@@ -0,0 +1,58 @@
+import datetime
+import importlib
+import os
+import sqlite3
+
+import pytest
+
+# =========================
+# diary の検索の確認（python -m pytest test_diary.py）
+# =========================
+# diary.py はページのモジュールなので、一時ディレクトリで読み込んで DB もそこに作る
+
+
+@pytest.fixture
+def diary(tmp_path):
+    cwd = os.getcwd()
+    os.chdir(tmp_path)
+    try:
+        module = importlib.import_module("diary")
+    finally:
+        os.chdir(cwd)
+    module.DB_FILE = str(tmp_path / "test_diary.db")
+    module.init_database()
+    return module
+
+
+def _save_days(diary, start, days, content):
+    for offset in range(days):
+        day = start + datetime.timedelta(days=offset)
+        diary.save_diary(day.strftime("%Y年%m月%d日"), content)
+
+
+def test_short_search_uses_date_index(diary):
+    conn = sqlite3.connect(diary.DB_FILE)
+    for word_count in (1, 2):
+        sql = diary.short_search_sql(word_count)
+        params = ("2025-06-01", "2025-06-30", *["%雨%"] * word_count, 20)
+        details = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+        assert any("idx_diary_iso_date" in d for d in details), details
+        assert not any(d.startswith("SCAN diary") for d in details), details
+    conn.close()
+
+
+def test_short_search_stays_in_range(diary):
+    _save_days(diary, datetime.date(2025, 5, 1), 92, "雨の日")
+    results = diary.search_diary("雨", start=datetime.date(2025, 6, 1), end=datetime.date(2025, 6, 30))
+    assert len(results) == 20
+    assert all(date.startswith("2025年06月") for date, _ in results)
+    assert results[0] == ("2025年06月30日", "**雨**の日")
+
+
+def test_search_escapes_markdown(diary):
+    diary.save_diary("2025年06月01日", "*散歩道* <b>公園</b> [link](http://example.com) $1$")
+    (date, snippet), = diary.search_diary("散歩道")
+    assert snippet.startswith(r"\***散歩道**\* \<b\>公園\</b\> \[l")
+
+    (date, snippet), = diary.search_diary("公園", start="2025-06-01", end="2025-06-30")
+    assert snippet == r"\*散歩道\* \<b\>**公園**\</b\> \[link\]\(http://example\.com\) \$1\$"
@@ -0,0 +1,65 @@
+import sqlite3
+
+import pytest
+
+import migrations
+
+# =========================
+# migrations の確認（python -m pytest test_migrations.py）
+# =========================
+
+
+def _create(conn):
+    conn.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)")
+    conn.execute("INSERT INTO items (name) VALUES ('a'), ('b')")
+
+
+def _add_column_then_fail(conn):
+    conn.execute("ALTER TABLE items ADD COLUMN kind TEXT")
+    conn.execute("UPDATE items SET kind = 'x'")
+    raise ValueError("途中で失敗")
+
+
+def _add_column(conn):
+    conn.execute("ALTER TABLE items ADD COLUMN kind TEXT")
+    conn.execute("UPDATE items SET kind = 'x'")
+
+
+def _version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / "migrate.db"))
+    yield conn
+    conn.close()
+
+
+def test_failed_migration_is_rolled_back(conn):
+    with pytest.raises(ValueError):
+        migrations.apply(conn, [_create, _add_column_then_fail])
+    assert _version(conn) == 1
+    assert migrations.table_columns(conn, "items") == {"id", "name"}
+    assert not conn.in_transaction
+
+    # 直したマイグレーションは同じ DB にそのまま適用できる（ALTER が重複しない）
+    assert migrations.apply(conn, [_create, _add_column]) == 2
+    assert _version(conn) == 2
+    assert conn.execute("SELECT kind FROM items").fetchall() == [("x",), ("x",)]
+
+
+def test_migration_that_commits_is_rejected(conn):
+    def _commits(conn):
+        conn.executescript("CREATE TABLE other (id INTEGER)")
+
+    with pytest.raises(RuntimeError):
+        migrations.apply(conn, [_create, _commits])
+    assert _version(conn) == 1
+
+
+def test_newer_schema_is_rejected(conn):
+    conn.execute("PRAGMA user_version = 3")
+    with pytest.raises(RuntimeError):
+        migrations.apply(conn, [_create])
+    assert conn.isolation_level == ""
@@ -0,0 +1,70 @@
+import io
+import sqlite3
+
+import pytest
+
+import db
+import schedule_io
+
+# =========================
+# schedule_io のインポートの確認（python -m pytest test_schedule_io.py）
+# =========================
+
+HEADER = ",".join(schedule_io.COLUMNS) + "\n"
+
+
+def _row(importance):
+    return f"2025-06-01,09:00,会議,東京,0,{importance},1\n"
+
+
+@pytest.fixture
+def db_file(tmp_path):
+    path = str(tmp_path / "schedule.db")
+    conn = sqlite3.connect(path)
+    conn.execute("""
+        CREATE TABLE schedules (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT NOT NULL, date TEXT, time TEXT,
+            event_name TEXT, location TEXT, outdoor INTEGER, importance INTEGER, changeable INTEGER
+        )
+    """)
+    conn.close()
+    yield path
+    db.close_connection(path)
+
+
+def _count(db_file):
+    conn = sqlite3.connect(db_file)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM schedules").fetchone()[0]
+    finally:
+        conn.close()
+
+
+@pytest.mark.parametrize("raw", ["4.9", "0.5", "5.9", "inf", "nan", "abc", "0", "6"])
+def test_invalid_importance_is_rejected(raw):
+    row = dict(zip(schedule_io.COLUMNS, _row(raw).strip().split(",")))
+    with pytest.raises(schedule_io.ScheduleImportError):
+        schedule_io.validate_row(row)
+
+
+@pytest.mark.parametrize("raw, expected", [("4", 4), ("4.0", 4), ("", 3)])
+def test_integer_importance_is_accepted(raw, expected):
+    row = dict(zip(schedule_io.COLUMNS, _row(raw).strip().split(",")))
+    assert schedule_io.validate_row(row)[5] == expected
+
+
+def test_failed_import_reports_committed_rows(db_file):
+    source = io.BytesIO((HEADER + _row(3) * 3 + _row(4.9) + _row(2) * 2).encode())
+    calls = []
+
+    def on_progress(done, total):
+        calls.append(done)
+        if len(calls) == 2:
+            raise OSError("書き込みに失敗")
+
+    with pytest.raises(schedule_io.ScheduleImportAborted) as excinfo:
+        schedule_io.import_schedules(source, db_file, "u1", chunk_size=2, on_progress=on_progress)
+    # 2チャンク目（3行目・4.9 の行）までは commit 済み。4.9 の行は登録されない
+    assert excinfo.value.inserted == 3
+    assert excinfo.value.processed == 4
+    assert _count(db_file) == 3
@@ -0,0 +1,95 @@
+import datetime
+
+import pytest
+
+from task_parser import LOCAL_CONFIDENCE, extract_tasks, parse_deadline, parse_local
+
+# =========================
+# task_parser のルール解析の確認（python -m pytest test_task_parser.py）
+# =========================
+# 基準日は 2025-06-11（水）
+
+TODAY = datetime.date(2025, 6, 11)
+
+LOCAL_CASES = [
+    # (書き起こし, 期待値（一部の項目）, ローカルで確定するか)
+    ("明日までにレポートを提出する", {"title": "レポートを提出", "deadline": "2025-06-12", "priority": 3, "duration": 60}, True),
+    ("明後日までに部屋の掃除、30分", {"title": "部屋の掃除", "deadline": "2025-06-13", "duration": 30}, True),
+    ("来週金曜までに企画書、1時間半、至急", {"title": "企画書", "deadline": "2025-06-20", "duration": 90, "priority": 5}, True),
+    ("月末までに経費精算 急ぎで", {"title": "経費精算", "deadline": "2025-06-30", "priority": 4}, True),
+    ("3日後に歯医者の予約 15分", {"title": "歯医者の予約", "deadline": "2025-06-14", "duration": 15}, True),
+    ("25日までに請求書を送る", {"title": "請求書を送る", "deadline": "2025-06-25"}, True),
+    ("5日までに会費の振込", {"title": "会費の振込", "deadline": "2025-07-05"}, True),
+    ("６月２０日までにプレゼン資料 ２時間", {"title": "プレゼン資料", "deadline": "2025-06-20", "duration": 120}, True),
+    ("金曜までに洗濯 1時間", {"title": "洗濯", "deadline": "2025-06-13", "duration": 60}, True),
+    ("水曜までに日報", {"deadline": "2025-06-11"}, True),
+    ("1時間30分で家計簿をつける、来月末まで", {"title": "家計簿をつける", "deadline": "2025-07-31", "duration": 90}, True),
+    ("7/1までに旅行の計画", {"title": "旅行の計画", "deadline": "2025-07-01"}, True),
+    ("今日中に買い物 20分", {"title": "買い物", "deadline": "2025-06-11", "duration": 20}, True),
+    ("2週間後に定期券の更新", {"deadline": "2025-06-25"}, True),
+    ("来週月曜の会議の準備", {"title": "会議の準備", "deadline": "2025-06-16"}, True),
+    ("大至急 上司に電話", {"title": "上司に電話", "priority": 5}, False),
+    ("明日までにレポート、あと牛乳を買う", {}, False),
+    ("来週中に何か考える", {}, False),
+    ("", {}, False),
+]
+
+# 存在しない日付。締切は読み取れないものとして扱い、ローカルでは確定しない（API に回す）
+MALFORMED_DATES = [
+    "13月5日までに資料",
+    "13/1までに旅行",
+    "2025年2月30日までに申請",
+    "0日までに振込",
+]
+
+
+@pytest.mark.parametrize("text, expected, expect_local", LOCAL_CASES)
+def test_parse_local(text, expected, expect_local):
+    tasks, confidence = parse_local(text, TODAY)
+    assert (confidence >= LOCAL_CONFIDENCE) == expect_local, f"確信度 {confidence}"
+    if expected:
+        actual = dict(tasks[0])
+        if isinstance(actual.get("deadline"), datetime.date):
+            actual["deadline"] = actual["deadline"].isoformat()
+        assert {k: actual.get(k) for k in expected} == expected
+
+
+@pytest.mark.parametrize("text", MALFORMED_DATES)
+def test_parse_local_malformed_date(text):
+    tasks, confidence = parse_local(text, TODAY)
+    assert confidence < LOCAL_CONFIDENCE
+    assert all(task["deadline"] is None for task in tasks)
+
+
+@pytest.mark.parametrize("raw", ["0", "2025-02-30", "2025-13-01", "13/1", "13月5日"])
+def test_parse_deadline_malformed(raw):
+    assert parse_deadline(raw, TODAY) is None
+
+
+class _FakeClient:
+    """chat.completions.create の呼び出しを記録し、空のタスク一覧を返す"""
+
+    def __init__(self):
+        self.calls = 0
+        self.chat = self
+        self.completions = self
+
+    def create(self, **kwargs):
+        self.calls += 1
+        message = type("Message", (), {"content": '{"tasks": []}'})
+        choice = type("Choice", (), {"message": message})
+        return type("Response", (), {"choices": [choice]})
+
+
+@pytest.mark.parametrize("text", MALFORMED_DATES)
+def test_extract_tasks_malformed_date_uses_api(text):
+    client = _FakeClient()
+    assert extract_tasks(client, text, TODAY) == []
+    assert client.calls == 1
+
+
+def test_extract_tasks_local_skips_api():
+    client = _FakeClient()
+    tasks = extract_tasks(client, "明日までにレポートを提出する", TODAY)
+    assert client.calls == 0
+    assert tasks[0]["deadline"] == datetime.date(2025, 6, 12)
@@ -2,12 +2,12 @@ from __future__ import annotations
 import os, io, re, json, base64, zipfile, random
 from typing import Dict, List, Tuple
 
-import pandas as pd
 import streamlit as st
 import streamlit.components.v1 as components
 
-from openai import OpenAI
-from openai import RateLimitError, APIStatusError
+import openai_client
+import profiler
+import task_store
 
 # .env 読み込み（無ければ何もしない）
 try:
@@ -16,6 +16,8 @@ try:
 except Exception:
     pass
 
+profiler.start_rerun("time")
+
 def get_api_key(env_key: str ="OPENAI_API_KEY") -> str | None:
     key = os.getenv(env_key)
     if key:
@@ -36,9 +38,10 @@ if not API_KEY:
         "  .streamlit/secrets.toml に OPENAI_API_KEY を記載（※リポジトリにコミットしない）\n"
         "  公式: st.secrets / secrets.toml の使い方はドキュメント参照"
     )
-    st.stop()
+    profiler.stop()
 
-client = OpenAI(api_key=API_KEY)
+# 全ページ共通のクライアント（流量制限・再試行つき）
+client = openai_client.get_client(API_KEY)
 
 st.set_page_config(
     page_icon="🕰️",
@@ -63,19 +66,8 @@ duration = st.slider("目安時間(分)",0,300,60,30)
 date = st.date_input("しめきり")
 
 
-if "tasks" not in st.session_state:
-    st.session_state["tasks"] = pd.DataFrame(columns=["タスク","カテゴリ","優先度","所要時間","締切日"])
-
 if st.button("登録"):
-    new_task = {
-        "タスク": task,
-        "カテゴリ": theme,
-        "優先度": priority,
-        "所要時間": duration,
-        "締切日": date
-    }
-    st.session_state["tasks"] = pd.concat(
-        [st.session_state["tasks"], pd.DataFrame([new_task])],
-        ignore_index=True
-    )
-    st.success("登録しました！")
\ No newline at end of file
+    task_store.add_task(task, memo, priority, duration, date)
+    st.success("登録しました！")
+
+profiler.finish_rerun()
@@ -1,16 +1,24 @@
 import streamlit as st
 import sqlite3
+import logging
+import functools
 import pandas as pd
 
+import profiler
+import migrations
+
 # =========================
 # ページ設定
 # =========================
 st.set_page_config(page_title="ユーザ情報登録", page_icon="👤")
+profiler.start_rerun("user_info")
 
 # =========================
 # 定数
 # =========================
 DB_FILE = "user_info.db"
+logger = logging.getLogger("app.user_info")
+PAGE_SIZE = 50  # ユーザ一覧の1ページの件数
 
 # 地域データ（地域名のみ表示、IDは内部で保存）
 REGIONS = [
@@ -91,11 +99,10 @@ REGIONS = [
 # =========================
 # DBユーティリティ
 # =========================
-def init_database():
-    """DB初期化＆既存テーブルの不足カラムを自動追加（マイグレーション）"""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute('''
+# ----- スキーマのマイグレーション（migrations.py で版管理） -----
+def _create_user_info(conn):
+    """テーブル作成＆古いテーブルへの不足カラムの追加"""
+    conn.execute('''
         CREATE TABLE IF NOT EXISTS user_info (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             name TEXT NOT NULL,
@@ -108,23 +115,44 @@ def init_database():
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
     ''')
-    cursor.execute("PRAGMA table_info(user_info)")
-    cols = {row[1] for row in cursor.fetchall()}
-    if "region_id" not in cols:
-        cursor.execute("ALTER TABLE user_info ADD COLUMN region_id TEXT")
-    if "region_name" not in cols:
-        cursor.execute("ALTER TABLE user_info ADD COLUMN region_name TEXT")
-    if "work_hours" not in cols:
-        cursor.execute("ALTER TABLE user_info ADD COLUMN work_hours REAL")
-    if "commute_hours" not in cols:
-        cursor.execute("ALTER TABLE user_info ADD COLUMN commute_hours REAL")
-    if "sleep_hours" not in cols:
-        cursor.execute("ALTER TABLE user_info ADD COLUMN sleep_hours REAL")
-    if "created_at" not in cols:
-        cursor.execute("ALTER TABLE user_info ADD COLUMN created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP")
-    conn.commit()
-    conn.close()
+    cols = migrations.table_columns(conn, "user_info")
+    for col, col_type in [
+        ("region_id", "TEXT"),
+        ("region_name", "TEXT"),
+        ("work_hours", "REAL"),
+        ("commute_hours", "REAL"),
+        ("sleep_hours", "REAL"),
+        # ALTER TABLE では CURRENT_TIMESTAMP を既定値にできないため既定値なしで追加
+        ("created_at", "TIMESTAMP"),
+    ]:
+        if col not in cols:
+            conn.execute(f"ALTER TABLE user_info ADD COLUMN {col} {col_type}")
 
+def _add_user_indexes(conn):
+    """名前の一意索引と一覧の絞り込み用の索引"""
+    # 一意索引の作成前に、重複した名前は最新の1件をそのままにし、古い方の名前に「（重複 id=N）」を付ける（削除はしない）
+    duplicates = conn.execute(
+        "SELECT id, name FROM user_info WHERE id NOT IN (SELECT MAX(id) FROM user_info GROUP BY name) ORDER BY id"
+    ).fetchall()
+    for user_id, name in duplicates:
+        new_name = f"{name}（重複 id={user_id}）"
+        while conn.execute("SELECT 1 FROM user_info WHERE name = ?", (new_name,)).fetchone():
+            new_name += "_"
+        conn.execute("UPDATE user_info SET name = ? WHERE id = ?", (new_name, user_id))
+        logger.warning("重複した名前を変更しました: id=%s %r -> %r", user_id, name, new_name)
+    conn.execute("DROP INDEX IF EXISTS idx_user_info_name")
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_user_info_name_unique ON user_info(name)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_user_info_email ON user_info(email)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_user_info_region ON user_info(region_name)")
+
+MIGRATIONS = [_create_user_info, _add_user_indexes]
+
+@profiler.traced("db.init_database")
+def init_database():
+    """DBを最新のスキーマにする（適用済みなら版の確認だけ）"""
+    migrations.migrate(DB_FILE, MIGRATIONS)
+
+@profiler.traced("db.get_user_by_name")
 def get_user_by_name(name: str):
     conn = sqlite3.connect(DB_FILE)
     cursor = conn.cursor()
@@ -133,26 +161,47 @@ def get_user_by_name(name: str):
     conn.close()
     return row
 
-def insert_user(name: str, email: str, region_id: str, region_name: str, work_hours: float, commute_hours: float, sleep_hours: float):
+_UPSERT_SQL = """
+    INSERT INTO user_info (name, email, region_id, region_name, work_hours, commute_hours, sleep_hours)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(name) DO UPDATE SET
+        email = excluded.email,
+        region_id = excluded.region_id,
+        region_name = excluded.region_name,
+        work_hours = excluded.work_hours,
+        commute_hours = excluded.commute_hours,
+        sleep_hours = excluded.sleep_hours
+"""
+
+@profiler.traced("db.upsert_user")
+def upsert_user(name: str, email: str, region_id: str, region_name: str, work_hours: float, commute_hours: float, sleep_hours: float) -> bool:
+    """名前をキーに登録または更新する（新規登録なら True）
+
+    UPSERT 1文で処理し、RETURNING の id がこの文で挿入した行の rowid（lastrowid）と一致すれば新規登録と判断する。
+    更新になった場合は lastrowid が変わらない（新しく開いた接続なので 0 のまま）。
+    """
     conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute(
-        "INSERT INTO user_info (name, email, region_id, region_name, work_hours, commute_hours, sleep_hours) VALUES (?, ?, ?, ?, ?, ?, ?)",
-        (name, email, region_id, region_name, work_hours, commute_hours, sleep_hours)
-    )
-    conn.commit()
-    conn.close()
+    try:
+        with conn:
+            cursor = conn.execute(_UPSERT_SQL + " RETURNING id",
+                                  (name, email, region_id, region_name, work_hours, commute_hours, sleep_hours))
+            user_id = cursor.fetchone()[0]
+            inserted = cursor.lastrowid == user_id
+    finally:
+        conn.close()
+    return inserted
 
-def update_user_by_name(name: str, email: str, region_id: str, region_name: str, work_hours: float, commute_hours: float, sleep_hours: float):
+@profiler.traced("db.upsert_users")
+def upsert_users(users) -> int:
+    """(name, email, region_id, region_name, work_hours, commute_hours, sleep_hours) の並びを
+    1トランザクションでまとめて登録・更新し、処理した件数を返す"""
     conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute(
-        "UPDATE user_info SET email = ?, region_id = ?, region_name = ?, work_hours = ?, commute_hours = ?, sleep_hours = ? WHERE name = ?",
-        (email, region_id, region_name, work_hours, commute_hours, sleep_hours, name)
-    )
-    conn.commit()
+    with conn:
+        count = conn.executemany(_UPSERT_SQL, users).rowcount
     conn.close()
+    return count
 
+@profiler.traced("db.get_all_users")
 def get_all_users():
     conn = sqlite3.connect(DB_FILE)
     cursor = conn.cursor()
@@ -161,6 +210,49 @@ def get_all_users():
     conn.close()
     return rows
 
+@profiler.traced("db.get_user_by_id")
+def get_user_by_id(user_id: int):
+    conn = sqlite3.connect(DB_FILE)
+    cursor = conn.cursor()
+    cursor.execute("SELECT id, name, email, region_name, work_hours, commute_hours, sleep_hours, created_at FROM user_info WHERE id = ?", (user_id,))
+    row = cursor.fetchone()
+    conn.close()
+    return row
+
+@profiler.traced("db.get_users_page")
+def get_users_page(after_id=None, limit: int = PAGE_SIZE, name: str = "", email: str = "", region_name: str = ""):
+    """ID 降順のキーセットページング（after_id より小さい ID から limit 件）
+
+    name / email は前方一致、region_name は完全一致で、いずれも索引で絞り込む。
+    戻り値は (行のリスト, 次のページがあるか)
+    """
+    conditions, params = [], []
+    if after_id is not None:
+        conditions.append("id < ?")
+        params.append(after_id)
+    # 前方一致は範囲検索にして索引を使う
+    if name:
+        conditions.append("name >= ? AND name < ?")
+        params += [name, name + "\U0010ffff"]
+    if email:
+        conditions.append("email >= ? AND email < ?")
+        params += [email, email + "\U0010ffff"]
+    if region_name:
+        conditions.append("region_name = ?")
+        params.append(region_name)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    conn = sqlite3.connect(DB_FILE)
+    cursor = conn.cursor()
+    cursor.execute(
+        f"SELECT id, name, email, region_name, work_hours, commute_hours, sleep_hours, created_at FROM user_info {where} ORDER BY id DESC LIMIT ?",
+        (*params, limit + 1)
+    )
+    rows = cursor.fetchall()
+    conn.close()
+    return rows[:limit], len(rows) > limit
+
+@profiler.traced("db.delete_user_by_id")
 def delete_user_by_id(user_id: int):
     conn = sqlite3.connect(DB_FILE)
     cursor = conn.cursor()
@@ -169,23 +261,14 @@ def delete_user_by_id(user_id: int):
     conn.close()
 
 # =========================
-# コールバック（チェックで選択）
+# コールバック（表の行選択）
 # =========================
-def on_select_row(row_id: int, name: str, email: str, region_name: str, work_hours: float, commute_hours: float, sleep_hours: float):
-    # チェックボックスが解除された場合（現在選択中のIDと同じIDのチェックが外された）
-    checkbox_key = f"cb_{row_id}"
-    if checkbox_key in st.session_state and not st.session_state[checkbox_key]:
-        st.session_state["selected_id"] = None
-        return
-    
-    st.session_state["selected_id"] = int(row_id)
-    # サイドバーのフォーム値を更新
-    st.session_state["form_name"] = name
-    st.session_state["form_email"] = email
-    st.session_state["form_region"] = region_name
-    st.session_state["form_work_hours"] = work_hours if work_hours else 0.0
-    st.session_state["form_commute_hours"] = commute_hours if commute_hours else 0.0
-    st.session_state["form_sleep_hours"] = sleep_hours if sleep_hours else 0.0
+def on_select_table(table_key: str):
+    rows = st.session_state[table_key]["selection"]["rows"]
+    page_ids = st.session_state.get("page_ids", [])
+    st.session_state["selected_id"] = int(page_ids[rows[0]]) if rows and rows[0] < len(page_ids) else None
+    st.session_state["confirm_delete_id"] = None
+    st.session_state["confirm_delete_name"] = ""
 
 # =========================
 # アプリ本体
@@ -200,27 +283,20 @@ for key, default in [
     ("confirm_delete_id", None),
     ("confirm_delete_name", ""),
     ("selected_id", None),
-    ("form_name", ""),
-    ("form_email", ""),
-    ("form_region", "選択してください"),
-    ("form_work_hours", 0.0),
-    ("form_commute_hours", 0.0),
-    ("form_sleep_hours", 0.0),
+    ("user_filters", ("", "", "")),
+    ("page_cursors", [None]),
+    ("page_ids", []),
+    ("table_version", 0),
 ]:
     if key not in st.session_state:
         st.session_state[key] = default
 
 # ----- サイドバー：入力フォーム（選択に応じて自動反映） -----
+profiler.section("render.入力フォーム")
 st.sidebar.header("ユーザ情報入力")
 
 # 選択されたユーザの情報でフォームを初期化
-selected_user = None
-if st.session_state["selected_id"]:
-    users_list = get_all_users()
-    for user in users_list:
-        if user[0] == st.session_state["selected_id"]:
-            selected_user = user
-            break
+selected_user = get_user_by_id(st.session_state["selected_id"]) if st.session_state["selected_id"] else None
 
 # フォーム入力値を決定
 if selected_user:
@@ -258,93 +334,96 @@ if st.sidebar.button("保存 / 更新"):
     elif region_name == "選択してください":
         st.error("❌ 住まいの地域を選択してください")
     else:
-        existing = get_user_by_name(name)
-        if existing:
-            update_user_by_name(name, email, region_id, region_name, work_hours, commute_hours, sleep_hours)
-            st.success("✅ ユーザ情報を更新しました")
-        else:
-            insert_user(name, email, region_id, region_name, work_hours, commute_hours, sleep_hours)
+        if upsert_user(name, email, region_id, region_name, work_hours, commute_hours, sleep_hours):
             st.success("✅ ユーザ情報を保存しました")
-        st.rerun()
+        else:
+            st.success("✅ ユーザ情報を更新しました")
+        profiler.rerun()
 
-# ----- 登録済みユーザ一覧（チェックボックス＋横並び＋削除確認） -----
+# ----- 登録済みユーザ一覧（キーセットページング＋1つの表で表示＋削除確認） -----
+profiler.section("render.ユーザ一覧")
 st.subheader("📋 登録済みユーザ一覧")
-users = get_all_users()
+
+# 絞り込み条件（名前・メールは前方一致、地域は完全一致）
+fcol1, fcol2, fcol3 = st.columns(3)
+filter_name = fcol1.text_input("名前で絞り込み（前方一致）").strip()
+filter_email = fcol2.text_input("メールで絞り込み（前方一致）").strip()
+filter_region = fcol3.selectbox("地域で絞り込み", ["すべて"] + region_titles[1:])
+filters = (filter_name, filter_email, "" if filter_region == "すべて" else filter_region)
+
+# 条件が変わったら1ページ目に戻す
+if st.session_state["user_filters"] != filters:
+    st.session_state["user_filters"] = filters
+    st.session_state["page_cursors"] = [None]
+
+cursors = st.session_state["page_cursors"]
+users, has_next = get_users_page(cursors[-1], PAGE_SIZE, *filters)
 
 if users:
     df = pd.DataFrame(users, columns=["ID", "名前", "メールアドレス", "地域", "勤務時間", "通勤時間", "睡眠時間", "登録日時"])
-    df.reset_index(drop=True, inplace=True)
-
-    # 列幅（先頭にチェックボックス列を追加）
-    widths = [1, 1.5, 2.5, 1.5, 1, 1, 1, 2, 1.5]
-
-    # ヘッダー行
-    header_cols = st.columns(widths)
-    header_cols[0].markdown("**選択**")
-    header_cols[1].markdown("**名前**")
-    header_cols[2].markdown("**メール**")
-    header_cols[3].markdown("**地域**")
-    header_cols[4].markdown("**勤務時間**")
-    header_cols[5].markdown("**通勤時間**")
-    header_cols[6].markdown("**睡眠時間**")
-    header_cols[7].markdown("**登録日時**")
-    header_cols[8].markdown("**操作**")
-
-    # データ行
-    for _, row in df.iterrows():
-        cols = st.columns(widths)
-
-        # チェックボックス（選択状態は selected_id と同期）
-        is_checked = st.session_state["selected_id"] == int(row["ID"])
-        cols[0].checkbox(
-            "",
-            value=is_checked,
-            key=f"cb_{row['ID']}",
-            on_change=on_select_row,
-            args=(int(row["ID"]), row["名前"], row["メールアドレス"], row["地域"], row["勤務時間"], row["通勤時間"], row["睡眠時間"])
-        )
+    st.session_state["page_ids"] = df["ID"].astype(int).tolist()
+
+    # 行をクリックで選択（選択状態は selected_id と同期）
+    table_key = f"user_table_{st.session_state['table_version']}_{len(cursors)}"
+    st.dataframe(
+        df,
+        key=table_key,
+        on_select=functools.partial(on_select_table, table_key),
+        selection_mode="single-row",
+        hide_index=True,
+        use_container_width=True,
+        column_order=["名前", "メールアドレス", "地域", "勤務時間", "通勤時間", "睡眠時間", "登録日時"],
+        column_config={
+            "勤務時間": st.column_config.NumberColumn(format="%.1fh"),
+            "通勤時間": st.column_config.NumberColumn(format="%.1fh"),
+            "睡眠時間": st.column_config.NumberColumn(format="%.1fh"),
+        },
+    )
 
-        cols[1].write(row["名前"])
-        cols[2].write(row["メールアドレス"])
-        cols[3].write(row["地域"])
-        cols[4].write(f"{row['勤務時間']}h" if row["勤務時間"] else "－")
-        cols[5].write(f"{row['通勤時間']}h" if row["通勤時間"] else "－")
-        cols[6].write(f"{row['睡眠時間']}h" if row["睡眠時間"] else "－")
-        cols[7].write(row["登録日時"])
+    # ページ送り
+    pcol1, pcol2, pcol3 = st.columns([1, 2, 1])
+    with pcol1:
+        if st.button("◀ 前へ", disabled=len(cursors) == 1):
+            cursors.pop()
+            profiler.rerun()
+    pcol2.caption(f"{len(cursors)}ページ目（{len(users)}件表示）")
+    with pcol3:
+        if st.button("次へ ▶", disabled=not has_next):
+            cursors.append(int(df["ID"].iloc[-1]))
+            profiler.rerun()
 
-        # 削除UI：確認ダイアログ（同一行のみ）
+    # 削除UI：選択中のユーザに対する確認ダイアログ
+    if selected_user:
         if st.session_state["confirm_delete_id"] is None:
-            if cols[8].button("🗑️ 削除", key=f"del_{row['ID']}"):
-                st.session_state["confirm_delete_id"] = int(row["ID"])
-                st.session_state["confirm_delete_name"] = row["名前"]
-                st.rerun()
-        else:
-            if int(row["ID"]) == st.session_state["confirm_delete_id"]:
-                st.warning(f"「{row['名前']}」さんの情報を削除しますか？この操作は元に戻せません。")
-                c1, c2 = st.columns([1, 1])
-                with c1:
-                    if st.button("✅ はい、削除する", key=f"yes_{row['ID']}"):
-                        delete_user_by_id(int(row["ID"]))
-                        # 削除対象が選択中なら選択解除＆フォーム初期化
-                        if st.session_state["selected_id"] == int(row["ID"]):
-                            st.session_state["selected_id"] = None
-                            st.session_state["form_name"] = ""
-                            st.session_state["form_email"] = ""
-                            st.session_state["form_region"] = "選択してください"
-                            st.session_state["form_work_hours"] = 0.0
-                            st.session_state["form_commute_hours"] = 0.0
-                            st.session_state["form_sleep_hours"] = 0.0
-                        st.session_state["confirm_delete_id"] = None
-                        st.session_state["confirm_delete_name"] = ""
-                        st.success("✅ 削除しました。")
-                        st.rerun()
-                with c2:
-                    if st.button("❎ キャンセル", key=f"no_{row['ID']}"):
-                        st.session_state["confirm_delete_id"] = None
-                        st.session_state["confirm_delete_name"] = ""
-                        st.info("削除をキャンセルしました。")
-                        st.rerun()
-            else:
-                cols[8].write("—")
+            if st.button(f"🗑️ 「{selected_user[1]}」さんを削除"):
+                st.session_state["confirm_delete_id"] = int(selected_user[0])
+                st.session_state["confirm_delete_name"] = selected_user[1]
+                profiler.rerun()
+        elif st.session_state["confirm_delete_id"] == int(selected_user[0]):
+            st.warning(f"「{st.session_state['confirm_delete_name']}」さんの情報を削除しますか？この操作は元に戻せません。")
+            c1, c2 = st.columns([1, 1])
+            with c1:
+                if st.button("✅ はい、削除する"):
+                    delete_user_by_id(st.session_state["confirm_delete_id"])
+                    # 選択解除＆フォーム初期化（表の選択状態もリセット）
+                    st.session_state["selected_id"] = None
+                    st.session_state["table_version"] += 1
+                    st.session_state["confirm_delete_id"] = None
+                    st.session_state["confirm_delete_name"] = ""
+                    st.success("✅ 削除しました。")
+                    profiler.rerun()
+            with c2:
+                if st.button("❎ キャンセル"):
+                    st.session_state["confirm_delete_id"] = None
+                    st.session_state["confirm_delete_name"] = ""
+                    st.info("削除をキャンセルしました。")
+                    profiler.rerun()
+elif any(filters) or len(cursors) > 1:
+    st.info("条件に一致するユーザはいません。")
+    if len(cursors) > 1 and st.button("◀ 前へ"):
+        cursors.pop()
+        profiler.rerun()
 else:
     st.info("まだユーザ情報は登録されていません。")
+
+profiler.finish_rerun()
@@ -0,0 +1,65 @@
+from __future__ import annotations
+import io
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Callable, Hashable, Tuple
+
+import profiler
+
+# =========================
+# 音声 → 文字起こし → 解析 のキャッシュ
+# =========================
+# st_audiorec() は再実行のたびに同じ WAV バイト列を返すため、
+# 音声のハッシュをキーに文字起こし結果と解析結果を使い回す（LRU で件数を制限）。
+
+MAX_ENTRIES = 128
+TRANSCRIBE_MODEL = "gpt-4o-mini-transcribe"
+
+_lock = threading.Lock()
+_cache: "OrderedDict[Hashable, object]" = OrderedDict()
+_stats = {"hits": 0, "misses": 0}
+
+
+def audio_key(wav_bytes: bytes) -> str:
+    """音声データのハッシュ"""
+    return hashlib.blake2b(wav_bytes, digest_size=16).hexdigest()
+
+
+def cached(key: Hashable, compute: Callable[[], object]):
+    """key の結果があれば返し、無ければ compute() の結果を保存して返す"""
+    with _lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            _stats["hits"] += 1
+            return _cache[key]
+        _stats["misses"] += 1
+
+    value = compute()
+    with _lock:
+        _cache[key] = value
+        _cache.move_to_end(key)
+        while len(_cache) > MAX_ENTRIES:
+            _cache.popitem(last=False)
+    return value
+
+
+def transcribe(client, wav_bytes: bytes, model: str = TRANSCRIBE_MODEL) -> Tuple[str, str]:
+    """音声を文字起こしし、(音声キー, テキスト) を返す
+
+    音声は一時ファイルに書かず、メモリ上の BytesIO のまま API に渡す。
+    """
+    key = audio_key(wav_bytes)
+
+    def run():
+        audio = io.BytesIO(wav_bytes)
+        audio.name = "audio.wav"  # 拡張子から形式が判定される
+        with profiler.span("openai.transcribe", bytes=len(wav_bytes)):
+            return client.audio.transcriptions.create(model=model, file=audio).text
+
+    return key, cached(("transcript", model, key), run)
+
+
+def stats() -> dict:
+    with _lock:
+        return {**_stats, "entries": len(_cache)}
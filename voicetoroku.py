@@ -1,13 +1,21 @@
 from __future__ import annotations
-import os, tempfile
+import os
+import datetime
 import pandas as pd
 import streamlit as st
 
-from openai import OpenAI
+from openai import OpenAIError
 from dotenv import load_dotenv
 from st_audiorec import st_audiorec
 
+import profiler
+import voice_pipeline
+import openai_client
+import task_store
+import task_parser
+
 load_dotenv()
+profiler.start_rerun("voicetoroku")
 API_KEY = os.getenv("OPENAI_API_KEY")
 
 st.sidebar.header("APIキー設定")
@@ -27,92 +35,80 @@ API_KEY = st.session_state.api_key
 
 if not API_KEY:
     st.error(" OpenAI APIキーが見つかりません。.env を確認してください")
-    st.stop()
+    profiler.stop()
 
-client = OpenAI(api_key=API_KEY)
+# 全ページ共通のクライアント（流量制限・再試行つき）
+client = openai_client.get_client(API_KEY)
 
 st.set_page_config(page_icon="🕰️", layout="wide")
 st.header("タスク登録")
 
-default_task = ""
-default_memo = ""
-default_priority = 3
-default_duration = 60
-default_date = None
+today = datetime.date.today()
 
 wav_audio_data = st_audiorec()
 text = None
 
 if wav_audio_data is not None:
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as tmpfile:
-        tmpfile.write(wav_audio_data)
-        audio_path = tmpfile.name
-
-    with open(audio_path, "rb") as f:
-        transcript = client.audio.transcriptions.create(
-            model="gpt-4o-mini-transcribe",
-            file=f
-        )
-    text = transcript.text
+    # 同じ録音なら再実行しても API を呼ばずキャッシュを使う
+    try:
+        audio_key, text = voice_pipeline.transcribe(client, wav_audio_data)
+    except OpenAIError as e:
+        st.error(openai_client.describe_error(e))
+        profiler.stop()
     st.write(" 音声入力結果:", text)
 
+# 構造化出力で複数タスクを1回の呼び出しで取り出す
+voice_tasks = []
 if text:
-    prompt = f"""
-    次の文章を解析して、以下の形式で出力してください:
-    タスク名:
-    メモ・内容:
-    優先度(1~5):
-    目安時間(分):
-    しめきり(YYYY-MM-DD):
-
-    入力: {text}
-    """
-    result = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[{"role": "user", "content": prompt}]
+    try:
+        voice_tasks = voice_pipeline.cached(
+            ("tasks", "voicetoroku", today, audio_key),
+            lambda: task_parser.extract_tasks(client, text, today)
+        )
+    except ValueError:
+        st.error("音声からタスクを読み取れませんでした。もう一度録音してください。")
+    except OpenAIError as e:
+        st.error(openai_client.describe_error(e))
+
+# ===== 取り出したタスク（確認・修正してまとめて登録） =====
+if voice_tasks:
+    st.subheader(f"🎙️ 音声から取り出したタスク（{len(voice_tasks)}件）")
+    edited = st.data_editor(
+        pd.DataFrame(voice_tasks, columns=["title", "memo", "priority", "duration", "deadline"]),
+        key=f"voice_tasks_{audio_key}",
+        num_rows="dynamic",
+        hide_index=True,
+        column_config={
+            "title": st.column_config.TextColumn("タスク名", required=True),
+            "memo": st.column_config.TextColumn("メモ・内容"),
+            "priority": st.column_config.NumberColumn("優先度", min_value=1, max_value=5, step=1, default=task_parser.DEFAULT_PRIORITY),
+            "duration": st.column_config.NumberColumn("目安時間(分)", min_value=0, max_value=task_parser.MAX_DURATION, step=30, default=task_parser.DEFAULT_DURATION),
+            "deadline": st.column_config.DateColumn("しめきり"),
+        },
     )
-
-    parsed = result.choices[0].message.content
-
-    default_task = ""
-    default_memo = ""
-    default_priority = 3
-    default_duration = 60
-    default_date = None
-
-    for line in parsed.split("\n"):
-        if line.startswith("タスク名"):
-            default_task = line.split(":",1)[1].strip()
-        elif line.startswith("メモ"):
-            default_memo = line.split(":",1)[1].strip()
-        elif line.startswith("優先度"):
-            default_priority = int(line.split(":",1)[1].strip() or 3)
-        elif line.startswith("目安時間"):
-            default_duration = int(line.split(":",1)[1].replace("分","").strip() or 60)
-        elif line.startswith("しめきり"):
-            default_date = line.split(":",1)[1].strip()
-
-task = st.text_input("タスク名", value=default_task)
-memo = st.text_input("メモ・内容", value=default_memo)
-priority = st.slider("優先度", 1, 5, default_priority)
-duration = st.slider("目安時間(分)", 0, 300, default_duration, 30)
-date = st.date_input("しめきり", value=pd.to_datetime(default_date) if default_date else None)
-
-if "tasks" not in st.session_state:
-    st.session_state["tasks"] = pd.DataFrame(columns=["タスク","メモ","優先度","所要時間","締切日"])
+    rows = [t for t in (task_parser.normalize_task(r, today) for r in edited.to_dict("records")) if t]
+    registered = st.session_state.get("registered_audio_key") == audio_key
+    if st.button("登録済み" if registered else f"まとめて登録（{len(rows)}件）", disabled=registered or not rows):
+        task_store.add_tasks(rows)
+        st.session_state["registered_audio_key"] = audio_key
+        st.success(f"✅ {len(rows)}件登録しました")
+
+# 手入力で1件登録
+task = st.text_input("タスク名")
+memo = st.text_input("メモ・内容")
+priority = st.slider("優先度", 1, 5, task_parser.DEFAULT_PRIORITY)
+duration = st.slider("目安時間(分)", 0, task_parser.MAX_DURATION, task_parser.DEFAULT_DURATION, 30)
+date = st.date_input("しめきり", value=None)
 
 if st.button("登録"):
-    new_task = {
-        "タスク": task,
-        "メモ": memo,
-        "優先度": priority,
-        "所要時間": duration,
-        "締切日": date
-    }
-    st.session_state["tasks"] = pd.concat(
-        [st.session_state["tasks"], pd.DataFrame([new_task])],
-        ignore_index=True
-    )
+    task_store.add_task(task, memo, priority, duration, date)
     st.success("✅ 登録しました")
 
-st.dataframe(st.session_state["tasks"])
\ No newline at end of file
+# ===== 登録済みタスク（ページ単位で表示） =====
+total_tasks = task_store.count_tasks()
+total_pages = max(1, -(-total_tasks // task_store.PAGE_SIZE))
+page = st.number_input("ページ", min_value=1, max_value=total_pages, value=1, step=1) if total_pages > 1 else 1
+st.dataframe(task_store.get_tasks_page(page))
+st.caption(f"未完了タスク {total_tasks}件（{page}/{total_pages}ページ）")
+
+profiler.finish_rerun()
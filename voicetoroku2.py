@@ -1,16 +1,23 @@
 from __future__ import annotations
-import os, tempfile
+import os
 import pandas as pd
 import streamlit as st
 
-from openai import OpenAI
+from openai import OpenAIError
 from dotenv import load_dotenv
 from st_audiorec import st_audiorec
 import datetime
-import calendar, re
+
+import profiler
+import voice_pipeline
+import openai_client
+import llm_stream
+import task_store
+import task_parser
 
 # ===== APIキー設定 =====
 load_dotenv()
+profiler.start_rerun("voicetoroku2")
 API_KEY = os.getenv("OPENAI_API_KEY")
 
 st.sidebar.header("APIキー設定")
@@ -30,20 +37,15 @@ API_KEY = st.session_state.api_key
 
 if not API_KEY:
     st.error(" OpenAI APIキーが見つかりません。.env を確認してください")
-    st.stop()
+    profiler.stop()
 
-client = OpenAI(api_key=API_KEY)
+# 全ページ共通のクライアント（流量制限・再試行つき）
+client = openai_client.get_client(API_KEY)
 
 # ===== ページ設定 =====
 st.set_page_config(page_icon="🕰️", layout="wide")
 st.header("タスク登録")
 
-# ===== デフォルト値 =====
-default_task = ""
-default_memo = ""
-default_priority = 3
-default_duration = 60
-default_date = None
 today = datetime.date.today()
 
 # ===== 音声入力 =====
@@ -51,128 +53,83 @@ wav_audio_data = st_audiorec()
 text = None
 
 if wav_audio_data is not None:
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as tmpfile:
-        tmpfile.write(wav_audio_data)
-        audio_path = tmpfile.name
-
-    with open(audio_path, "rb") as f:
-        transcript = client.audio.transcriptions.create(
-            model="gpt-4o-mini-transcribe",
-            file=f
-        )
-    text = transcript.text
+    # 同じ録音なら再実行しても API を呼ばずキャッシュを使う
+    try:
+        audio_key, text = voice_pipeline.transcribe(client, wav_audio_data)
+    except OpenAIError as e:
+        st.error(openai_client.describe_error(e))
+        profiler.stop()
     st.write(" 音声入力結果:", text)
 
-# ===== 音声解析（ChatGPT） =====
+# ===== 音声解析（ChatGPT の構造化出力で複数タスクを1回で取り出す） =====
+voice_tasks = []
 if text:
-    prompt = f"""
-    次の文章を解析して、以下の形式で出力してください:
-    タスク名:
-    メモ・内容:
-    優先度(1~5):
-    目安時間(分):
-    しめきり(YYYY-MM-DD形式。今日が{today}で「25日まで」と言われたら、必ず{today.year}-{today.month:02d}-25と出力する。過ぎていれば翌月の日付にする):
-
-    入力: {text}
-    """
-
-    result = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[{"role": "user", "content": prompt}]
+    def run_parse():
+        # 短い口述はルールで読み取れれば API を呼ばない
+        local_tasks, confidence = task_parser.parse_local(text, today)
+        if confidence >= task_parser.LOCAL_CONFIDENCE:
+            return local_tasks
+
+        # 解析結果は届いた順に表示する（途中で画面を離れた場合はキャッシュしない）
+        stream_result = {}
+        with st.expander("解析結果", expanded=True), profiler.span("openai.extract_tasks(stream)"):
+            st.write_stream(llm_stream.stream_chat(
+                client, stream_result,
+                model=task_parser.EXTRACT_MODEL,
+                messages=task_parser.build_extract_messages(text, today),
+                response_format=task_parser.RESPONSE_FORMAT,
+            ))
+            st.caption(f"最初の応答まで {stream_result['first_token_ms'] or 0:.0f} ms / 全体 {stream_result['total_ms']:.0f} ms")
+        return task_parser.parse_tasks_json(stream_result["text"], today)
+
+    try:
+        voice_tasks = voice_pipeline.cached(("tasks", "voicetoroku2", today, audio_key), run_parse)
+    except ValueError:
+        st.error("音声からタスクを読み取れませんでした。もう一度録音してください。")
+    except OpenAIError as e:
+        st.error(openai_client.describe_error(e))
+
+# ===== 取り出したタスク（確認・修正してまとめて登録） =====
+if voice_tasks:
+    st.subheader(f"🎙️ 音声から取り出したタスク（{len(voice_tasks)}件）")
+    edited = st.data_editor(
+        pd.DataFrame(voice_tasks, columns=["title", "memo", "priority", "duration", "deadline"]),
+        key=f"voice_tasks_{audio_key}",
+        num_rows="dynamic",
+        hide_index=True,
+        column_config={
+            "title": st.column_config.TextColumn("タスク名", required=True),
+            "memo": st.column_config.TextColumn("メモ・内容"),
+            "priority": st.column_config.NumberColumn("優先度", min_value=1, max_value=5, step=1, default=task_parser.DEFAULT_PRIORITY),
+            "duration": st.column_config.NumberColumn("目安時間(分)", min_value=0, max_value=task_parser.MAX_DURATION, step=30, default=task_parser.DEFAULT_DURATION),
+            "deadline": st.column_config.DateColumn("しめきり"),
+        },
     )
-
-    parsed = result.choices[0].message.content
-
-    # ===== 締切日解析関数 =====
-    def parse_deadline(raw: str, today: datetime.date) -> datetime.date | None:
-        s = (raw or "").strip()
-        if not s:
-            return None
-
-        # 日本語の「まで」などを除去
-        s = s.replace("までに", "").replace("まで", "").strip()
-        if s.endswith("日"):
-            s = s[:-1].strip()
-
-        # パターン1: YYYY-MM-DD
-        try:
-            return datetime.date.fromisoformat(s)
-        except ValueError:
-            pass
-
-        # パターン2: MM-DD
-        m = re.fullmatch(r'(\d{1,2})-(\d{1,2})', s)
-        if m:
-            month, day = map(int, m.groups())
-            last_day = calendar.monthrange(today.year, month)[1]
-            return datetime.date(today.year, month, min(day, last_day))
-
-        # パターン3: MM月DD日
-        m = re.fullmatch(r'(\d{1,2})月(\d{1,2})', s)
-        if m:
-            month, day = map(int, m.groups())
-            last_day = calendar.monthrange(today.year, month)[1]
-            return datetime.date(today.year, month, min(day, last_day))
-
-        # パターン4: DD（日にちだけ）
-        if s.isdigit():
-            day = int(s)
-            year, month = today.year, today.month
-            if day >= today.day:  # 今月
-                last_day = calendar.monthrange(year, month)[1]
-                return datetime.date(year, month, min(day, last_day))
-            # 来月
-            month += 1
-            if month == 13:
-                month = 1
-                year += 1
-            last_day = calendar.monthrange(year, month)[1]
-            return datetime.date(year, month, min(day, last_day))
-
-        return None
-
-    # ===== 解析結果を取り込む =====
-    for line in parsed.split("\n"):
-        if line.startswith("タスク名"):
-            default_task = line.split(":", 1)[1].strip()
-        elif line.startswith("メモ"):
-            default_memo = line.split(":", 1)[1].strip()
-        elif line.startswith("優先度"):
-            default_priority = int(line.split(":", 1)[1].strip() or 3)
-        elif line.startswith("目安時間"):
-            default_duration = int(line.split(":", 1)[1].replace("分", "").strip() or 60)
-        elif line.startswith("しめきり"):
-            raw_date = line.split(":", 1)[1].strip()
-            parsed_date = parse_deadline(raw_date, today)
-            if parsed_date is not None:
-                default_date = parsed_date
-
-# ===== 入力フォーム =====
-task = st.text_input("タスク名", value=default_task)
-memo = st.text_input("メモ・内容", value=default_memo)
-priority = st.slider("優先度", 1, 5, default_priority)
-duration = st.slider("目安時間(分)", 0, 300, default_duration, 30)
-
-if default_date is None:
-    default_date = today
-date = st.date_input("しめきり", value=default_date)
+    rows = [t for t in (task_parser.normalize_task(r, today) for r in edited.to_dict("records")) if t]
+    registered = st.session_state.get("registered_audio_key") == audio_key
+    if st.button("登録済み" if registered else f"まとめて登録（{len(rows)}件）", disabled=registered or not rows):
+        task_store.add_tasks(rows)
+        st.session_state["registered_audio_key"] = audio_key
+        st.success(f"✅ {len(rows)}件登録しました")
+
+# ===== 入力フォーム（手入力で1件登録） =====
+task = st.text_input("タスク名")
+memo = st.text_input("メモ・内容")
+priority = st.slider("優先度", 1, 5, task_parser.DEFAULT_PRIORITY)
+duration = st.slider("目安時間(分)", 0, task_parser.MAX_DURATION, task_parser.DEFAULT_DURATION, 30)
+date = st.date_input("しめきり", value=today)
 
 # ===== 登録処理 =====
-if "tasks" not in st.session_state:
-    st.session_state["tasks"] = pd.DataFrame(columns=["タスク", "メモ", "優先度", "所要時間", "締切日"])
-
 if st.button("登録"):
-    new_task = {
-        "タスク": task,
-        "メモ": memo,
-        "優先度": priority,
-        "所要時間": duration,
-        "締切日": date
-    }
-    st.session_state["tasks"] = pd.concat(
-        [st.session_state["tasks"], pd.DataFrame([new_task])],
-        ignore_index=True
-    )
+    task_store.add_task(task, memo, priority, duration, date)
     st.success("✅ 登録しました")
 
-st.dataframe(st.session_state["tasks"])
+# ===== 登録済みタスク（ページ単位で表示） =====
+total_tasks = task_store.count_tasks()
+total_pages = max(1, -(-total_tasks // task_store.PAGE_SIZE))
+page = st.number_input("ページ", min_value=1, max_value=total_pages, value=1, step=1) if total_pages > 1 else 1
+st.dataframe(task_store.get_tasks_page(page))
+st.caption(f"未完了タスク {total_tasks}件（{page}/{total_pages}ページ）")
+
+profiler.finish_rerun()
+
@@ -0,0 +1,140 @@
+from __future__ import annotations
+import os
+import json
+import time
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, Tuple
+
+from db import connection
+
+# =========================
+# 天気予報キャッシュ（都市コード単位・全セッション共有）
+# =========================
+# - TTL 以内: キャッシュをそのまま返す
+# - TTL 超過〜TTL+STALE 以内: 古いデータを返しつつ、裏で1回だけ再取得
+# - それ以上古い / 未取得: 取得を待つ（同じ都市への同時リクエストは1回にまとめる）
+# 取得結果は SQLite にも保存し、再起動後もそこから復元する。
+
+DB_FILE = "weather_cache.db"
+TTL_SECONDS = float(os.getenv("WEATHER_CACHE_TTL", "600"))
+STALE_SECONDS = float(os.getenv("WEATHER_CACHE_STALE", "3600"))
+
+_lock = threading.Lock()
+_memory: Dict[str, Tuple[float, dict]] = {}
+_inflight: Dict[str, Future] = {}
+_disk_ready = False
+
+
+def _init_disk():
+    global _disk_ready
+    if _disk_ready:
+        return
+    with connection(DB_FILE) as conn, conn:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS weather_cache (
+                city_code TEXT PRIMARY KEY,
+                fetched_at REAL NOT NULL,
+                payload TEXT NOT NULL
+            )
+        ''')
+    _disk_ready = True
+
+
+def _load(city_code: str) -> Tuple[float, dict] | None:
+    entry = _memory.get(city_code)
+    if entry is not None:
+        return entry
+    _init_disk()
+    with connection(DB_FILE) as conn:
+        row = conn.execute(
+            "SELECT fetched_at, payload FROM weather_cache WHERE city_code = ?", (city_code,)
+        ).fetchone()
+    if row is None:
+        return None
+    entry = (row[0], json.loads(row[1]))
+    with _lock:
+        _memory.setdefault(city_code, entry)
+    return entry
+
+
+def _store(city_code: str, payload: dict) -> None:
+    fetched_at = time.time()
+    with _lock:
+        _memory[city_code] = (fetched_at, payload)
+    _init_disk()
+    with connection(DB_FILE) as conn, conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO weather_cache (city_code, fetched_at, payload) VALUES (?, ?, ?)",
+            (city_code, fetched_at, json.dumps(payload, ensure_ascii=False))
+        )
+
+
+def _run_fetch(city_code: str, fetch: Callable[[str], dict], future: Future) -> None:
+    try:
+        payload = fetch(city_code)
+        _store(city_code, payload)
+        future.set_result(payload)
+    except BaseException as e:
+        future.set_exception(e)
+    finally:
+        with _lock:
+            _inflight.pop(city_code, None)
+
+
+def _start_fetch(city_code: str, fetch: Callable[[str], dict], background: bool) -> Future:
+    """進行中の取得があればそれを、無ければ新しく取得を開始して Future を返す"""
+    with _lock:
+        future = _inflight.get(city_code)
+        if future is not None:
+            return future
+        future = _inflight[city_code] = Future()
+
+    if background:
+        threading.Thread(
+            target=_run_fetch, args=(city_code, fetch, future),
+            name=f"weather-refresh-{city_code}", daemon=True
+        ).start()
+    else:
+        _run_fetch(city_code, fetch, future)
+    return future
+
+
+def get_forecast_payload(city_code: str, fetch: Callable[[str], dict],
+                         ttl: float | None = None, stale: float | None = None) -> dict:
+    """キャッシュ経由で天気APIのレスポンス（JSON）を返す"""
+    ttl = TTL_SECONDS if ttl is None else ttl
+    stale = STALE_SECONDS if stale is None else stale
+
+    entry = _load(city_code)
+    if entry is not None:
+        fetched_at, payload = entry
+        age = time.time() - fetched_at
+        if age < ttl:
+            return payload
+        if age < ttl + stale:
+            _start_fetch(city_code, fetch, background=True)
+            return payload
+
+    try:
+        return _start_fetch(city_code, fetch, background=False).result()
+    except Exception:
+        # 取得に失敗しても古いデータがあればそれを返す（古さは呼び出し側が publicTime で確認する）
+        if entry is not None:
+            return entry[1]
+        raise
+
+
+def clear(city_code: str | None = None) -> None:
+    """メモリとディスクのキャッシュを消す（city_code 省略時は全件）"""
+    with _lock:
+        if city_code is None:
+            _memory.clear()
+        else:
+            _memory.pop(city_code, None)
+    _init_disk()
+    with connection(DB_FILE) as conn, conn:
+        if city_code is None:
+            conn.execute("DELETE FROM weather_cache")
+        else:
+            conn.execute("DELETE FROM weather_cache WHERE city_code = ?", (city_code,))
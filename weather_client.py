@@ -0,0 +1,164 @@
+from __future__ import annotations
+import os
+import time
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import profiler
+
+# =========================
+# 天気API のクライアント（接続の使い回し・タイムアウト・サーキットブレーカー）
+# =========================
+#   payload = weather_client.fetch_forecast("130010")
+#   weather_client.stats()   # ブレーカーの状態・成功/失敗/遮断の回数
+# - keep-alive のセッションを全セッションで共有し、接続をプールから使い回す
+# - 接続タイムアウトと読み取りタイムアウトを分けて指定する（API が止まってもスクリプトのスレッドを塞がない）
+# - 接続エラー・タイムアウト・5xx が FAILURE_THRESHOLD 回続くとブレーカーを開き、
+#   COOLDOWN_SECONDS の間は API に送らず CircuitOpenError を即座に返す。
+#   weather_cache.get_forecast_payload() はこの例外でも前回取得できた予報を返す。
+# - 待ち時間が過ぎたら1件だけ試しに送り（半開）、成功すれば閉じ、失敗すればもう一度開く。
+
+BASE_URL = os.getenv("WEATHER_API_BASE", "https://weather.tsukumijima.net")
+CONNECT_TIMEOUT = float(os.getenv("WEATHER_CONNECT_TIMEOUT", "3.05"))  # 秒
+READ_TIMEOUT = float(os.getenv("WEATHER_READ_TIMEOUT", "5"))           # 秒
+POOL_SIZE = int(os.getenv("WEATHER_POOL_SIZE", "10"))
+FAILURE_THRESHOLD = int(os.getenv("WEATHER_FAILURE_THRESHOLD", "3"))
+COOLDOWN_SECONDS = float(os.getenv("WEATHER_COOLDOWN", "30"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(requests.RequestException):
+    """ブレーカーが開いているため API に送らなかった"""
+
+
+class CircuitBreaker:
+    """連続失敗で開き、待ち時間のあと1件だけ試すサーキットブレーカー"""
+
+    def __init__(self, threshold: int = FAILURE_THRESHOLD, cooldown: float = COOLDOWN_SECONDS):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.state = CLOSED
+        self.failures = 0        # 連続失敗数
+        self.opened_at = 0.0
+        self.trial_running = False
+        self.counts = {"success": 0, "failure": 0, "rejected": 0, "opened": 0}
+        self.lock = threading.Lock()
+
+    def before_call(self) -> None:
+        """送ってよければ戻り、だめなら CircuitOpenError を投げる"""
+        with self.lock:
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.cooldown:
+                self.state = HALF_OPEN
+            if self.state == CLOSED:
+                return
+            if self.state == HALF_OPEN and not self.trial_running:
+                self.trial_running = True
+                return
+            self.counts["rejected"] += 1
+            retry_in = max(0.0, self.cooldown - (time.monotonic() - self.opened_at))
+        raise CircuitOpenError(f"天気APIへの接続を一時停止しています（約{retry_in:.0f}秒後に再試行）")
+
+    def record_success(self) -> None:
+        with self.lock:
+            self.counts["success"] += 1
+            self.state = CLOSED
+            self.failures = 0
+            self.trial_running = False
+
+    def record_failure(self) -> None:
+        with self.lock:
+            self.counts["failure"] += 1
+            self.failures += 1
+            self.trial_running = False
+            if self.state == HALF_OPEN or self.failures >= self.threshold:
+                if self.state != OPEN:
+                    self.counts["opened"] += 1
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+    def release(self) -> None:
+        """成功とも失敗とも数えない結果（4xx など）で試行枠だけ返す"""
+        with self.lock:
+            self.trial_running = False
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {"state": self.state, "consecutive_failures": self.failures, **self.counts}
+
+
+def _new_session() -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_SIZE)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update({"Accept": "application/json"})
+    return session
+
+
+_session = _new_session()
+_breakers_lock = threading.Lock()
+_breakers: dict = {}  # ベースURL -> CircuitBreaker
+
+
+def get_breaker(base_url: str | None = None) -> CircuitBreaker:
+    base_url = base_url or BASE_URL
+    with _breakers_lock:
+        breaker = _breakers.get(base_url)
+        if breaker is None:
+            breaker = _breakers[base_url] = CircuitBreaker()
+        return breaker
+
+
+def _counts_as_failure(error: requests.RequestException) -> bool:
+    """API 側の不調とみなす失敗か（4xx は都市コードの誤りなどなので数えない）"""
+    response = getattr(error, "response", None)
+    if response is None:
+        return True  # 接続エラー・タイムアウト
+    return response.status_code == 429 or response.status_code >= 500
+
+
+def fetch_forecast(city_code: str, base_url: str | None = None) -> dict:
+    """都市コードの予報 JSON を取得する（ブレーカーが開いていれば CircuitOpenError）"""
+    base_url = base_url or BASE_URL
+    breaker = get_breaker(base_url)
+    breaker.before_call()
+    try:
+        response = _session.get(
+            f"{base_url}/api/forecast/city/{city_code}",
+            timeout=(CONNECT_TIMEOUT, READ_TIMEOUT),
+        )
+        response.raise_for_status()
+        profiler.annotate(bytes=len(response.content))
+        payload = response.json()
+    except requests.RequestException as e:
+        if _counts_as_failure(e):
+            breaker.record_failure()
+        else:
+            breaker.release()
+        raise
+    except ValueError:
+        breaker.record_failure()  # JSON が壊れている
+        raise
+    breaker.record_success()
+    return payload
+
+
+def stats() -> dict:
+    """ベースURLごとのブレーカーの状態と回数"""
+    with _breakers_lock:
+        breakers = dict(_breakers)
+    return {base_url: breaker.snapshot() for base_url, breaker in breakers.items()}
+
+
+def reset() -> None:
+    """ブレーカーと接続プールを作り直す（動作確認・ベンチマーク用）"""
+    global _session
+    with _breakers_lock:
+        _breakers.clear()
+    old, _session = _session, _new_session()
+    old.close()